@@ -4,13 +4,44 @@
 # Copyright 2017 Nelo-T. Wallus <nelo@wallus.de>
 
 
+import asyncio
+import collections
+import collections.abc
+import concurrent.futures
 import ctypes
 import datetime
+import gc
+import hashlib
+import heapq
+import inspect
+import io
+import itertools
+import json
+import mmap
 import multiprocessing
+import multiprocessing.connection
+import multiprocessing.forkserver
+import multiprocessing.reduction
 import os.path
 import pickle
+import random
+import resource
+import select
+import selectors
+import signal
+import stat
+import struct
 import sys
+import tempfile
 import threading
+import time
+import weakref
+import zlib
+
+try:
+    import contextvars
+except ImportError:  # pragma no cover: specific to Python < 3.7
+    contextvars = None
 
 libc = ctypes.CDLL(None)
 try:
@@ -23,10 +54,20 @@ except ValueError:  # pragma no cover: specific to macOS
     stderr = ctypes.c_void_p.in_dll(libc, "__stderrp")
 
 
-def execute(action, cpu_cores=None, keep_going=False, do_raise=True, hooks=None):
+def execute(
+    action, cpu_cores=None, keep_going=False, do_raise=True, hooks=None, worker_pool=None, thread_slots=None,
+    duration_estimates=None, output_flush_interval=0, output_flush_size=65536,
+    output_spill_threshold=None, output_tail_size=None, output_capture=None, check_picklability=True,
+    result_store_threshold=None, result_store_directory=None, fork_server=None, freeze_gc=True,
+    measure_memory=False, result_cache=None, skip_up_to_date=False, up_to_date_hashes=None,
+    journal=None, resume_from=None, agents=None, executor=None, deadline=None,
+):
     """
     Recursively execute an :class:`.Action`'s dependencies then the action.
 
+    If some actions' ``do_execute`` method is a coroutine function, they are executed
+    as described in :func:`.execute_async`, in a new event loop.
+
     :param Action action: the action to execute.
     :param cpu_cores: number of CPU cores to use in parallel.
         Pass ``None`` (the default value) to let ActionTree choose.
@@ -40,16 +81,200 @@ def execute(action, cpu_cores=None, keep_going=False, do_raise=True, hooks=None)
     :param bool do_raise: if ``False``, then exceptions are not re-raised as :exc:`CompoundException`
         but only included in the :class:`.ExecutionReport`.
     :param Hooks hooks: its methods will be called when execution progresses.
-
+        If they are coroutine functions, they are run to completion before execution progresses further.
+    :param WorkerPool worker_pool: if not ``None``, actions are executed in long-lived worker processes
+        instead of in a new process each.
+    :param thread_slots: number of actions to execute in parallel in threads of the current process
+        (see the ``execute_in_thread`` parameter of :class:`.Action`).
+        Pass ``None`` (the default value) to let ActionTree choose.
+        Pass :attr:`UNLIMITED` to execute an unlimited number of such actions in parallel.
+        Note: this parameter sets the availability of :obj:`THREAD_SLOT` for this execution.
+    :type thread_slots: int or None or :attr:`UNLIMITED`
+    :param duration_estimates: the expected durations of actions, in seconds.
+        When several actions are ready to execute, ActionTree starts first the ones with the longest path
+        of expected durations to ``action``.
+        Pass a dictionary whose keys are actions, or the :class:`.ExecutionReport` of a previous execution
+        (actions are then matched by identity or by label).
+        Actions without an estimate are expected to last the average of known estimates.
+        Pass ``None`` (the default value) to expect all actions to last the same time.
+    :type duration_estimates: dict(Action, float) or ExecutionReport or None
+    :param float output_flush_interval: what actions print is buffered during at most this number of seconds
+        before being reported as a single chunk by :meth:`Hooks.action_printed`.
+        The default value, ``0``, reports output as soon as it's read.
+        Larger values trade latency for throughput for actions printing a lot.
+        See also the ``output_flush_interval`` parameter of :class:`.Action`.
+    :param int output_flush_size: the maximum number of bytes buffered before being reported,
+        even before ``output_flush_interval`` expires.
+        See also the ``output_flush_size`` parameter of :class:`.Action`.
+    :param output_spill_threshold: if not ``None``, the output of actions printing more than this number of bytes
+        is stored in a temporary file instead of in memory.
+        See :meth:`.ActionStatus.open_output`.
+    :type output_spill_threshold: int or None
+    :param output_tail_size: if not ``None``, only the last ``output_tail_size`` bytes printed by each action
+        are kept in :attr:`.ActionStatus.output` (nothing with ``0``).
+        (They are all reported to :meth:`.Hooks.action_printed` anyway.)
+        ``output_spill_threshold`` is then ignored: the tail is kept in memory.
+    :type output_tail_size: int or None
+    :param output_capture: what to do with what actions print:
+        :attr:`CAPTURE` (the default value) to capture it,
+        :attr:`INHERIT` to let it go to the standard output and error of the process calling :func:`.execute`,
+        or :attr:`DISCARD` to discard it.
+        Not capturing output avoids some per-action overhead.
+        See also the ``output_capture`` parameter of :class:`.Action`.
+    :param check_picklability: before starting anything, ActionTree checks that all actions are picklable,
+        to fail fast.
+        Each action is checked independently from its dependencies.
+        Pass an integer to check only a random sample of that many actions,
+        or ``False`` to skip this check for very large graphs.
+    :type check_picklability: bool or int
+    :param result_store_threshold: if not ``None``, return values of actions executed in their own process
+        that support the buffer protocol (:class:`bytes`, :class:`bytearray`, NumPy arrays, etc.)
+        and are larger than this number of bytes are written once to a file by that process.
+        The :class:`.ExecutionReport` and the ``dependency_statuses`` of dependents only hold a reference
+        to this file, which is mapped in memory each time :attr:`.ActionStatus.return_value` is accessed.
+        NumPy arrays and :class:`pickle.PickleBuffer` objects are then read-only views of the mapped file;
+        other types are copied from it.
+    :type result_store_threshold: int or None
+    :param result_store_directory: the directory of these files.
+        Pass ``None`` (the default value) to use the default temporary directory.
+        ``/dev/shm`` is a good choice on Linux, if it's large enough.
+    :type result_store_directory: str or None
+    :param ForkServer fork_server: if not ``None``, actions are executed in processes forked from this
+        fork server instead of from the process calling :func:`.execute`.
+        Ignored when ``worker_pool`` is not ``None``.
+    :param bool freeze_gc: if ``True`` (the default value), the objects of the process calling :func:`.execute`
+        are frozen (see :func:`gc.freeze`, Python 3.7+) during the execution,
+        and so are the objects inherited by the processes executing a single action.
+        (They are unfrozen at the end of the execution, unless objects were already frozen before.)
+        This avoids copying memory pages of the parent process (on write) when the garbage collector
+        of a forked process scans objects inherited from the parent process.
+    :param bool measure_memory: if ``True``, the private memory of each process executing an action
+        is measured at the end of the action, and available in :attr:`.ActionStatus.private_memory`.
+    :param ResultCache result_cache: if not ``None``, actions whose fingerprint (see :meth:`.Action.get_fingerprint`)
+        is found in this cache are not executed: their return value and output are taken from the cache,
+        and they are reported to :meth:`.Hooks.action_skipped` with :attr:`CACHED`.
+        Return values and outputs of other successful actions with a fingerprint are stored in the cache.
+    :param bool skip_up_to_date: if ``True``, actions declaring ``output_paths`` (see :class:`.Action`)
+        are not executed when all their outputs exist and are more recent than all their ``input_paths``,
+        like with ``make``.
+        They are reported to :meth:`.Hooks.action_skipped` with :attr:`UP_TO_DATE`.
+        Each path is passed to :func:`os.stat` once, at the beginning of the execution,
+        and again only when it's an output of an action that was executed.
+    :param up_to_date_hashes: if not ``None``, the path of a file where ActionTree records the hashes
+        of the contents of the inputs of each successful action declaring outputs.
+        With ``skip_up_to_date``, an action is then up to date when all its outputs exist
+        and the contents of its inputs didn't change since its last successful execution, whatever their times.
+        Files are hashed again only when their size or modification time changed.
+        Ignored if ``skip_up_to_date`` is ``False``.
+    :type up_to_date_hashes: str or None
+    :param journal: if not ``None``, the path of a file where the return values and outputs of successful
+        and skipped actions are appended as they complete, to resume the execution if the process calling
+        :func:`.execute` dies.
+        They are written in batches by a background thread, at most one second after actions complete.
+        Each record is checksummed: a record truncated when the process died, and the records after it,
+        are ignored, and overwritten by the next execution appending to the same journal.
+        Actions whose return value is not picklable are not recorded.
+    :type journal: str or None
+    :param resume_from: if not ``None``, the path of a journal written by a previous execution.
+        Actions recorded in this journal are not executed again: they are reported
+        to :meth:`.Hooks.action_skipped` with :attr:`RESUMED`, with the return value and output recorded.
+        Actions are identified by their class, their label and the identities of their dependencies,
+        so the same dependency graph must be constructed again.
+        It may be the same file as ``journal``, and it may not exist.
+    :type resume_from: str or None
+    :param agents: if not empty, actions that would be executed in their own process
+        are sent to these worker agents instead (see :ref:`remote_execution`).
+        ``worker_pool`` and ``fork_server`` are then ignored,
+        and ``cpu_cores`` defaults to :attr:`UNLIMITED` because each agent limits its own CPU cores.
+        Agents that can't be reached at the beginning of the execution are ignored.
+    :type agents: list(RemoteAgent) or None
+    :param executor: if not ``None``, the backend executing actions that would be executed in their own process
+        (see :ref:`executors`).
+        ``worker_pool``, ``fork_server`` and ``agents`` are then ignored.
+        ``cpu_cores`` defaults to its :meth:`.Executor.get_capacity`.
+        Pass ``None`` (the default value) to use the executor implied by these parameters,
+        or a :class:`ForkExecutor`.
+    :type executor: Executor or None
+    :param deadline: if not ``None``, the execution is stopped at this time,
+        or after this number of seconds: running actions are killed and fail with a :exc:`TimeoutError`,
+        and actions not started yet are canceled.
+        See also the ``timeout`` parameter of :class:`.Action`.
+    :type deadline: float or datetime.datetime or None
+
+    :raises pickle.PicklingError: when an action is not picklable.
+        Its message contains the action's label.
+    :raises ConnectionError: when ``agents`` is not empty but none of them can be reached.
     :raises CompoundException: when ``do_raise`` is ``True`` and dependencies raise exceptions.
 
     :rtype: ExecutionReport
     """
+    execution = _make_execute(
+        cpu_cores, keep_going, do_raise, hooks, worker_pool, thread_slots,
+        duration_estimates, output_flush_interval, output_flush_size, output_spill_threshold, output_tail_size,
+        output_capture, check_picklability, result_store_threshold, result_store_directory, fork_server,
+        freeze_gc, measure_memory, result_cache, skip_up_to_date, up_to_date_hashes, journal, resume_from, agents,
+        executor, deadline,
+    )
+    # Computed once, for the check and for the execution
+    actions = action.get_possible_execution_order()
+    if any(_is_coroutine_action(a) for a in actions):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(execution.run_async(action, actions))
+        finally:
+            loop.close()
+    else:
+        return execution.run(action, actions)
+
+
+async def execute_async(action, *args, **kwds):
+    """
+    Coroutine version of :func:`.execute`, taking the same parameters.
+    It doesn't block the event loop while actions execute.
+
+    Actions whose ``do_execute`` method is a coroutine function are executed concurrently on the event loop.
+    They don't require any :obj:`CPU_CORE` by default.
+    Like actions created with ``execute_in_thread=True``, they must not modify process-wide data.
+
+    :class:`Hooks` methods can also be coroutine functions, and are awaited in order.
+
+    :rtype: ExecutionReport
+    """
+    return await _make_execute(*args, **kwds).run_async(action)
+
+
+def _make_execute(
+    cpu_cores=None, keep_going=False, do_raise=True, hooks=None, worker_pool=None, thread_slots=None,
+    duration_estimates=None, output_flush_interval=0, output_flush_size=65536,
+    output_spill_threshold=None, output_tail_size=None, output_capture=None, check_picklability=True,
+    result_store_threshold=None, result_store_directory=None, fork_server=None, freeze_gc=True,
+    measure_memory=False, result_cache=None, skip_up_to_date=False, up_to_date_hashes=None,
+    journal=None, resume_from=None, agents=None, executor=None, deadline=None,
+):
+    if executor is None:
+        if agents:
+            executor = _RemoteExecutor(agents)
+        elif worker_pool is not None:
+            executor = worker_pool
+        elif fork_server is not None:
+            executor = fork_server
+        else:
+            executor = ForkExecutor()
     if cpu_cores is None:
-        cpu_cores = multiprocessing.cpu_count()
+        cpu_cores = executor.get_capacity()
+    if thread_slots is None:
+        # Same default as concurrent.futures.ThreadPoolExecutor in Python 3.5 to 3.7
+        thread_slots = 5 * multiprocessing.cpu_count()
     if hooks is None:
         hooks = Hooks()
-    return _Execute(cpu_cores, keep_going, do_raise, hooks).run(action)
+    if output_capture is None:
+        output_capture = CAPTURE
+    return _Execute(
+        cpu_cores, keep_going, do_raise, hooks, thread_slots, duration_estimates,
+        output_flush_interval, output_flush_size, output_spill_threshold, output_tail_size, output_capture,
+        check_picklability, result_store_threshold, result_store_directory, freeze_gc, measure_memory,
+        result_cache, skip_up_to_date, up_to_date_hashes, journal, resume_from, executor, deadline,
+    )
 
 
 UNLIMITED = object()
@@ -64,15 +289,36 @@ class Action(object):
 
     This is a base class for your custom actions.
     You must define a ``do_execute(self, dependency_statuses)`` method that performs the action.
-    The ``dependency_statuses`` argument is a dictionary whose keys are ``self.dependencies`` and values are their
-    :class:`.ActionStatus`.
+    The ``dependency_statuses`` argument is a read-only mapping whose keys are ``self.dependencies``
+    (and the actions added by the :class:`.Expansion` returned by any of them)
+    and values are their :class:`.ActionStatus`.
+    ``do_execute`` can return an :class:`.Expansion` to add actions to the execution.
+    It can also be a generator function, whose yielded chunks are streamed to the dependents that added
+    this action with ``stream=True``, and whose return value is the action's return value
+    (see :ref:`streaming`).
+    Dependencies added with ``stream=True`` are not keys of ``dependency_statuses``:
+    ``dependency_statuses.stream(dependency)`` returns an iterator over their chunks.
+    When executing in a :class:`.WorkerPool`, return values, exceptions and outputs of dependencies
+    are transferred from the process calling :func:`.execute` only when they are accessed.
     :ref:`outputs` describes how its return values, the exceptions it may raise and what it may print is handled.
 
     Actions, return values and exceptions raised must be picklable.
     """
 
-    def __init__(self, label, dependencies=[], resources_required={}, accept_failed_dependencies=False):
-        # @todo Add a parameter saying that the action can safely be executed in the parent process
+    execute_inline = False
+    """
+    Set this class attribute to ``True`` in subclasses whose ``do_execute`` is trivial and very fast
+    (grouping dependencies, creating a directory, etc.)
+    Such actions are executed directly by :func:`.execute`, without creating a process or a thread,
+    and don't require any :obj:`CPU_CORE` by default.
+    Like actions created with ``execute_in_thread=True``, they must not modify process-wide data.
+    """
+
+    def __init__(
+        self, label, dependencies=[], resources_required={}, accept_failed_dependencies=False,
+        execute_in_thread=False, output_flush_interval=None, output_flush_size=None, output_capture=None,
+        input_paths=[], output_paths=[], timeout=None,
+    ):
         """
         :param label: A string used to represent the action in :class:`GanttChart` and
             :class:`DependencyGraph`. Can be retrieved by :attr:`label`.
@@ -84,12 +330,46 @@ class Action(object):
         :type resources_required: dict(Resource, int)
         :param bool accept_failed_dependencies:
             if ``True``, then the action will execute even after some of its dependencies failed.
+        :param bool execute_in_thread:
+            if ``True``, then the action will execute in a thread of the process calling :func:`.execute`
+            instead of in its own process.
+            Such actions require one :obj:`THREAD_SLOT` instead of one :obj:`CPU_CORE` by default.
+            This is useful for actions that mostly wait for I/O or for subprocesses.
+        :param output_flush_interval:
+            if not ``None``, overrides the ``output_flush_interval`` parameter of :func:`.execute` for this action.
+        :type output_flush_interval: float or None
+        :param output_flush_size:
+            if not ``None``, overrides the ``output_flush_size`` parameter of :func:`.execute` for this action.
+        :type output_flush_size: int or None
+        :param output_capture:
+            if not ``None``, overrides the ``output_capture`` parameter of :func:`.execute` for this action.
+        :param list(str) input_paths: the files read by the action.
+        :param list(str) output_paths: the files written by the action.
+            See the ``skip_up_to_date`` parameter of :func:`.execute`.
+            Files written by an action and read by its dependents must be declared on both sides.
+        :param timeout: if not ``None``, the action is killed, with the subprocesses it started,
+            when it executes for more than this number of seconds, and it fails with a :exc:`TimeoutError`.
+            Its dependents are then handled like after any failure. See :ref:`timeouts`.
+        :type timeout: float or None
         """
         self.__label = label
         self.__dependencies = list(dependencies)
-        self.__resources_required = {CPU_CORE: 1}
+        self.__stream_dependencies = []
+        if execute_in_thread:
+            self.__resources_required = {THREAD_SLOT: 1}
+        elif self.execute_inline or _is_coroutine_action(self):
+            self.__resources_required = {}
+        else:
+            self.__resources_required = {CPU_CORE: 1}
         self.__resources_required.update(resources_required)
         self.__accept_failed_dependencies = accept_failed_dependencies
+        self.__execute_in_thread = execute_in_thread
+        self.__output_flush_interval = output_flush_interval
+        self.__output_flush_size = output_flush_size
+        self.__output_capture = output_capture
+        self.__input_paths = list(input_paths)
+        self.__output_paths = list(output_paths)
+        self.__timeout = timeout
 
     @property
     def label(self):
@@ -98,18 +378,22 @@ class Action(object):
         """
         return self.__label
 
-    def add_dependency(self, dependency):
+    def add_dependency(self, dependency, stream=False):
         """
         Add a dependency to be executed before this action.
         Order of insertion of dependencies is not important.
 
         :param Action dependency:
+        :param bool stream: if ``True``, this action is started as soon as ``dependency`` is started,
+            and iterates over the chunks it yields while it executes (see :ref:`streaming`).
 
         :raises DependencyCycleException: when adding the new dependency would create a cycle.
         """
         if self in dependency.get_possible_execution_order():
             raise DependencyCycleException()
         self.__dependencies.append(dependency)
+        if stream:
+            self.__stream_dependencies.append(dependency)
 
     @property
     def dependencies(self):
@@ -118,6 +402,13 @@ class Action(object):
         """
         return list(self.__dependencies)
 
+    @property
+    def stream_dependencies(self):
+        """
+        The list of this action's direct dependencies added with ``stream=True``.
+        """
+        return list(self.__stream_dependencies)
+
     def require_resource(self, resource, quantity=1):
         """
         Set the quantity of a certain :class:`.Resource` required to run this action.
@@ -148,6 +439,93 @@ class Action(object):
         """
         return self.__accept_failed_dependencies
 
+    @property
+    def execute_in_thread(self):
+        """
+        ``True`` if the action will execute in a thread of the process calling :func:`.execute`.
+
+        Such actions share the process-wide state of the calling process,
+        so they must not change the current working directory or the environment variables.
+        Only what they write to :data:`sys.stdout` and :data:`sys.stderr` is captured:
+        what is written directly to the file descriptors (by a subprocess for example) is not.
+
+        :rtype: bool
+        """
+        return self.__execute_in_thread
+
+    @property
+    def output_flush_interval(self):
+        """
+        The ``output_flush_interval`` passed to the constructor.
+
+        :rtype: float or None
+        """
+        return self.__output_flush_interval
+
+    @property
+    def output_flush_size(self):
+        """
+        The ``output_flush_size`` passed to the constructor.
+
+        :rtype: int or None
+        """
+        return self.__output_flush_size
+
+    @property
+    def output_capture(self):
+        """
+        The ``output_capture`` passed to the constructor.
+
+        :rtype: :attr:`CAPTURE` or :attr:`INHERIT` or :attr:`DISCARD` or None
+        """
+        return self.__output_capture
+
+    @property
+    def input_paths(self):
+        """
+        The list of files read by this action.
+
+        :rtype: list(str)
+        """
+        return list(self.__input_paths)
+
+    @property
+    def output_paths(self):
+        """
+        The list of files written by this action.
+
+        :rtype: list(str)
+        """
+        return list(self.__output_paths)
+
+    @property
+    def timeout(self):
+        """
+        The maximum duration of this action's execution, in seconds.
+
+        :rtype: float or None
+        """
+        return self.__timeout
+
+    def get_fingerprint(self, dependency_fingerprints):
+        """
+        Override this method in subclasses whose results can be reused from a previous execution
+        (see the ``result_cache`` parameter of :func:`.execute`).
+        It must return a string or bytes that changes whenever what ``do_execute`` would return or print changes,
+        typically built from the action's parameters and ``dependency_fingerprints``.
+        It's called by the process calling :func:`.execute`, before executing anything.
+
+        Results are cached per class of action and fingerprint.
+
+        :param dependency_fingerprints: a mapping whose keys are ``self.dependencies``
+            and values are digests of their fingerprints, or ``None`` for dependencies without fingerprint.
+        :type dependency_fingerprints: dict(Action, str or None)
+
+        :returns: ``None`` (the default implementation) if the action must always be executed.
+        :rtype: str or bytes or None
+        """
+        return None
+
     def get_possible_execution_order(self, seen_actions=None):
         """
         Return the list of all this action's dependencies (recursively),
@@ -159,10 +537,19 @@ class Action(object):
             seen_actions = set()
         actions = []
         if self not in seen_actions:
+            # Iterative depth-first traversal: long chains of dependencies would exceed the recursion limit
             seen_actions.add(self)
-            for dependency in self.__dependencies:
-                actions += dependency.get_possible_execution_order(seen_actions)
-            actions.append(self)
+            stack = [(self, iter(self.__dependencies))]
+            while stack:
+                (action, dependencies) = stack[-1]
+                for dependency in dependencies:
+                    if dependency not in seen_actions:
+                        seen_actions.add(dependency)
+                        stack.append((dependency, iter(dependency.__dependencies)))
+                        break
+                else:
+                    stack.pop()
+                    actions.append(action)
         return actions
 
 
@@ -189,13 +576,13 @@ class Resource(object):
         """
         self.__availability = availability
 
-    def _availability(self, cpu_cores):
+    def _availability(self, execution):
         return self.__availability
 
 
 class _CpuCoreResource(Resource):
-    def _availability(self, cpu_cores):
-        return cpu_cores
+    def _availability(self, execution):
+        return execution.cpu_cores
 
 
 CPU_CORE = _CpuCoreResource(0)
@@ -207,6 +594,722 @@ You can pass it to :meth:`.Action.require_resource` if your action will execute
 """
 
 
+class _ThreadSlotResource(Resource):
+    def _availability(self, execution):
+        return execution.thread_slots
+
+
+THREAD_SLOT = _ThreadSlotResource(0)
+"""
+A special :class:`.Resource` representing a thread of the process calling :func:`.execute`.
+Actions created with ``execute_in_thread=True`` require one by default.
+
+:type: Resource
+"""
+
+
+class Executor(object):
+    """
+    Base class for the backends executing, for :func:`.execute`, the actions that run in their own process
+    (all actions except coroutine actions, the ones created with ``execute_in_thread=True``
+    and the ones whose class sets :attr:`.Action.execute_inline`, which are executed in the process
+    calling :func:`.execute`).
+
+    :func:`.execute` decides when to start actions, according to their dependencies and resources;
+    the executor decides where and how they are executed.
+    It's notified of each action's end by :meth:`finish_action`.
+    Events produced by actions (what they print, their end) are sent to :func:`.execute`
+    through the senders returned by :meth:`.ExecutorContext.make_events_sender`.
+
+    An executor can be passed to several successive executions, but is used by one execution at a time.
+    See :ref:`executors`.
+    """
+
+    def open(self, context):
+        """
+        Called at the beginning of each execution, before any action is started.
+
+        :param ExecutorContext context: the execution's services. Keep it until :meth:`close`.
+        """
+        pass
+
+    def close(self):
+        """
+        Called at the end of each execution, including when it fails.
+        Release everything acquired since :meth:`open`.
+        """
+        pass
+
+    def get_capacity(self):
+        """
+        Return the number of actions this executor can execute in parallel,
+        used as the default availability of :obj:`CPU_CORE` (see the ``cpu_cores`` parameter of :func:`.execute`).
+        The default implementation returns the number of CPU cores of this machine.
+
+        :rtype: int or :attr:`UNLIMITED`
+        """
+        return multiprocessing.cpu_count()
+
+    def can_start_action(self, action):
+        """
+        Called before starting ``action``, once its dependencies are done and its resources are available.
+        Return ``False`` to postpone it, for example when all machines are busy.
+        Postponed actions wait until :meth:`.ExecutorContext.wake_up` is called.
+        The default implementation returns ``True``.
+
+        :param Action action: the action.
+        :rtype: bool
+        """
+        return True
+
+    def start_action(self, action):
+        """
+        Start executing ``action``, without waiting for it to finish.
+        Typically, create a sender with :meth:`.ExecutorContext.make_events_sender`,
+        and call :meth:`.ExecutorContext.execute_action` with it in a forked process,
+        or run a task created by :meth:`.ExecutorContext.make_task` in another process.
+
+        :param Action action: the action.
+        """
+        raise NotImplementedError()
+
+    def finish_action(self, action):
+        """
+        Called when :func:`.execute` has handled the end of ``action``.
+        Release what was acquired to execute it.
+        The default implementation does nothing.
+
+        :param Action action: the action.
+        """
+        pass
+
+    def cancel_action(self, action):
+        """
+        Called when ``action`` is still executing but :func:`.execute` doesn't need it anymore,
+        for example because the execution is interrupted by an exception or because the action timed out.
+        Stop it if possible, promptly.
+        Events it sends afterwards are ignored. :meth:`finish_action` is not called for this action.
+        The default implementation does nothing.
+
+        :param Action action: the action.
+        """
+        pass
+
+
+class ExecutorContext(object):
+    """
+    The services an execution provides to its :class:`Executor`. Passed to :meth:`.Executor.open`.
+    """
+
+    def __init__(self, execution):
+        self._execution = execution
+
+    def make_events_sender(self):
+        """
+        Create a channel through which a child process sends the events of an action to :func:`.execute`.
+        The returned sender is picklable.
+        Close it in the current process once the child process is started.
+        """
+        return self._execution.events.make_pipe()
+
+    def execute_action(self, action, events):
+        """
+        Execute ``action`` in the current process, and send its events through ``events``.
+        The current process must have been forked from the process calling :func:`.execute`
+        after :meth:`.Executor.open`: statuses of dependencies are read from its copy of the execution.
+        This process is expected to exit after the action.
+
+        :param Action action: the action.
+        :param events: a sender returned by :meth:`make_events_sender`.
+        """
+        execution = self._execution
+        execution._close_other_streams(action)
+        (stream_senders, stream_readers) = execution._make_streams(action)
+        dependency_statuses = _DependencyStatuses(
+            execution.dependencies[action], execution.report.get_action_status, stream_readers=stream_readers,
+        )
+        execution._run_action(action, id(action), dependency_statuses, events, stream_senders)
+
+    def make_task(self, action, remote=False):
+        """
+        Create a picklable task executing ``action``, to send to another process.
+        Call its ``run(events)`` method in that process to execute the action
+        and send its events through ``events``.
+        The task contains the action, its direct dependencies and their statuses.
+        It also contains the ends of the action's streams (see :ref:`streaming`), which are closed
+        in the current process after :meth:`.Executor.start_action`: pickle the task before that.
+
+        :param Action action: the action.
+        :param bool remote: pass ``True`` if the task will run on another machine:
+            return values are then not stored in files (see the ``result_store_threshold`` parameter
+            of :func:`.execute`).
+        """
+        execution = self._execution
+        dependencies = execution.dependencies[action]
+        return _Task(
+            execution, id(action), remote,
+            # Pickled here without recursing through all dependencies
+            _ShallowPickler().dumps((action, dependencies), [action] + dependencies),
+            [id(d) for d in dependencies],
+            [execution.report.get_action_status(d)._get_times() for d in dependencies],
+            [execution._get_transferred_values(d) for d in dependencies],
+            execution._make_streams(action),
+        )
+
+    def fail_action(self, action, exception):
+        """
+        Report that ``action`` failed with ``exception`` without being executed.
+        Call it after :meth:`.Executor.start_action`.
+
+        :param Action action: the action.
+        :param BaseException exception: the exception.
+        """
+        self._execution.events.put_local((FAILED, id(action), (datetime.datetime.now(), exception)))
+
+    def restart_action(self, action):
+        """
+        Report that the execution of ``action`` was lost, for example because the machine executing it crashed.
+        Its output is discarded, :meth:`.Executor.finish_action` is called, and it's started again.
+
+        :param Action action: the action.
+        """
+        self._execution.events.put_local((LOST, id(action), ()))
+
+    def wake_up(self, count=1):
+        """
+        Give actions postponed by :meth:`.Executor.can_start_action` another chance to start.
+
+        :param int count: the maximum number of actions to wake up, in order of priority.
+        """
+        self._execution._wake_postponed_actions(count)
+
+
+class ForkExecutor(Executor):
+    """
+    The default :class:`Executor`: each action is executed in a brand new process,
+    forked from the process calling :func:`.execute`.
+    Nothing is pickled to start an action: dependency statuses are read from the forked copy of the execution.
+    Each process leads its own process group, killed as a whole when the action is canceled.
+    """
+
+    def open(self, context):
+        self.__context = context
+        self.__processes = {}
+
+    def close(self):
+        self.__context = None
+        self.__processes = None
+
+    def start_action(self, action):
+        events = self.__context.make_events_sender()
+        process = multiprocessing.Process(
+            target=self._run,
+            kwargs=dict(action=action, events=events),
+        )
+        process.start()
+        _lead_process_group(process.pid)
+        events.close()
+        self.__processes[action] = process
+
+    def finish_action(self, action):
+        del self.__processes[action]
+
+    def cancel_action(self, action):
+        _kill_process_group(self.__processes.pop(action))
+
+    def _run(self, action, events):
+        _lead_process_group(0)
+        self.__context.execute_action(action, events)
+
+
+class WorkerPool(Executor):
+    """
+    An :class:`Executor` sending actions to long-lived worker processes.
+
+    By default, each action is executed in its own, brand new, process (see :class:`ForkExecutor`).
+    For graphs of many short actions, the cost of creating those processes can become significant.
+    When you pass a :class:`WorkerPool` to :func:`.execute`, actions are instead sent to worker processes
+    that execute them one after the other.
+    Workers are started when needed, so there are never more workers than actions executed in parallel.
+
+    Workers restore the working directory and the environment variables after each action,
+    but other process-wide state (imported modules, global variables, etc.) is kept from one action to the next.
+    A worker executing a canceled action is killed, with its process group, and replaced.
+    """
+
+    def __init__(self, max_actions_per_worker=None, max_worker_rss=None):
+        """
+        :param max_actions_per_worker: a worker is replaced by a new one after executing that many actions.
+        :type max_actions_per_worker: int or None
+        :param max_worker_rss: a worker is replaced by a new one
+            when its resident set size exceeds that many bytes after executing an action.
+        :type max_worker_rss: int or None
+        """
+        self.__max_actions_per_worker = max_actions_per_worker
+        self.__max_worker_rss = max_worker_rss
+
+    @property
+    def max_actions_per_worker(self):
+        """
+        The number of actions executed by a worker before it's replaced.
+
+        :rtype: int or None
+        """
+        return self.__max_actions_per_worker
+
+    @property
+    def max_worker_rss(self):
+        """
+        The resident set size, in bytes, above which a worker is replaced.
+
+        :rtype: int or None
+        """
+        return self.__max_worker_rss
+
+    def open(self, context):
+        self.__context = context
+        self.__idle_workers = []
+        self.__busy_workers = {}
+
+    def close(self):
+        for worker in self.__idle_workers + list(self.__busy_workers.values()):
+            worker.stop()
+        self.__context = None
+        self.__idle_workers = None
+        self.__busy_workers = None
+
+    def start_action(self, action):
+        execution = self.__context._execution
+        if self.__idle_workers:
+            worker = self.__idle_workers.pop()
+        else:
+            worker = _Worker(self.__context, self._run_worker)
+        dependencies = execution.dependencies[action]
+        if max(execution.action_generations[a] for a in [action] + dependencies) > worker.generation:
+            # Some of these actions were added by an Expansion after the worker was forked
+            action_data = _ShallowPickler().dumps((action, dependencies), [action] + dependencies)
+        else:
+            # The worker knows these actions by their ids
+            action_data = None
+        worker.send((
+            id(action),
+            {id(d): execution.report.get_action_status(d)._get_times() for d in dependencies},
+            action_data,
+            execution._make_streams(action),
+        ))
+        self.__busy_workers[action] = worker
+
+    def finish_action(self, action):
+        worker = self.__busy_workers.pop(action)
+        if worker.retiring.value:
+            worker.tasks_w.close()
+        else:
+            self.__idle_workers.append(worker)
+
+    def cancel_action(self, action):
+        worker = self.__busy_workers.pop(action)
+        _kill_process_group(worker.process)
+        worker.tasks_w.close()
+
+    def _answer_fetch(self, action, value):
+        self.__busy_workers[action].send(value)
+
+    def _run_worker(self, worker):
+        execution = self.__context._execution
+        _lead_process_group(0)
+        worker.tasks_w.close()
+        # Streams of actions executed by this worker are received with them
+        execution._close_other_streams(None)
+        # _execute_action closes file descriptors 1 and 2, so we restore them after each action
+        saved_stdout = os.dup(1)
+        saved_stderr = os.dup(2)
+        cwd = os.getcwd()
+        environ = dict(os.environ)
+        actions_executed = 0
+        while True:
+            try:
+                task = worker.tasks_r.recv()
+            except EOFError:  # pragma no cover: happens only if the parent process dies
+                break
+            if task is None:
+                break
+            (action_id, dependency_times, action_data, (stream_senders, stream_readers)) = task
+            dependency_ids = list(dependency_times.keys())
+            if action_data is None:
+                action = execution.actions_by_id[action_id]
+                dependencies = [execution.actions_by_id[d] for d in dependency_ids]
+            else:
+                (action, dependencies) = _ShallowUnpickler(io.BytesIO(action_data)).load()
+            event = execution._execute_action(
+                action, action_id,
+                execution._make_fetched_dependency_statuses(
+                    action_id, dependencies, dependency_ids,
+                    [dependency_times[d] for d in dependency_ids], worker.events, worker.tasks_r, stream_readers,
+                ),
+                worker.events,
+                stream_senders,
+            )
+            os.dup2(saved_stdout, 1)
+            os.dup2(saved_stderr, 2)
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+            actions_executed += 1
+            if (
+                self.__max_actions_per_worker is not None and
+                actions_executed >= self.__max_actions_per_worker
+            ) or (
+                self.__max_worker_rss is not None and
+                _get_rss() > self.__max_worker_rss
+            ):
+                # Must be set before the event is sent, to be seen by the parent process when it handles the event
+                worker.retiring.value = True
+            execution._send_end_event(worker.events, event)
+            if worker.retiring.value:
+                break
+
+
+class ForkServer(Executor):
+    """
+    An :class:`Executor` using a "fork server" (a.k.a. "zygote"), a small process from which :func:`.execute` forks
+    the processes executing actions, instead of forking the process calling :func:`.execute`.
+
+    Forking a process using a lot of memory is slow (its page tables are copied)
+    and causes copy-on-write page faults.
+    The fork server is a fresh Python interpreter that only imports the modules in ``preload``,
+    so forking it is fast, and forked processes don't need to import these modules again.
+    Actions are sent to the forked processes by pickling them,
+    with their direct dependencies but without the dependencies of their dependencies.
+
+    The fork server is started by :meth:`start` or, at the latest, when the first action is executed.
+    It's shared by all :class:`ForkServer` objects: the ``preload`` list of the first one to start it wins.
+    It's not available on Windows.
+    """
+
+    def __init__(self, preload=[]):
+        """
+        :param list(str) preload: names of modules to import in the fork server.
+        """
+        self.__preload = list(preload)
+
+    @property
+    def preload(self):
+        """
+        The names of modules imported in the fork server.
+
+        :rtype: list(str)
+        """
+        return list(self.__preload)
+
+    def start(self):
+        """
+        Start the fork server now. Call it early, before the calling process uses much memory.
+        """
+        # ActionTree itself is always preloaded, because forked processes need it
+        multiprocessing.get_context("forkserver").set_forkserver_preload(["ActionTree"] + self.__preload)
+        multiprocessing.forkserver.ensure_running()
+
+    def open(self, context):
+        self.__context = context
+        self.__processes = {}
+        self.__answers = {}
+
+    def close(self):
+        self.__context = None
+        self.__processes = None
+        self.__answers = None
+
+    def start_action(self, action):
+        self.start()
+        multiprocessing_context = multiprocessing.get_context("forkserver")
+        execution = self.__context._execution
+        dependencies = execution.dependencies[action]
+        events = self.__context.make_events_sender()
+        (answers_r, answers_w) = multiprocessing_context.Pipe(duplex=False)
+        (stream_senders, stream_readers) = execution._make_streams(action)
+        process = multiprocessing_context.Process(
+            target=execution._run_action_in_fork_server,
+            kwargs=dict(
+                # Pickled here without recursing through all dependencies
+                action_data=_ShallowPickler().dumps((action, dependencies), [action] + dependencies),
+                action_id=id(action),
+                dependency_ids=[id(d) for d in dependencies],
+                dependency_times=[execution.report.get_action_status(d)._get_times() for d in dependencies],
+                events=events,
+                answers=answers_r,
+                stream_senders=stream_senders,
+                stream_readers=stream_readers,
+            ),
+        )
+        process.start()
+        events.close()
+        answers_r.close()
+        self.__processes[action] = process
+        self.__answers[action] = answers_w
+
+    def finish_action(self, action):
+        del self.__processes[action]
+        self.__answers.pop(action).close()
+
+    def cancel_action(self, action):
+        _kill_process_group(self.__processes.pop(action))
+        self.__answers.pop(action).close()
+
+    def _answer_fetch(self, action, value):
+        self.__answers[action].send(value)
+
+
+class RemoteAgent(object):
+    """
+    Describes a worker agent, started on another machine with ``python -m ActionTree.worker``,
+    to which :func:`.execute` sends actions (see :ref:`remote_execution`).
+    """
+
+    def __init__(self, address, authkey, resources={}):
+        """
+        :param tuple(str, int) address: the host and port the agent listens on.
+        :param bytes authkey: the secret key the agent was started with.
+        :param resources: the availability of :class:`.Resource` on this agent's machine.
+            Actions requiring such resources are only sent to agents providing them,
+            and are executed in parallel on an agent only within its availability.
+            The agent's :obj:`CPU_CORE` availability is the number of CPU cores it was started with.
+        :type resources: dict(Resource, int)
+        """
+        self.__address = address
+        self.__authkey = authkey
+        self.__resources = dict(resources)
+
+    @property
+    def address(self):
+        """
+        The ``address`` passed to the constructor.
+
+        :rtype: tuple(str, int)
+        """
+        return self.__address
+
+    @property
+    def authkey(self):
+        """
+        The ``authkey`` passed to the constructor.
+
+        :rtype: bytes
+        """
+        return self.__authkey
+
+    @property
+    def resources(self):
+        """
+        The ``resources`` passed to the constructor.
+
+        :rtype: dict(Resource, int)
+        """
+        return dict(self.__resources)
+
+
+class _RemoteExecutor(Executor):
+    # Sends actions to worker agents, each limiting its own CPU cores and resources
+    def __init__(self, agents):
+        self.__agents = list(agents)
+
+    def open(self, context):
+        self.__context = context
+        self.__connections = []
+        for agent in self.__agents:
+            try:
+                self.__connections.append(_AgentConnection(agent))
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                pass
+        if not self.__connections:
+            raise ConnectionError("None of the worker agents could be reached")
+        for connection in self.__connections:
+            connection.register(context._execution.events)
+        self.__node_resources = set()
+        for agent in self.__agents:
+            self.__node_resources.update(agent.resources.keys())
+        self.__action_agents = {}
+
+    def close(self):
+        # Connections are closed with the execution's events
+        self.__context = None
+        self.__connections = None
+        self.__action_agents = None
+
+    def get_capacity(self):
+        return UNLIMITED
+
+    def can_start_action(self, action):
+        # Return False if the action must wait for an agent to be less busy
+        resources_required = dict(action.resources_required)
+        connections = [connection for connection in self.__connections if not connection.lost]
+        if not connections or self.__context._execution._has_streams(action) or any(
+            resource in self.__node_resources and
+            not any(resource in connection.availabilities for connection in connections)
+            for resource in resources_required
+        ):
+            # The action will fail
+            self.__action_agents[action] = None
+            return True
+        connections = [
+            connection for connection in connections
+            if connection.fits(resources_required, self.__node_resources)
+        ]
+        if connections:
+            self.__action_agents[action] = min(connections, key=lambda connection: connection.load())
+            return True
+        else:
+            return False
+
+    def start_action(self, action):
+        connection = self.__action_agents[action]
+        if self.__context._execution._has_streams(action):
+            # Pipes don't cross machines
+            self.__context.fail_action(action, ValueError("Worker agents can't execute actions with streams"))
+        elif connection is None:
+            self.__context.fail_action(action, ConnectionError("No worker agent can execute this action"))
+        else:
+            connection.start(id(action), dict(action.resources_required), self.__context.make_task(action, remote=True))
+
+    def finish_action(self, action):
+        connection = self.__action_agents.pop(action)
+        if connection is not None:
+            connection.release(id(action), dict(action.resources_required))
+            self.__wake_up()
+
+    def cancel_action(self, action):
+        connection = self.__action_agents.pop(action)
+        # Actions without agent fail as soon as they start: they are canceled only if the execution stops meanwhile
+        if connection is not None:  # pragma no branch
+            connection.cancel(id(action), dict(action.resources_required))
+            self.__wake_up()
+
+    def __wake_up(self):
+        # Wake up at least one action, and as many as there are free CPU cores
+        free_cpu_cores = sum(
+            max(0, connection.availabilities[CPU_CORE] - connection.used.get(CPU_CORE, 0))
+            for connection in self.__connections
+            if not connection.lost
+        )
+        self.__context.wake_up(max(1, free_cpu_cores))
+
+
+class ResultCache(object):
+    """
+    A cache of the return values and outputs of successful actions, stored in a directory
+    and shared by successive executions.
+    Pass it as the ``result_cache`` parameter of :func:`.execute`.
+
+    Each result is stored in its own file, named after the digest of the action's fingerprint
+    (see :meth:`.Action.get_fingerprint`).
+    When the total size of these files exceeds ``max_size``, the least recently used results are removed.
+    """
+
+    __SUFFIX = ".result"
+
+    def __init__(self, directory, max_size=None):
+        """
+        :param str directory: the directory of the cache. It's created if it doesn't exist.
+        :param max_size: the maximum total size of the cache, in bytes.
+            Pass ``None`` (the default value) for an unlimited size.
+        :type max_size: int or None
+        """
+        self.__directory = directory
+        self.__max_size = max_size
+        # Sizes of cached results, least recently used first
+        self.__sizes = collections.OrderedDict()
+        self.__size = 0
+
+    @property
+    def directory(self):
+        """
+        The ``directory`` passed to the constructor.
+
+        :rtype: str
+        """
+        return self.__directory
+
+    @property
+    def max_size(self):
+        """
+        The ``max_size`` passed to the constructor.
+
+        :rtype: int or None
+        """
+        return self.__max_size
+
+    def _open(self):
+        # Called at the beginning of each execution: other processes may have changed the cache since the last one
+        os.makedirs(self.__directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.__directory):
+            if entry.name.endswith(self.__SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # pragma no cover: removed by another process
+                    continue
+                entries.append((stat.st_mtime, entry.name[:-len(self.__SUFFIX)], stat.st_size))
+        entries.sort()
+        self.__sizes = collections.OrderedDict((key, size) for (mtime, key, size) in entries)
+        self.__size = sum(self.__sizes.values())
+
+    def _get(self, key):
+        # Return (return_value, output), or None if this key is not in the cache
+        path = self.__path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            (return_value, output) = pickle.loads(data)
+            self.__touch(path)
+        except Exception:
+            # Not cached, or truncated or incompatible file (that will be replaced)
+            return None
+        self.__size += len(data) - self.__sizes.pop(key, 0)
+        self.__sizes[key] = len(data)
+        return (return_value, output)
+
+    def _put(self, key, return_value, output):
+        try:
+            data = pickle.dumps((return_value, output), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # e.g. memory views of stored return values
+            return
+        # Written to a temporary file then renamed, so that other processes never read a partial file
+        try:
+            (fd, temp_path) = tempfile.mkstemp(prefix="ActionTree-cache-", dir=self.__directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self.__path(key))
+            self.__touch(self.__path(key))
+        except OSError:
+            # e.g. the disk is full: the result is not cached
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:  # pragma no cover: removed by another process
+                pass
+            return
+        self.__size += len(data) - self.__sizes.pop(key, 0)
+        self.__sizes[key] = len(data)
+        if self.__max_size is not None:
+            while self.__size > self.__max_size:
+                (evicted_key, size) = self.__sizes.popitem(last=False)
+                self.__size -= size
+                try:
+                    os.remove(self.__path(evicted_key))
+                except FileNotFoundError:  # pragma no cover: removed by another process
+                    pass
+
+    def __path(self, key):
+        return os.path.join(self.__directory, key + self.__SUFFIX)
+
+    def __touch(self, path):
+        # Modification times set by the kernel are too coarse to order results accessed in quick succession
+        now = time.time()
+        os.utime(path, (now, now))
+
+
 class Hooks(object):
     """
     Base class to derive from when defining your hooks.
@@ -271,6 +1374,17 @@ class Hooks(object):
         :param exception: the exception raised by the action
         """
 
+    def action_skipped(self, time, action, reason, return_value):
+        """
+        Called instead of :meth:`action_started` and :meth:`action_successful`
+        when an action is ready but doesn't need to be executed.
+
+        :param datetime.datetime time: the time at which the action was skipped.
+        :param Action action: the action.
+        :param reason: why the action was skipped, e.g. :attr:`CACHED`.
+        :param return_value: the value the action would have returned.
+        """
+
 
 class DependencyCycleException(Exception):
     """
@@ -281,6 +1395,50 @@ class DependencyCycleException(Exception):
         super(DependencyCycleException, self).__init__("Dependency cycle")
 
 
+class StreamException(Exception):
+    """
+    Exception raised when a stream between actions (see :ref:`streaming`) is interrupted:
+    when iterating over the stream of a dependency that failed before its end or was not started,
+    and as the failure of streaming actions whose execution was lost.
+    """
+
+
+class Expansion(object):
+    """
+    Returned by :meth:`.Action.do_execute` to add actions to the running execution,
+    for example when an action discovers the work to be done (see :ref:`expansions`).
+
+    The added actions, and their dependencies that are not already in the execution, are executed like the others.
+    Actions depending on the returning action then also depend on the added actions.
+    Added actions can depend on the returning action, to use its return value.
+    """
+
+    def __init__(self, actions, return_value=None):
+        """
+        :param list(Action) actions: the actions to add.
+        :param return_value: the return value of the returning action, as seen by its dependents,
+            :class:`.Hooks` and the :class:`.ExecutionReport`.
+        """
+        self.__actions = list(actions)
+        self.__return_value = return_value
+
+    @property
+    def actions(self):
+        """
+        The actions to add.
+
+        :rtype: list(Action)
+        """
+        return list(self.__actions)
+
+    @property
+    def return_value(self):
+        """
+        The return value of the returning action.
+        """
+        return self.__return_value
+
+
 class CompoundException(Exception):
     """
     Exception thrown by :func:`.execute` when dependencies raise exceptions.
@@ -306,6 +1464,163 @@ class CompoundException(Exception):
         return self.__execution_report
 
 
+class _OutputStorage(object):
+    # Chunks are joined on demand, to avoid copying the whole output each time a chunk is added.
+    # Above spill_threshold bytes, chunks are written to a temporary file instead.
+    # If tail_size is set, only the chunks containing the last tail_size bytes are kept, and nothing is spilled.
+    def __init__(self, spill_threshold, tail_size):
+        self.spill_threshold = spill_threshold
+        self.tail_size = tail_size
+        self.chunks = collections.deque()
+        self.size = 0
+        self.path = None
+        self.file = None
+
+    def __getstate__(self):
+        # Copies (sent to workers in dependency_statuses) read the temporary file but don't own it
+        state = dict(self.__dict__)
+        state["file"] = None
+        return state
+
+    def append(self, data):
+        if self.file is not None:
+            self.file.write(data)
+        else:
+            self.chunks.append(data)
+            self.size += len(data)
+            if self.tail_size is not None:
+                while self.chunks and self.size - len(self.chunks[0]) >= self.tail_size:
+                    self.size -= len(self.chunks.popleft())
+            elif self.spill_threshold is not None and self.size > self.spill_threshold:
+                self.__spill()
+
+    def __spill(self):
+        (fd, self.path) = tempfile.mkstemp(prefix="ActionTree-output-")
+        # Unbuffered, so that forked children never write the same data again when they exit
+        self.file = os.fdopen(fd, "wb", buffering=0)
+        weakref.finalize(self, _close_and_remove, self.file, self.path)
+        for chunk in self.chunks:
+            self.file.write(chunk)
+        self.chunks.clear()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get(self):
+        if self.path is None:
+            data = b"".join(self.chunks)
+            if self.tail_size is not None:
+                data = data[max(0, len(data) - self.tail_size):]
+            self.chunks = collections.deque([data])
+            self.size = len(data)
+            return data
+        else:
+            with open(self.path, "rb") as f:
+                return f.read()
+
+    def open(self):
+        if self.path is None:
+            return io.BytesIO(self.get())
+        else:
+            return open(self.path, "rb")
+
+
+class _StoredValue(object):
+    # A return value written to a file by the process that returned it: its pickle, then its out-of-band buffers.
+    # It's loaded on each access, without caching, so that it doesn't stay in the parent process' memory.
+    def __init__(self, path, data_size, buffer_sizes):
+        self.path = path
+        self.data_size = data_size
+        self.buffer_sizes = buffer_sizes
+
+    @classmethod
+    def store(cls, value, directory):
+        buffers = []
+        data = _dumps(value, buffers)
+        (fd, path) = tempfile.mkstemp(prefix="ActionTree-result-", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            for buffer in buffers:
+                f.write(buffer)
+        return cls(path, len(data), [len(buffer) for buffer in buffers])
+
+    @classmethod
+    def extract(cls, journal, offset, data_size, buffer_sizes, directory):
+        # Copy a return value recorded in a journal by _JournalWriter to its own file
+        (fd, path) = tempfile.mkstemp(prefix="ActionTree-result-", dir=directory)
+        with open(journal, "rb") as source, os.fdopen(fd, "wb") as f:
+            source.seek(offset)
+            for chunk in _read_chunks(source, data_size + sum(buffer_sizes)):
+                f.write(chunk)
+        return cls(path, data_size, buffer_sizes)
+
+    def own(self):
+        # Called in the parent process: the file is removed when the ExecutionReport is garbage-collected
+        weakref.finalize(self, os.remove, self.path)
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        buffers = []
+        begin = self.data_size
+        for size in self.buffer_sizes:
+            buffers.append(view[begin:begin + size])
+            begin += size
+        return _loads(view[:self.data_size], buffers)
+
+
+class _ShallowPickler(pickle.Pickler):
+    # Pickle some actions without recursing into other actions (their dependencies for example),
+    # which are unpickled as None by _ShallowUnpickler
+    def __init__(self):
+        self.__file = io.BytesIO()
+        super(_ShallowPickler, self).__init__(self.__file, pickle.HIGHEST_PROTOCOL)
+        self.__actions = None
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Action) and obj not in self.__actions:
+            return id(obj)
+        else:
+            return None
+
+    def dumps(self, obj, actions):
+        self.__actions = set(actions)
+        self.__file.seek(0)
+        self.__file.truncate()
+        self.clear_memo()
+        self.dump(obj)
+        return self.__file.getvalue()
+
+
+class _ShallowUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        return None
+
+
+class _PickledExpansion(object):
+    # An Expansion returned by an action executed in another process, pickled in that process.
+    # The returning action and its dependencies are pickled as references to the actions of the process
+    # calling execute, identified by their ids in that process.
+    def __init__(self, expansion, action_ids):
+        file = io.BytesIO()
+        pickler = pickle.Pickler(file, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda obj: action_ids.get(id(obj)) if isinstance(obj, Action) else None
+        pickler.dump(expansion)
+        self.data = file.getvalue()
+
+    def load(self, actions_by_id):
+        unpickler = pickle.Unpickler(io.BytesIO(self.data))
+        unpickler.persistent_load = actions_by_id.__getitem__
+        return unpickler.load()
+
+
+def _close_and_remove(file, path):
+    file.close()
+    os.remove(path)
+
+
 class ExecutionReport(object):
     """
     ExecutionReport()
@@ -318,7 +1633,7 @@ class ExecutionReport(object):
         Status of a single :class:`.Action`.
         """
 
-        def __init__(self, pending_time):
+        def __init__(self, pending_time, output_spill_threshold=None, output_tail_size=None):
             self.__pending_time = pending_time
             self.__ready_time = None
             self.__cancel_time = None
@@ -328,6 +1643,10 @@ class ExecutionReport(object):
             self.__failure_time = None
             self.__exception = None
             self.__output = None
+            self.__output_spill_threshold = output_spill_threshold
+            self.__output_tail_size = output_tail_size
+            self.__private_memory = None
+            self.__skip_reason = None
 
         def _set_ready_time(self, ready_time):
             self.__ready_time = ready_time
@@ -338,18 +1657,53 @@ class ExecutionReport(object):
         def _set_start_time(self, start_time):
             self.__start_time = start_time
 
+        def _set_restarted(self):
+            # The action will start again, after its previous execution was lost (see ExecutorContext.restart_action)
+            self.__start_time = None
+            self.__output = None
+
+        def _set_private_memory(self, private_memory):
+            self.__private_memory = private_memory
+
         def _set_success(self, success_time, return_value):
             self.__success_time = success_time
             self.__return_value = return_value
-            self._add_output(b"")
+            self.__end_output()
+
+        def _set_skipped(self, skip_time, reason, return_value, output_chunks):
+            self.__skip_reason = reason
+            for chunk in output_chunks:
+                self._add_output(chunk)
+            self._set_success(skip_time, return_value)
 
         def _set_failure(self, failure_time, exception):
             self.__failure_time = failure_time
             self.__exception = exception
-            self._add_output(b"")
+            self.__end_output()
 
         def _add_output(self, output):
-            self.__output = (self.__output or b"") + output
+            if self.__output is None:
+                self.__output = _OutputStorage(self.__output_spill_threshold, self.__output_tail_size)
+            self.__output.append(output)
+
+        def __end_output(self):
+            self._add_output(b"")
+            self.__output.close()
+
+        def _get_times(self):
+            return (
+                self.__pending_time, self.__ready_time, self.__cancel_time, self.__start_time,
+                self.__success_time, self.__failure_time,
+            )
+
+        def _get_raw(self, attribute):
+            # Stored values and output storages are transferred to workers as-is
+            return {
+                "return_value": self.__return_value,
+                "exception": self.__exception,
+                "output": self.__output,
+                "skip_reason": self.__skip_reason,
+            }[attribute]
 
         @property
         def status(self):
@@ -358,13 +1712,13 @@ class ExecutionReport(object):
             :attr:`SUCCESSFUL` if the action succeeded,
             :attr:`FAILED` if the action failed,
             and :attr:`CANCELED` if the action was canceled because some of its dependencies failed.
+            Skipped actions (see :attr:`skip_reason`) are :attr:`SUCCESSFUL`.
             """
-            if self.start_time:
-                if self.success_time:
-                    return SUCCESSFUL
-                else:
-                    assert self.failure_time
-                    return FAILED
+            if self.success_time:
+                return SUCCESSFUL
+            elif self.start_time:
+                assert self.failure_time
+                return FAILED
             else:
                 assert self.cancel_time
                 return CANCELED
@@ -398,11 +1752,21 @@ class ExecutionReport(object):
             """
             return self.__cancel_time
 
+        @property
+        def skip_reason(self):
+            """
+            Why this action was not executed although it was ready, e.g. :attr:`CACHED`.
+            (``None`` if it was not skipped).
+            Its :attr:`success_time` is then the time it was skipped,
+            and its :attr:`return_value` and :attr:`output` are the ones it would have returned and printed.
+            """
+            return self.__skip_reason
+
         @property
         def start_time(self):
             """
             The time at the beginning of the execution of this action.
-            (``None`` if it was never started).
+            (``None`` if it was never started or if it was skipped).
 
             :rtype: datetime.datetime or None
             """
@@ -423,8 +1787,25 @@ class ExecutionReport(object):
             """
             The value returned by this action
             (``None`` if it failed or was never started).
+
+            See the ``result_store_threshold`` parameter of :func:`.execute` about large return values.
+            """
+            if isinstance(self.__return_value, _StoredValue):
+                return self.__return_value.load()
+            else:
+                return self.__return_value
+
+        @property
+        def private_memory(self):
+            """
+            The private memory, in bytes, of the process that executed this action, at the end of its execution:
+            memory allocated by this process and memory inherited from its parent but copied on write.
+            (``None`` if the ``measure_memory`` parameter of :func:`.execute` was ``False``,
+            if the action didn't execute in its own process or a worker, or if the platform doesn't support it)
+
+            :rtype: int or None
             """
-            return self.__return_value
+            return self.__private_memory
 
         @property
         def failure_time(self):
@@ -450,13 +1831,39 @@ class ExecutionReport(object):
             Everything printed (and flushed in time) by this action.
             (``None`` if it never started, ``""`` it if didn't print anything)
 
+            If the ``output_tail_size`` parameter of :func:`.execute` was set, only the last bytes printed.
+
             :rtype: str or None
             """
-            return self.__output
+            if self.__output is None:
+                return None
+            else:
+                return self.__output.get()
+
+        def open_output(self):
+            """
+            Open :attr:`output` as a binary file-like object.
+            This avoids loading it entirely in memory when it was stored in a temporary file
+            (see the ``output_spill_threshold`` parameter of :func:`.execute`).
+            (``None`` if it never started)
+            """
+            if self.__output is None:
+                return None
+            else:
+                return self.__output.open()
 
-    def __init__(self, root_action, actions, now):
+    def __init__(self, root_action, actions, now, output_spill_threshold=None, output_tail_size=None):
         self._root_action = root_action
-        self.__action_statuses = {action: self.ActionStatus(now) for action in actions}
+        self.__output_spill_threshold = output_spill_threshold
+        self.__output_tail_size = output_tail_size
+        self.__action_statuses = {}
+        self._add_actions(actions, now)
+
+    def _add_actions(self, actions, now):
+        for action in actions:
+            self.__action_statuses[action] = self.ActionStatus(
+                now, self.__output_spill_threshold, self.__output_tail_size,
+            )
 
     @property
     def is_success(self):
@@ -498,10 +1905,137 @@ FAILED = "FAILED"
 CANCELED = "CANCELED"
 "The :attr:`.ActionStatus.status` after a failed execution where a dependency raised an exception."
 
+CAPTURE = "CAPTURE"
+"The ``output_capture`` value to capture what actions print in :attr:`.ActionStatus.output`."
+
+INHERIT = "INHERIT"
+"""
+The ``output_capture`` value to let what actions print go to the standard output and error
+of the process calling :func:`.execute`.
+"""
+
+DISCARD = "DISCARD"
+"The ``output_capture`` value to discard what actions print."
+
+CACHED = "CACHED"
+"The :attr:`.ActionStatus.skip_reason` of an action whose result was found in the :class:`ResultCache`."
+
+UP_TO_DATE = "UP_TO_DATE"
+"The :attr:`.ActionStatus.skip_reason` of an action whose outputs were up to date."
+
+RESUMED = "RESUMED"
+"The :attr:`.ActionStatus.skip_reason` of an action recorded as completed in the journal of a previous execution."
+
 PRINTED = "PRINTED"
 
 PICKLING_EXCEPTION = "PICKLING_EXCEPTION"
 
+SERIALIZED_RESULT = "SERIALIZED_RESULT"
+
+FETCH = "FETCH"
+
+AGENT_HELLO = "AGENT_HELLO"
+
+AGENT_START = "AGENT_START"
+
+AGENT_CANCEL = "AGENT_CANCEL"
+
+LOST = "LOST"
+
+
+class _DependencyStatuses(collections.abc.Mapping):
+    # The dependency_statuses passed to Action.do_execute, built on first access.
+    # dependency_ids are the ids of dependencies in the process calling execute, if they are copies.
+    # stream_readers are aligned with dependencies: dependencies with a reader are not keys of the mapping.
+    def __init__(self, dependencies, get_status, dependency_ids=None, stream_readers=None):
+        self.__all_dependencies = dependencies
+        self.__streams = {}
+        if stream_readers is not None:
+            for (dependency, reader) in zip(dependencies, stream_readers):
+                if reader is not None:
+                    self.__streams[dependency] = reader
+        self.__dependencies = [dependency for dependency in dependencies if dependency not in self.__streams]
+        # For constant-time lookups in actions iterating over many dependencies
+        self.__dependencies_set = set(self.__dependencies)
+        self.__get_status = get_status
+        self.__dependency_ids = dependency_ids
+        self.__statuses = {}
+
+    def stream(self, dependency):
+        # See Action
+        return iter(self.__streams[dependency])
+
+    def _close_streams(self):
+        for reader in self.__streams.values():
+            reader.close()
+
+    def _get_action_ids(self):
+        if self.__dependency_ids is None:
+            return {id(dependency): id(dependency) for dependency in self.__all_dependencies}
+        else:
+            return {id(dependency): i for (dependency, i) in zip(self.__all_dependencies, self.__dependency_ids)}
+
+    def __getitem__(self, dependency):
+        status = self.__statuses.get(dependency)
+        if status is None:
+            if dependency not in self.__dependencies_set:
+                raise KeyError(dependency)
+            status = self.__statuses[dependency] = self.__get_status(dependency)
+        return status
+
+    def __iter__(self):
+        return iter(self.__dependencies)
+
+    def __len__(self):
+        return len(self.__dependencies)
+
+
+class _FetchedActionStatus(ExecutionReport.ActionStatus):
+    # Status of a dependency of an action executed in a worker: times are known upfront,
+    # and heavy attributes are fetched from the parent process on first access
+    def __init__(self, times, fetch):
+        (pending_time, ready_time, cancel_time, start_time, success_time, failure_time) = times
+        super(_FetchedActionStatus, self).__init__(pending_time)
+        self._set_ready_time(ready_time)
+        self._set_cancel_time(cancel_time)
+        self._set_start_time(start_time)
+        if success_time is not None:
+            self._set_success(success_time, None)
+        if failure_time is not None:
+            self._set_failure(failure_time, None)
+        self.__fetch = fetch
+        self.__fetched = {}
+
+    def __get(self, attribute):
+        if attribute not in self.__fetched:
+            self.__fetched[attribute] = self.__fetch(attribute)
+        return self.__fetched[attribute]
+
+    @property
+    def return_value(self):
+        return_value = self.__get("return_value")
+        if isinstance(return_value, _StoredValue):
+            return return_value.load()
+        else:
+            return return_value
+
+    @property
+    def exception(self):
+        return self.__get("exception")
+
+    @property
+    def output(self):
+        output = self.__get("output")
+        return None if output is None else output.get()
+
+    @property
+    def skip_reason(self):
+        return self.__get("skip_reason")
+
+    def open_output(self):
+        output = self.__get("output")
+        return None if output is None else output.open()
+
 
 class DependencyGraph(object):
     """
@@ -591,7 +2125,8 @@ class GanttChart(object):  # pragma no cover: too difficult
             self.__id = id(action)
             self.__dependencies = set(id(d) for d in action.dependencies)
             self.__ready_time = status.ready_time
-            self.__start_time = status.start_time
+            # Skipped actions never started
+            self.__start_time = status.success_time if status.start_time is None else status.start_time
             self.__success_time = status.success_time
 
         @property
@@ -771,47 +2306,1207 @@ class GanttChart(object):  # pragma no cover: too difficult
         ax2.xaxis.set_ticklabels(ticks)
 
 
+def _get_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # pragma no cover: specific to macOS
+        # Not the *current* RSS, but the peak RSS, in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _get_private_memory():
+    # Memory not shared with other processes (including pages copied on write after forking), in bytes
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            return sum(
+                int(line.split()[1]) * 1024
+                for line in f
+                if line.startswith("Private_Clean:") or line.startswith("Private_Dirty:")
+            )
+    except OSError:  # pragma no cover: specific to macOS and Linux < 4.14
+        return None
+
+
+def _dumps(obj, buffers):
+    # Large buffers (bytearrays, NumPy arrays, etc.) are appended to "buffers" instead of being copied in the pickle
+    if pickle.HIGHEST_PROTOCOL < 5:  # pragma no cover: specific to Python < 3.8
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    def buffer_callback(buffer):
+        # Only contiguous buffers can be pickled out-of-band, and they are flat in raw()
+        buffers.append(buffer.raw())
+
+    return pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+
+
+def _loads(data, buffers):
+    if pickle.HIGHEST_PROTOCOL < 5:  # pragma no cover: specific to Python < 3.8
+        return pickle.loads(data)
+    else:
+        return pickle.loads(data, buffers=buffers)
+
+
+def _out_of_band(buffer):
+    # Mark a buffer to be sent as-is by _EventSender, without copying it in the pickle
+    if pickle.HIGHEST_PROTOCOL < 5:  # pragma no cover: specific to Python < 3.8
+        return bytes(buffer)
+    else:
+        return pickle.PickleBuffer(buffer)
+
+
+class _EventSender(object):
+    # Writable end of an events pipe, used in a child process.
+    # Each event is sent as a frame: its size, the sizes of its out-of-band buffers, its pickle, and the buffers.
+    # Frames are written with writev, without concatenating the buffers, at most _IOV_MAX buffers at a time.
+    def __init__(self, fd):
+        self.fd = fd
+        # Actions in workers send events from the thread reading their output and from the main thread
+        self.lock = threading.Lock()
+
+    def send(self, event):
+        parts = _frame_event(event)
+        with self.lock:
+            begin = 0
+            while begin < len(parts):
+                written = os.writev(self.fd, parts[begin:begin + _IOV_MAX])
+                while begin < len(parts) and written >= len(parts[begin]):
+                    written -= len(parts[begin])
+                    begin += 1
+                if written:
+                    parts[begin] = parts[begin][written:]
+
+    def __reduce__(self):
+        # When starting a process from a fork server, the file descriptor is sent to the fork server
+        return (_EventSender._rebuild, (multiprocessing.reduction.DupFd(self.fd),))
+
+    @staticmethod
+    def _rebuild(dup_fd):
+        return _EventSender(dup_fd.detach())
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _frame_event(event):
+    buffers = []
+    data = _dumps(event, buffers)
+    header = struct.pack("!I{}Q".format(len(buffers)), len(buffers), *(len(b) for b in buffers))
+    size = len(header) + len(data) + sum(len(b) for b in buffers)
+    return [memoryview(_EVENT_HEADER.pack(size) + header), memoryview(data)] + buffers
+
+
+class _BufferedEventSender(object):
+    # Non-blocking writable end of a connection to a worker agent, framed like _EventSender.
+    # Both ends of the connection also read events: a blocking write could wait for the other end,
+    # itself blocked writing to this end. So frames are queued, and written when the selector reports
+    # the socket writable.
+    def __init__(self, fd):
+        self.fd = fd
+        self.parts = collections.deque()
+
+    def send(self, event):
+        # Return True if the frame is not completely written yet
+        self.parts.extend(_frame_event(event))
+        return self.write()
+
+    def write(self):
+        # Return True if frames are still queued
+        while self.parts:
+            try:
+                written = os.writev(self.fd, list(itertools.islice(self.parts, _IOV_MAX)))
+            except BlockingIOError:
+                return True
+            while self.parts and written >= len(self.parts[0]):
+                written -= len(self.parts.popleft())
+            if written:
+                self.parts[0] = self.parts[0][written:]
+        return False
+
+
+class _EventReader(object):
+    # Readable end of an events pipe, decoding the frames sent by an _EventSender.
+    # Small frames are accumulated in a common buffer, but large frames are read directly in their own bytearray,
+    # to which the out-of-band buffers refer when unpickled.
+    def __init__(self, fd):
+        self.fd = fd
+        self.buffer = bytearray()
+        self.frame = None
+        self.frame_filled = 0
+
+    def read(self, events):
+        # Return False on end of file
+        if self.frame is not None:
+            read = os.readv(self.fd, [memoryview(self.frame)[self.frame_filled:]])
+            self.frame_filled += read
+            if self.frame_filled == len(self.frame):
+                events.append(self.__decode(memoryview(self.frame)))
+                self.frame = None
+            return read != 0
+        data = os.read(self.fd, _EVENTS_READ_SIZE)
+        self.buffer += data
+        offset = 0
+        while len(self.buffer) - offset >= _EVENT_HEADER.size:
+            (size,) = _EVENT_HEADER.unpack_from(self.buffer, offset)
+            begin = offset + _EVENT_HEADER.size
+            end = begin + size
+            if len(self.buffer) < end:
+                if size > _EVENTS_READ_SIZE:
+                    self.frame = bytearray(size)
+                    self.frame_filled = len(self.buffer) - begin
+                    self.frame[:self.frame_filled] = self.buffer[begin:]
+                    offset = len(self.buffer)
+                break
+            events.append(self.__decode(memoryview(bytes(self.buffer[begin:end]))))
+            offset = end
+        del self.buffer[:offset]
+        return len(data) != 0
+
+    def __decode(self, frame):
+        (count,) = struct.unpack_from("!I", frame)
+        sizes = struct.unpack_from("!{}Q".format(count), frame, 4)
+        begin = len(frame) - sum(sizes)
+        buffers = []
+        for size in sizes:
+            buffers.append(frame[begin:begin + size])
+            begin += size
+        return _loads(frame[4 + 8 * count:len(frame) - sum(sizes)], buffers)
+
+
+class _StreamReader(object):
+    # Readable end of the stream from a producer to a consumer, iterated in the consumer's process.
+    # Chunks are framed like events, in 1-tuples, and an empty tuple marks the end of the stream.
+    # The pipe's buffer bounds the chunks sent in advance: the producer blocks until the consumer reads.
+    def __init__(self, fd, label):
+        self.fd = fd
+        self.label = label
+
+    def __iter__(self):
+        if self.fd is None:
+            raise StreamException("Stream of {!r} is not available".format(self.label))
+        reader = _EventReader(self.fd)
+        try:
+            while True:
+                chunks = []
+                alive = reader.read(chunks)
+                for chunk in chunks:
+                    if not chunk:
+                        return
+                    yield chunk[0]
+                if not alive:
+                    raise StreamException("Stream of {!r} was interrupted".format(self.label))
+        finally:
+            # The producer stops sending chunks to consumers that stopped reading
+            self.close()
+
+    def __reduce__(self):
+        if self.fd is None:
+            return (_StreamReader, (None, self.label))
+        else:
+            return (_StreamReader._rebuild, (multiprocessing.reduction.DupFd(self.fd), self.label))
+
+    @staticmethod
+    def _rebuild(dup_fd, label):
+        return _StreamReader(dup_fd.detach(), label)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+_EVENT_HEADER = struct.Struct("!Q")
+
+try:
+    _IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (ValueError, OSError):  # pragma no cover: specific to platforms without this limit
+    _IOV_MAX = -1
+if _IOV_MAX <= 0:  # pragma no cover: same
+    # The minimum required by POSIX
+    _IOV_MAX = 16
+
+_EVENTS_READ_SIZE = 65536
+
+_OUTPUT_READ_SIZE = 65536
+
+
+class _Events(object):
+    # Each child process sends its events through its own pipe, and all pipes are multiplexed with a selector.
+    # This avoids the feeder thread and the lock shared by all producers of a multiprocessing.Queue.
+    # Actions executing in the current process append their events to a deque,
+    # and write a byte in a "self-pipe" to wake up the selector.
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.local_events = collections.deque()
+        (self.wakeup_r, self.wakeup_w) = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        os.set_blocking(self.wakeup_w, False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ, None)
+        # Threads abandoned after a timeout keep putting events after the execution is over,
+        # when the file descriptor of the self-pipe may have been reused
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def make_pipe(self):
+        # The caller must close the returned sender in the current process once the child is started
+        (pipe_r, pipe_w) = os.pipe()
+        self.register(pipe_r, _EventReader(pipe_r))
+        return _EventSender(pipe_w)
+
+    def register(self, fd, reader):
+        # reader.read(events) appends the events read from fd, and returns False on end of file.
+        # fd is then closed.
+        self.selector.register(fd, selectors.EVENT_READ, reader)
+
+    def wait_writable(self, fd):
+        # reader.write() is then called each time fd is writable, until it returns False
+        self.selector.modify(fd, selectors.EVENT_READ | selectors.EVENT_WRITE, self.selector.get_key(fd).data)
+
+    def put_local(self, event):
+        with self.lock:
+            if self.closed:
+                return
+            self.local_events.append(event)
+            try:
+                os.write(self.wakeup_w, b"\0")
+            except BlockingIOError:  # pragma no cover: the selector will be woken up anyway
+                pass
+
+    def get(self, timeout=None):
+        # Return all available events, waiting for at least one or for the timeout to expire
+        events = []
+        while not events:
+            for (key, mask) in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while os.read(self.wakeup_r, 4096):  # pragma no branch
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                if mask & selectors.EVENT_WRITE and not key.data.write():
+                    self.selector.modify(key.fd, selectors.EVENT_READ, key.data)
+                if mask & selectors.EVENT_READ and not key.data.read(events):
+                    # The child process exited
+                    self.selector.unregister(key.fd)
+                    os.close(key.fd)
+            while self.local_events:
+                events.append(self.local_events.popleft())
+            if timeout is not None:
+                break
+        return events
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            for key in list(self.selector.get_map().values()):
+                os.close(key.fd)
+            self.selector.close()
+            os.close(self.wakeup_w)
+
+
+def _lead_process_group(pid):
+    # Processes executing actions lead their own process group, so the subprocesses they start are killed with them.
+    # Called both in the parent process and in the child process (with pid 0), to avoid a race.
+    try:
+        os.setpgid(pid, pid)
+    except OSError:  # pragma no cover: a race with the child process
+        # The child process already exited
+        pass
+
+
+def _kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:  # pragma no cover: a race with the process
+        # The process exited, or is not a group leader yet
+        try:
+            os.kill(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    process.join()
+
+
+class _Worker(object):
+    def __init__(self, context, run):
+        (self.tasks_r, self.tasks_w) = multiprocessing.Pipe(duplex=False)
+        self.events = context.make_events_sender()
+        self.generation = context._execution.generation
+        self.retiring = multiprocessing.RawValue("b", False)
+        self.process = multiprocessing.Process(target=run, kwargs=dict(worker=self))
+        self.process.start()
+        _lead_process_group(self.process.pid)
+        self.tasks_r.close()
+        self.events.close()
+
+    def send(self, task):
+        self.tasks_w.send(task)
+
+    def stop(self):
+        self.tasks_w.send(None)
+        self.tasks_w.close()
+
+
+class _AgentConnection(object):
+    # Connection to a worker agent during an execution. Events are sent both ways on a socket,
+    # framed like on events pipes. Actions running on an agent are reported as lost when the connection breaks.
+    def __init__(self, agent):
+        connection = multiprocessing.connection.Client(agent.address, authkey=agent.authkey)
+        self.fd = os.dup(connection.fileno())
+        connection.close()
+        self.reader = _EventReader(self.fd)
+        hello = []
+        while not hello:
+            if not self.reader.read(hello):
+                os.close(self.fd)
+                raise ConnectionError("Worker agent at {} closed the connection".format(agent.address))
+        (event_kind, _, (cpu_cores,)) = hello[0]
+        assert event_kind == AGENT_HELLO
+        os.set_blocking(self.fd, False)
+        self.sender = _BufferedEventSender(self.fd)
+        self.events = None
+        self.writing = False
+        self.availabilities = {CPU_CORE: cpu_cores}
+        self.availabilities.update(agent.resources)
+        self.used = {}
+        self.running = set()
+        self.lost = False
+
+    def register(self, events):
+        self.events = events
+        events.register(self.fd, self)
+
+    def read(self, events):
+        try:
+            if self.reader.read(events):
+                return True
+        except BlockingIOError:  # pragma no cover: spurious wake up
+            return True
+        except OSError:  # pragma no cover: the connection is reset
+            pass
+        self.lost = True
+        for action_id in self.running:
+            events.append((LOST, action_id, ()))
+        return False
+
+    def fits(self, resources_required, node_resources):
+        for (resource, quantity) in resources_required.items():
+            if resource in self.availabilities:
+                used = self.used.get(resource, 0)
+                # Like for global resources, allow actions requiring more than available when they are alone
+                if used != 0 and used + quantity > self.availabilities[resource]:
+                    return False
+            elif resource in node_resources:
+                # Provided by other agents only
+                return False
+        return True
+
+    def load(self):
+        return self.used.get(CPU_CORE, 0) / max(1, self.availabilities[CPU_CORE])
+
+    def write(self):
+        # Return False once all queued events are written
+        try:
+            self.writing = self.sender.write()
+        except OSError:  # pragma no cover: the connection is broken while writing
+            # The connection is broken: read will report it, and running actions will be lost
+            self.sender.parts.clear()
+            self.writing = False
+        return self.writing
+
+    def __send(self, event):
+        if self.lost:  # pragma no cover: canceled while its connection is being lost
+            return
+        try:
+            writing = self.sender.send(event)
+        except OSError:  # pragma no cover: the connection is broken while writing
+            self.sender.parts.clear()
+            return
+        if writing and not self.writing:
+            self.writing = True
+            self.events.wait_writable(self.fd)
+
+    def start(self, action_id, resources_required, task):
+        for (resource, quantity) in resources_required.items():
+            self.used[resource] = self.used.get(resource, 0) + quantity
+        self.running.add(action_id)
+        # If the connection is broken, the selector will report it, and the action will be lost
+        self.__send((AGENT_START, action_id, task))
+
+    def cancel(self, action_id, resources_required):
+        self.__send((AGENT_CANCEL, action_id, ()))
+        self.release(action_id, resources_required)
+
+    def release(self, action_id, resources_required):
+        for (resource, quantity) in resources_required.items():
+            self.used[resource] -= quantity
+        self.running.discard(action_id)
+
+
+class _Task(object):
+    # See ExecutorContext.make_task
+    def __init__(
+        self, execution, action_id, remote, action_data, dependency_ids, dependency_times, dependency_values, streams,
+    ):
+        self.execution = execution
+        self.action_id = action_id
+        self.remote = remote
+        self.action_data = action_data
+        self.dependency_ids = dependency_ids
+        self.dependency_times = dependency_times
+        self.dependency_values = dependency_values
+        self.streams = streams
+
+    def run(self, events):
+        if self.remote:
+            # Stored return values would be in files of this machine
+            self.execution.result_store_threshold = None
+        (action, dependencies) = _ShallowUnpickler(io.BytesIO(self.action_data)).load()
+        statuses = {
+            dependency: _FetchedActionStatus(times, values.__getitem__)
+            for (dependency, times, values) in zip(dependencies, self.dependency_times, self.dependency_values)
+        }
+        (stream_senders, stream_readers) = self.streams
+        dependency_statuses = _DependencyStatuses(
+            dependencies, statuses.__getitem__, self.dependency_ids, stream_readers,
+        )
+        self.execution._send_end_event(events, self.execution._execute_action(
+            action, self.action_id, dependency_statuses, events, stream_senders,
+        ))
+
+
+def _is_coroutine_action(action):
+    return asyncio.iscoroutinefunction(getattr(action, "do_execute", None))
+
+
+class _CurrentOutput(object):
+    # Where to capture what the current thread or asyncio task writes.
+    # Context variables are local to both threads and tasks, but they require Python 3.7.
+    def __init__(self):
+        if contextvars is None:  # pragma no cover: specific to Python < 3.7
+            self.__local = threading.local()
+        else:
+            self.__var = contextvars.ContextVar("output", default=None)
+
+    def get(self):
+        if contextvars is None:  # pragma no cover: specific to Python < 3.7
+            return getattr(self.__local, "output", None)
+        else:
+            return self.__var.get()
+
+    def set(self, output):
+        if contextvars is None:  # pragma no cover: specific to Python < 3.7
+            self.__local.output = output
+        else:
+            self.__var.set(output)
+
+
+class _ThreadLocalOutput(object):
+    # Replaces sys.stdout and sys.stderr during executions with actions executing in the current process.
+    # File descriptors are process-wide so we can't redirect them like in _Execute._execute_action.
+    def __init__(self, stream, current_output):
+        self.__stream = stream
+        self.__current_output = current_output
+
+    def write(self, data):
+        output = self.__current_output.get()
+        if output is None:
+            return self.__stream.write(data)
+        else:
+            output.write(data.encode(self.__stream.encoding or "utf8", "replace"))
+            return len(data)
+
+    def flush(self):
+        output = self.__current_output.get()
+        if output is None:
+            self.__stream.flush()
+        else:
+            output.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.__stream, name)
+
+
+class _InProcessCapture(object):
+    # Executions with actions executing in the current process may run concurrently (with execute_async),
+    # so they share the same _ThreadLocalOutput streams, installed by the first one and removed by the last one
+    def __init__(self):
+        self.current_output = _CurrentOutput()
+        self.__lock = threading.Lock()
+        self.__executions = 0
+        self.__original_streams = None
+
+    def start(self):
+        with self.__lock:
+            if self.__executions == 0:
+                self.__original_streams = (sys.stdout, sys.stderr)
+                sys.stdout = _ThreadLocalOutput(sys.stdout, self.current_output)
+                sys.stderr = _ThreadLocalOutput(sys.stderr, self.current_output)
+            self.__executions += 1
+
+    def stop(self):
+        with self.__lock:
+            self.__executions -= 1
+            if self.__executions == 0:
+                (sys.stdout, sys.stderr) = self.__original_streams
+                self.__original_streams = None
+
+
+_in_process_capture = _InProcessCapture()
+
+
+class _ThreadOutput(object):
+    # Without a timer, output buffered for longer than flush_interval is reported on the next write or flush
+    def __init__(self, handle_printed, flush_interval, flush_size):
+        self.__handle_printed = handle_printed
+        self.__flush_interval = flush_interval
+        self.__flush_size = flush_size
+        self.__buffer = b""
+        self.__first_write = None
+
+    def write(self, data):
+        if not self.__buffer:
+            self.__first_write = time.monotonic()
+        self.__buffer += data
+        if len(self.__buffer) >= self.__flush_size:
+            self.close()
+        elif b"\n" in data:
+            self.flush()
+
+    def flush(self):
+        if self.__buffer and time.monotonic() - self.__first_write >= self.__flush_interval:
+            self.close()
+
+    def close(self):
+        if self.__buffer:
+            self.__handle_printed(datetime.datetime.now(), self.__buffer)
+            self.__buffer = b""
+
+
+class _DiscardedOutput(object):
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _flush_outputs():
+    sys.stdout.flush()
+    libc.fflush(stdout)
+    sys.stderr.flush()
+    libc.fflush(stderr)
+
+
+def _redirect_outputs(fd):
+    _flush_outputs()
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+
+
+class _FileStates(object):
+    # stat() results of the paths declared by actions, shared by all actions of an execution.
+    # If hashes_path is set, the hashes of files and the hashes of the inputs of each action when it last succeeded
+    # are loaded from and saved to that file.
+    def __init__(self, paths, hashes_path):
+        self.__stats = {path: self.__stat(path) for path in paths}
+        self.__hashes_path = hashes_path
+        if hashes_path is not None:
+            try:
+                with open(hashes_path) as f:
+                    hashes = json.load(f)
+            except FileNotFoundError:
+                hashes = {"files": {}, "actions": {}}
+            # Path: [size, modification time, hash]
+            self.__files = hashes["files"]
+            # Output paths: {input path: hash}
+            self.__actions = hashes["actions"]
+
+    @staticmethod
+    def __stat(path):
+        try:
+            return os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def stat(self, path):
+        if path not in self.__stats:
+            self.__stats[path] = self.__stat(path)
+        return self.__stats[path]
+
+    def forget(self, paths):
+        for path in paths:
+            self.__stats.pop(path, None)
+
+    def is_up_to_date(self, input_paths, output_paths):
+        output_stats = [self.stat(path) for path in output_paths]
+        if any(path_stat is None for path_stat in output_stats):
+            return False
+        if self.__hashes_path is None:
+            input_stats = [self.stat(path) for path in input_paths]
+            if any(path_stat is None for path_stat in input_stats):
+                return False
+            return (
+                max((path_stat.st_mtime_ns for path_stat in input_stats), default=0) <=
+                min(path_stat.st_mtime_ns for path_stat in output_stats)
+            )
+        else:
+            hashes = self.__actions.get(self.__key(output_paths))
+            return hashes is not None and hashes == self.__hash_all(input_paths)
+
+    def record(self, input_paths, output_paths):
+        if self.__hashes_path is not None:
+            hashes = self.__hash_all(input_paths)
+            if hashes is None:
+                self.__actions.pop(self.__key(output_paths), None)
+            else:
+                self.__actions[self.__key(output_paths)] = hashes
+
+    def save(self):
+        if self.__hashes_path is not None:
+            (fd, temp_path) = tempfile.mkstemp(
+                prefix="ActionTree-hashes-", dir=os.path.dirname(os.path.abspath(self.__hashes_path)),
+            )
+            with os.fdopen(fd, "w") as f:
+                json.dump({"files": self.__files, "actions": self.__actions}, f)
+            os.replace(temp_path, self.__hashes_path)
+
+    @staticmethod
+    def __key(output_paths):
+        return "\0".join(output_paths)
+
+    def __hash_all(self, paths):
+        hashes = {}
+        for path in paths:
+            hashes[path] = self.__hash(path)
+            if hashes[path] is None:
+                return None
+        return hashes
+
+    def __hash(self, path):
+        path_stat = self.stat(path)
+        if path_stat is None:
+            return None
+        if stat.S_ISDIR(path_stat.st_mode):
+            return "directory"
+        state = [path_stat.st_size, path_stat.st_mtime_ns]
+        recorded = self.__files.get(path)
+        if recorded is not None and recorded[:2] == state:
+            return recorded[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_READ_SIZE), b""):
+                digest.update(chunk)
+        self.__files[path] = state + [digest.hexdigest()]
+        return digest.hexdigest()
+
+
+_HASH_READ_SIZE = 1048576
+
+
+class _JournalWriter(object):
+    # Records are appended to the journal by a thread, in batches, so that the event loop doesn't wait for the disk.
+    # A record is a header with the sizes of its three parts, the pickle of (identity, return value,
+    # sizes of a stored return value), the file of the stored return value, the output, and the CRC32 of all that.
+    # Stored return values and spilled outputs are copied from their files, so that they are never fully in memory.
+    def __init__(self, path):
+        try:
+            self.__file = open(path, "r+b", buffering=0)
+        except FileNotFoundError:
+            self.__file = open(path, "w+b", buffering=0)
+        # Records appended after a record truncated when a previous execution died would be ignored: overwrite it
+        end = 0
+        for (offset, sizes, end) in _scan_journal(self.__file):
+            pass
+        self.__file.seek(end)
+        self.__file.truncate()
+        self.__records = []
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def append(self, record):
+        # "record" is (identity, return value or _StoredValue, output or path of the spilled output)
+        with self.__condition:
+            self.__records.append(record)
+
+    def close(self):
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+        self.__thread.join()
+        self.__file.close()
+
+    def __run(self):
+        closed = False
+        while not closed:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__closed, _JOURNAL_FLUSH_INTERVAL)
+                (records, self.__records) = (self.__records, [])
+                closed = self.__closed
+            if records:
+                for record in records:
+                    self.__append(*record)
+                try:
+                    os.fsync(self.__file.fileno())
+                except OSError:
+                    pass
+
+    def __append(self, identity, return_value, output):
+        if isinstance(return_value, _StoredValue):
+            (stored, stored_sizes) = (return_value.path, (return_value.data_size, return_value.buffer_sizes))
+            return_value = None
+        else:
+            (stored, stored_sizes) = (b"", None)
+        try:
+            data = pickle.dumps((identity, return_value, stored_sizes), pickle.HIGHEST_PROTOCOL)
+        except Exception:  # pragma no cover: return values were already checked to be picklable
+            return
+        start = self.__file.tell()
+        sources = []
+        try:
+            for source in (stored, output):
+                if isinstance(source, str):
+                    f = open(source, "rb")
+                    sources.append((f, os.fstat(f.fileno()).st_size))
+                else:
+                    sources.append((io.BytesIO(source), len(source)))
+            header = _JOURNAL_HEADER.pack(len(data), *(size for (f, size) in sources))
+            checksum = zlib.crc32(data, zlib.crc32(header))
+            self.__write(header + data)
+            for (f, size) in sources:
+                for chunk in _read_chunks(f, size):
+                    checksum = zlib.crc32(chunk, checksum)
+                    self.__write(chunk)
+            self.__write(_JOURNAL_TRAILER.pack(checksum))
+        except OSError:
+            # The disk is full, or a file was removed: the action is not recorded
+            self.__file.seek(start)
+            self.__file.truncate()
+        finally:
+            for (f, size) in sources:
+                f.close()
+
+    def __write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[self.__file.write(view):]
+
+
+_JOURNAL_FLUSH_INTERVAL = 1
+_JOURNAL_HEADER = struct.Struct("!QQQ")
+_JOURNAL_TRAILER = struct.Struct("!I")
+
+
+def _scan_journal(f):
+    # Yield (offset, sizes, end) for the parts of each valid record, and stop at the first truncated
+    # or corrupted one
+    file_size = os.fstat(f.fileno()).st_size
+    end = 0
+    while True:
+        f.seek(end)
+        header = f.read(_JOURNAL_HEADER.size)
+        if len(header) < _JOURNAL_HEADER.size:
+            return
+        sizes = _JOURNAL_HEADER.unpack(header)
+        offset = end + _JOURNAL_HEADER.size
+        end = offset + sum(sizes) + _JOURNAL_TRAILER.size
+        if end > file_size:
+            return
+        checksum = zlib.crc32(header)
+        for chunk in _read_chunks(f, sum(sizes)):
+            checksum = zlib.crc32(chunk, checksum)
+        if _JOURNAL_TRAILER.unpack(f.read(_JOURNAL_TRAILER.size)) != (checksum,):
+            return
+        yield (offset, sizes, end)
+
+
+def _read_chunks(f, size):
+    while size:
+        chunk = f.read(min(size, _HASH_READ_SIZE))
+        if not chunk:  # pragma no cover: truncated by another process
+            raise EOFError
+        size -= len(chunk)
+        yield chunk
+
+
+def _read_journal(path):
+    # Return {identity: (return value, location of the stored return value, location of the output)}.
+    # Stored return values and outputs stay in the journal until the actions are skipped.
+    records = {}
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return records
+    with f:
+        for (offset, (data_size, stored_size, output_size), end) in _scan_journal(f):
+            f.seek(offset)
+            try:
+                (identity, return_value, stored_sizes) = pickle.loads(f.read(data_size))
+            except Exception:
+                # The action's class was removed, for example
+                continue
+            offset += data_size
+            stored = None if stored_sizes is None else (offset, stored_sizes)
+            records[identity] = (return_value, stored, (offset + stored_size, output_size))
+    return records
+
+
+def _read_journal_output(path, offset, size):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        yield from _read_chunks(f, size)
+
+
+class _CoroutineHooks(object):
+    # Hooks methods may return awaitables. When executing in an event loop, they are awaited by run_pending.
+    # Else, they are run to completion immediately in a private event loop.
+    def __init__(self, hooks):
+        self.__hooks = hooks
+        self.__pending = []
+        self.__loop = None
+        self.in_event_loop = False
+
+    def __getattr__(self, name):
+        method = getattr(self.__hooks, name)
+
+        def call(*args):
+            result = method(*args)
+            if inspect.isawaitable(result):
+                if self.in_event_loop:
+                    self.__pending.append(result)
+                else:
+                    if self.__loop is None:
+                        self.__loop = asyncio.new_event_loop()
+                    self.__loop.run_until_complete(result)
+        return call
+
+    def overrides(self, name):
+        # False if the hooks keep the default implementation of this method, which does nothing
+        return getattr(getattr(self.__hooks, name), "__func__", None) is not getattr(Hooks, name)
+
+    async def run_pending(self):
+        while self.__pending:
+            await self.__pending.pop(0)
+
+    def close(self):
+        if self.__loop is not None:
+            self.__loop.close()
+
+
 class _Execute(object):
-    def __init__(self, cpu_cores, keep_going, do_raise, hooks):
+    def __init__(
+        self, cpu_cores, keep_going, do_raise, hooks, thread_slots, duration_estimates,
+        output_flush_interval, output_flush_size, output_spill_threshold, output_tail_size, output_capture,
+        check_picklability, result_store_threshold, result_store_directory, freeze_gc, measure_memory,
+        result_cache, skip_up_to_date, up_to_date_hashes, journal, resume_from, executor, deadline,
+    ):
         self.cpu_cores = cpu_cores
         self.keep_going = keep_going
         self.do_raise = do_raise
-        self.hooks = hooks
+        self.hooks = _CoroutineHooks(hooks)
+        self.thread_slots = thread_slots
+        self.duration_estimates = duration_estimates
+        self.output_flush_interval = output_flush_interval
+        self.output_flush_size = output_flush_size
+        self.output_spill_threshold = output_spill_threshold
+        self.output_tail_size = output_tail_size
+        self.output_capture = output_capture
+        self.check_picklability = check_picklability
+        self.result_store_threshold = result_store_threshold
+        self.result_store_directory = result_store_directory
+        self.freeze_gc = freeze_gc
+        self.measure_memory = measure_memory
+        self.result_cache = result_cache
+        self.skip_up_to_date = skip_up_to_date
+        self.up_to_date_hashes = up_to_date_hashes
+        self.journal = journal
+        self.resume_from = resume_from
+        self.executor = executor
+        self.deadline = deadline
+
+    def __getstate__(self):
+        # Only what's needed by _execute_action is sent to processes started by a fork server and to agents
+        return {
+            name: self.__dict__[name]
+            for name in (
+                "output_flush_interval", "output_flush_size", "output_capture",
+                "result_store_threshold", "result_store_directory", "measure_memory",
+            )
+        }
 
-    def run(self, root_action):
+    def run(self, root_action, actions=None):
+        try:
+            now = self._start(root_action, actions)
+            while self.pending or self.ready or self.running:
+                self._progress(now)
+                now = datetime.datetime.now()
+        finally:
+            self._stop()
+        return self._finish()
+
+    async def run_async(self, root_action, actions=None):
+        self.loop = asyncio.get_event_loop()
+        self.hooks.in_event_loop = True
+        try:
+            now = self._start(root_action, actions)
+            # The selector's file descriptor becomes readable when any of its registered pipes is readable
+            readable = asyncio.Event()
+            self.loop.add_reader(self.events.selector.fileno(), readable.set)
+            await self.hooks.run_pending()
+            while self.pending or self.ready or self.running:
+                self._start_ready_actions(now)
+                await self.hooks.run_pending()
+                if self.running:
+                    try:
+                        await asyncio.wait_for(readable.wait(), self._get_timer_delay())
+                    except asyncio.TimeoutError:
+                        pass
+                    readable.clear()
+                    for event in self.events.get(timeout=0):
+                        self._handle_event(event)
+                        self._start_ready_actions(datetime.datetime.now())
+                        await self.hooks.run_pending()
+                    self._handle_expired_timers()
+                    await self.hooks.run_pending()
+                now = datetime.datetime.now()
+        finally:
+            if self.events is not None:
+                self.loop.remove_reader(self.events.selector.fileno())
+            self._stop()
+        return self._finish()
+
+    def _start(self, root_action, actions):
         now = datetime.datetime.now()
 
+        # What _stop releases, so that it can clean up after a failure in the middle of _start
+        self.running = set()
+        self.stream_fds = {}
+        self.timed_out = set()
+        self.coroutine_tasks = {}
+        self.events = None
+        self.executor_opened = False
+        self.journal_writer = None
+        self.thread_pools = []
+        self.capture_in_process = False
+        self.gc_frozen = False
+        self.file_states = None
+
         # Pre-process actions
-        self._check_picklability(root_action)
-        actions = root_action.get_possible_execution_order()
-        self.actions_by_id = {id(action): action for action in actions}
-        self.dependents = {action: set() for action in actions}
-        for action in actions:
-            for dependency in action.dependencies:
-                self.dependents[dependency].add(action)
+        if actions is None:
+            actions = root_action.get_possible_execution_order()
+        self._check_actions_picklability(actions)
+        self.actions_by_id = {}
+        self.dependencies = {}
+        self.dependents = {}
+        # Number of dependencies not done yet: an action is ready when it reaches zero
+        self.remaining_dependencies = {}
+        self.resources_required = {}
+        # Incremented each time actions are added by an Expansion
+        self.generation = 0
+        self.action_generations = {}
+        self.cache_keys = {}
+        if self.result_cache is not None:
+            self.result_cache._open()
+        self.file_states = self._make_file_states(actions)
+        self.identities = {}
+        self.identity_occurrences = collections.Counter()
+        self.resumed_records = {} if self.resume_from is None else _read_journal(self.resume_from)
+        self.resumed_results = {}
+        # Streaming dependencies, and file descriptors of the pipes opened when producers start, by (producer, consumer)
+        self.stream_producers = {}
+        self.stream_consumers = {}
+        self.pending = set()
+        self.ready = set()
+        self.done = set()
+        self._check_streams(actions)
+        self._add_actions(actions)
 
         # Misc stuff
-        self.report = ExecutionReport(root_action, actions, now)
+        self.report = ExecutionReport(
+            root_action, actions, now, self.output_spill_threshold, self.output_tail_size,
+        )
         for action in actions:
             self.hooks.action_pending(now, action)
-        self.events = multiprocessing.Queue()
+        self.events = _Events()
+        self.executor.open(ExecutorContext(self))
+        self.executor_opened = True
+        self.journal_writer = None if self.journal is None else _JournalWriter(self.journal)
+        self.journal_is_resumed = (
+            self.journal_writer is not None and self.resume_from is not None and
+            os.path.exists(self.resume_from) and os.path.samefile(self.journal, self.resume_from)
+        )
         self.exceptions = []
         self.resources_used = {}
+        # Thread pools, the last one being used: see _prepare_in_process_execution
+        self.thread_pool_size = 0
+        self.threaded_actions = 0
+        self.current_output = _in_process_capture.current_output
+        self._prepare_in_process_execution(actions)
 
         # Actions by status
-        self.pending = set(actions)
-        self.ready = set()
-        self.running = set()
-        self.done = set()
+        self.priorities = {}
+        self._compute_priorities(actions)
+        self.ready_queue = []
+        self.ready_sequence = itertools.count()
+        # By resource, then by quantity of this resource required by the waiting actions
+        self.waiting_queues = {}
+        self.postponed_queue = []
+        self.waiting_producers = []
+        # Ready actions whose results are not known, see _skip_known_action
+        self.not_skipped = set()
+        # Expiry times (in time.monotonic), with None for the deadline of the execution
+        self.timers = []
+        self.timer_sequence = itertools.count()
+        self.timeouts = {}
+        if self.deadline is not None:
+            if isinstance(self.deadline, datetime.datetime):
+                delay = (self.deadline - now).total_seconds()
+            else:
+                delay = self.deadline
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self.timer_sequence), None))
         for action in actions:
-            if not action.dependencies:
+            if self.remaining_dependencies[action] == 0:
                 self._prepare_action(action, now)
 
-        # Execute
-        while self.pending or self.ready or self.running:
-            self._progress(now)
-            now = datetime.datetime.now()
+        # Objects created before forking stay in the permanent generation, so forked processes don't scan them
+        # Objects frozen by the caller (or by another execution) can't be told apart from ours: they stay frozen
+        self.gc_frozen = self.freeze_gc and hasattr(gc, "freeze") and gc.get_freeze_count() == 0
+        if self.gc_frozen:
+            gc.freeze()
+
+        return now
 
+    def _add_actions(self, actions):
+        # Dependencies are before their dependents in a possible execution order
+        for action in actions:
+            self.actions_by_id[id(action)] = action
+            self.dependencies[action] = list(set(action.dependencies))
+            self.dependents[action] = set()
+            for dependency in self.dependencies[action]:
+                self.dependents[dependency].add(action)
+            self.remaining_dependencies[action] = len([d for d in self.dependencies[action] if d not in self.done])
+            self.resources_required[action] = dict(action.resources_required)
+            self.action_generations[action] = self.generation
+            self.stream_producers[action] = set(action.stream_dependencies)
+            self.stream_consumers[action] = set()
+            for producer in self.stream_producers[action]:
+                self.stream_consumers[producer].add(action)
+        self.pending.update(actions)
+        self._compute_cache_keys(actions)
+        self._compute_identities(actions)
+        self._get_resumed_results(actions)
+
+    def _prepare_in_process_execution(self, actions):
+        self.threaded_actions += len([action for action in actions if action.execute_in_thread])
+        max_workers = self.threaded_actions
+        if self.thread_slots is not UNLIMITED:
+            max_workers = max(1, min(max_workers, self.thread_slots))
+        if self.threaded_actions and max_workers > self.thread_pool_size:
+            # Actions added by expansions may need more threads. A larger pool replaces the current one,
+            # whose threads finish executing their actions.
+            if self.thread_pools:
+                self.thread_pools[-1].shutdown(wait=False)
+            self.thread_pools.append(concurrent.futures.ThreadPoolExecutor(max_workers=max_workers))
+            self.thread_pool_size = max_workers
+        if not self.capture_in_process and any(
+            action.execute_in_thread or action.execute_inline or _is_coroutine_action(action)
+            for action in actions
+        ):
+            self.capture_in_process = True
+            _in_process_capture.start()
+
+    def _expand(self, action, added_actions, now):
+        # Added actions and their dependencies that are not in the execution yet
+        actions = []
+        seen_actions = set(self.dependencies)
+        for added_action in added_actions:
+            actions += added_action.get_possible_execution_order(seen_actions)
+        if any(_is_coroutine_action(a) for a in actions) and not hasattr(self, "loop"):
+            raise ValueError("Actions whose do_execute is a coroutine function can only be added by execute_async")
+        self._check_actions_picklability(actions)
+        self._check_streams(actions)
+        # Actions of the execution the added actions depend on must not depend on the expanded action
+        referenced_actions = set(
+            dependency
+            for a in actions
+            for dependency in a.dependencies
+            if dependency in self.dependencies
+        )
+        referenced_actions.update(a for a in added_actions if a in self.dependencies)
+        if referenced_actions:
+            dependents = set()
+            stack = [action]
+            while stack:
+                for dependent in self.dependents[stack.pop()]:
+                    if dependent not in dependents:
+                        dependents.add(dependent)
+                        stack.append(dependent)
+            if not dependents.isdisjoint(referenced_actions):
+                raise DependencyCycleException()
+
+        pending_dependents = [dependent for dependent in self.dependents[action] if dependent in self.pending]
+        self.generation += 1
+        self._add_actions(actions)
+        self.report._add_actions(actions, now)
+        for dependent in pending_dependents:
+            for added_action in added_actions:
+                if dependent not in self.dependents[added_action]:
+                    self.dependencies[dependent].append(added_action)
+                    self.dependents[added_action].add(dependent)
+                    if added_action not in self.done:
+                        self.remaining_dependencies[dependent] += 1
+        self._compute_priorities(actions)
+        self._prepare_in_process_execution(actions)
+        for added_action in actions:
+            self.hooks.action_pending(now, added_action)
+        for added_action in actions:
+            if added_action not in self.pending:
+                # Canceled while triaging other added actions
+                continue
+            failed = any(
+                self.report.get_action_status(dependency).status != SUCCESSFUL
+                for dependency in self.dependencies[added_action]
+                if dependency in self.done
+            )
+            if failed and not added_action.accept_failed_dependencies:
+                self._cancel_action(added_action, now)
+            elif self.remaining_dependencies[added_action] == 0:
+                self._prepare_action(added_action, now)
+
+    def _stop(self):
+        # Actions are still running only if the execution is interrupted by an exception (or cancelled)
+        for action in self.running:
+            if self._executes_in_own_process(action):
+                self.executor.cancel_action(action)
+            elif _is_coroutine_action(action):
+                self._cancel_coroutine_task(action)
+        if self.executor_opened:
+            self.executor.close()
+        for (producer, consumer) in self.stream_fds:
+            self._close_stream_end(producer, consumer, 0)
+            self._close_stream_end(producer, consumer, 1)
+        # Threads of actions that timed out are abandoned
+        for thread_pool in self.thread_pools:
+            thread_pool.shutdown(wait=not any(action.execute_in_thread for action in self.timed_out))
+        if self.capture_in_process:
+            _in_process_capture.stop()
+        self.hooks.close()
+        if self.events is not None:
+            self.events.close()
+        if self.gc_frozen:
+            gc.unfreeze()
+        if self.file_states is not None:
+            self.file_states.save()
+        if self.journal_writer is not None:
+            self.journal_writer.close()
+
+    def _finish(self):
         for w in multiprocessing.active_children():
             w.join()
 
@@ -828,129 +3523,797 @@ class _Execute(object):
             self._change_status(action, self.pending, self.done)
         else:
             self._change_status(action, self.ready, self.done)
+        self._release_streams(action)
 
         if not self.keep_going:
-            for d in action.dependencies:
+            for d in self.dependencies[action]:
                 if d in self.pending or d in self.ready:
                     self._cancel_action(d, now)
         self._triage_pending_dependents(action, True, now)
 
     def _triage_pending_dependents(self, action, failed, now):
-        for dependent in self.pending & self.dependents[action]:
-            if failed and not dependent.accept_failed_dependencies:
-                self._cancel_action(dependent, now)
-            elif all(d in self.done for d in dependent.dependencies):
-                self._prepare_action(dependent, now)
+        self._wake_waiting_producers()
+        for dependent in self.dependents[action]:
+            # Dependents may have been canceled while iterating
+            if dependent in self.pending:
+                if (action, dependent) not in self.stream_fds:
+                    # Streaming dependencies are counted when they start
+                    self.remaining_dependencies[dependent] -= 1
+                if failed and not dependent.accept_failed_dependencies:
+                    self._cancel_action(dependent, now)
+                elif self.remaining_dependencies[dependent] == 0:
+                    self._prepare_action(dependent, now)
+
+    def _compute_priorities(self, actions):
+        # Critical path scheduling: the priority of an action is the expected duration of the longest path
+        # from this action to the root action. Starting actions with the highest priority first
+        # avoids idle CPU cores at the end of the execution, waiting for a long chain of actions.
+        estimates = {}
+        if isinstance(self.duration_estimates, ExecutionReport):
+            durations_by_label = {}
+            for (action, status) in self.duration_estimates.get_actions_and_statuses():
+                if status.start_time is not None:
+                    duration = ((status.success_time or status.failure_time) - status.start_time).total_seconds()
+                    estimates[action] = duration
+                    durations_by_label.setdefault(action.label, []).append(duration)
+            for action in actions:
+                if action not in estimates and len(durations_by_label.get(action.label, [])) == 1:
+                    estimates[action] = durations_by_label[action.label][0]
+        elif self.duration_estimates is not None:
+            estimates = self.duration_estimates
+        if estimates:
+            default_estimate = sum(estimates.values()) / len(estimates)
+        else:
+            default_estimate = 1
+
+        # Dependents are after their dependencies in a possible execution order
+        for action in reversed(actions):
+            self.priorities[action] = estimates.get(action, default_estimate) + max(
+                (self.priorities[dependent] for dependent in self.dependents[action]),
+                default=0,
+            )
 
     def _prepare_action(self, action, now):
         self.report.get_action_status(action)._set_ready_time(now)
         self.hooks.action_ready(now, action)
 
         self._change_status(action, self.pending, self.ready)
+        heapq.heappush(self.ready_queue, (-self.priorities[action], next(self.ready_sequence), action))
+        if self.stream_consumers[action]:
+            # Other producers of the same consumers may now start
+            self._wake_waiting_producers()
 
     def _progress(self, now):
-        # @todo Should we tweak the scheduling?
-        # We could prioritize the actions that use many resources,
-        # hoping that this would avoid idle CPU cores at the end of the execution.
-        # Scheduling is a hard problem, we may just want to keep the current, random, behavior.
-        for action in set(self.ready):
-            if self._allocate_resources(action):
-                self._start_action(action, now)
-        self._handle_next_event()
+        self._start_ready_actions(now)
+        # Actions executed inline may have completed everything
+        if self.running:
+            for event in self.events.get(self._get_timer_delay()):
+                self._handle_event(event)
+                # Start dependents as soon as possible, without waiting for the rest of the batch
+                self._start_ready_actions(datetime.datetime.now())
+            self._handle_expired_timers()
+
+    def _get_timer_delay(self):
+        # Seconds until the next timer expires, or None
+        if self.timers:
+            return max(0, self.timers[0][0] - time.monotonic())
+        else:
+            return None
+
+    def _start_timer(self, action):
+        if action.timeout is not None:
+            expiry = time.monotonic() + action.timeout
+            # Timers of previous executions of restarted actions are obsolete
+            self.timeouts[action] = expiry
+            heapq.heappush(self.timers, (expiry, next(self.timer_sequence), action))
+
+    def _handle_expired_timers(self):
+        while self.timers and self.timers[0][0] <= time.monotonic():
+            (expiry, _, action) = heapq.heappop(self.timers)
+            now = datetime.datetime.now()
+            if action is None:
+                self._stop_at_deadline(now)
+            elif action in self.running and self.timeouts[action] == expiry:
+                self._time_out(action, now, TimeoutError(
+                    "Action {!r} timed out after {} seconds".format(action.label, action.timeout),
+                ))
+
+    def _stop_at_deadline(self, now):
+        for action in list(self.running):
+            self._time_out(action, now, TimeoutError("Execution reached its deadline"))
+        for action in list(self.pending) + list(self.ready):
+            # Actions may be canceled with their dependents
+            if action in self.pending or action in self.ready:
+                self._cancel_action(action, now)
+
+    def _time_out(self, action, now, exception):
+        self.timed_out.add(action)
+        if self._executes_in_own_process(action):
+            self.executor.cancel_action(action)
+        elif _is_coroutine_action(action):
+            self._cancel_coroutine_task(action)
+        # Actions executing in threads can't be stopped: they are abandoned
+        self._handle_failed_event(action, now, exception)
+
+    def _cancel_coroutine_task(self, action):
+        # The task may be done already, its end event not being handled yet
+        task = self.coroutine_tasks.pop(action, None)
+        if task is not None:  # pragma no branch
+            task.cancel()
+
+    def _start_ready_actions(self, now):
+        # self.ready_queue only contains actions that just became ready or that may now fit in released resources.
+        # Actions that don't fit wait in the queue of a resource they are blocked on, until it's released.
+        while self.ready_queue:
+            item = heapq.heappop(self.ready_queue)
+            action = item[2]
+            # Canceled actions are not removed from the queues
+            if action in self.ready:
+                if self._streams_to_pending_consumers(action):
+                    # Producers are executed again for their streams
+                    if not self._consumers_can_start(action):
+                        self.waiting_producers.append(item)
+                        continue
+                elif action not in self.not_skipped:
+                    # Actions waiting for resources are popped again: their cache and files are checked only once
+                    if self._skip_known_action(action, now):
+                        continue
+                    self.not_skipped.add(action)
+                if self._is_awaited_by_stream(action):
+                    resource = None
+                else:
+                    resource = self._get_blocking_resource(action)
+                if resource is None:
+                    if self._executes_in_own_process(action) and not self.executor.can_start_action(action):
+                        heapq.heappush(self.postponed_queue, item)
+                        continue
+                    self._allocate_resources(action)
+                    self._start_action(action, now)
+                else:
+                    self._push_waiting_action(resource, item)
+
+    def _skip_known_action(self, action, now):
+        # Return True if the action was skipped because its result is already known
+        if action in self.resumed_results:
+            (return_value, stored, (output_offset, output_size)) = self.resumed_results[action]
+            if stored is not None:
+                (offset, (data_size, buffer_sizes)) = stored
+                return_value = _StoredValue.extract(
+                    self.resume_from, offset, data_size, buffer_sizes, self.result_store_directory,
+                )
+                return_value.own()
+            output = _read_journal_output(self.resume_from, output_offset, output_size)
+            self._skip_action(action, now, RESUMED, return_value, output)
+            return True
+        return (
+            action in self.cache_keys and self._skip_cached_action(action, now) or
+            self.file_states is not None and self._skip_up_to_date_action(action, now)
+        )
 
-    def _allocate_resources(self, action):
-        for (resource, quantity) in action.resources_required:
+    def _compute_cache_keys(self, actions):
+        if self.result_cache is None:
+            return
+        # Dependencies are before their dependents in a possible execution order
+        for action in actions:
+            fingerprint = action.get_fingerprint({d: self.cache_keys.get(d) for d in self.dependencies[action]})
+            if fingerprint is not None:
+                if isinstance(fingerprint, str):
+                    fingerprint = fingerprint.encode("utf8")
+                digest = hashlib.sha256()
+                digest.update("{}.{}".format(type(action).__module__, type(action).__qualname__).encode("utf8"))
+                digest.update(b"\0")
+                digest.update(fingerprint)
+                self.cache_keys[action] = digest.hexdigest()
+
+    def _compute_identities(self, actions):
+        if self.journal is None and self.resume_from is None:
+            return
+        # Dependencies are before their dependents in a possible execution order
+        for action in actions:
+            digest = hashlib.sha256()
+            digest.update("{}.{}\0{!r}".format(
+                type(action).__module__, type(action).__qualname__, action.label,
+            ).encode("utf8"))
+            for dependency_identity in sorted(self.identities[d] for d in self.dependencies[action]):
+                digest.update(b"\0")
+                digest.update(dependency_identity.encode("utf8"))
+            identity = digest.hexdigest()
+            # Identical actions are distinguished by their order, which is stable for the same graph
+            self.identity_occurrences[identity] += 1
+            self.identities[action] = "{}-{}".format(identity, self.identity_occurrences[identity])
+
+    def _get_resumed_results(self, actions):
+        for action in actions:
+            if action in self.identities and self.identities[action] in self.resumed_records:
+                self.resumed_results[action] = self.resumed_records[self.identities[action]]
+
+    def _record_in_journal(self, action):
+        if self.journal_writer is not None:
+            status = self.report.get_action_status(action)
+            # Stored return values and spilled outputs are copied from their files by the journal's thread
+            output = status._get_raw("output")
+            output = output.get() if output.path is None else output.path
+            self.journal_writer.append((self.identities[action], status._get_raw("return_value"), output))
+
+    def _skip_cached_action(self, action, now):
+        cached = self.result_cache._get(self.cache_keys[action])
+        if cached is None:
+            return False
+        (return_value, output) = cached
+        self._skip_action(action, now, CACHED, return_value, [output])
+        return True
+
+    def _make_file_states(self, actions):
+        if not self.skip_up_to_date:
+            return None
+        paths = set()
+        for action in actions:
+            paths.update(action.input_paths)
+            paths.update(action.output_paths)
+        # All paths are stat'ed in a single pass, sorted so that paths in the same directory are stat'ed together.
+        # Then, only outputs of executed actions are stat'ed again.
+        return _FileStates(sorted(paths), self.up_to_date_hashes)
+
+    def _skip_up_to_date_action(self, action, now):
+        output_paths = action.output_paths
+        if output_paths and self.file_states.is_up_to_date(action.input_paths, output_paths):
+            self._skip_action(action, now, UP_TO_DATE, None, [])
+            return True
+        return False
+
+    def _update_file_states(self, action, succeeded):
+        output_paths = action.output_paths
+        self.file_states.forget(output_paths)
+        if succeeded and output_paths:
+            self.file_states.record(action.input_paths, output_paths)
+
+    def _skip_action(self, action, now, reason, return_value, output_chunks):
+        status = self.report.get_action_status(action)
+        status._set_skipped(now, reason, return_value, output_chunks)
+        if self.hooks.overrides("action_skipped"):
+            self.hooks.action_skipped(now, action, reason, status.return_value)
+        # Actions resumed from the journal being appended to are already recorded in it
+        if reason != RESUMED or not self.journal_is_resumed:
+            self._record_in_journal(action)
+
+        self._change_status(action, self.ready, self.done)
+        self._release_streams(action)
+        self._triage_pending_dependents(action, False, now)
+
+    def _executes_in_own_process(self, action):
+        return not (_is_coroutine_action(action) or action.execute_in_thread or action.execute_inline)
+
+    def _wake_postponed_actions(self, count):
+        for i in range(count):
+            if not self.postponed_queue:
+                break
+            heapq.heappush(self.ready_queue, heapq.heappop(self.postponed_queue))
+
+    def _get_blocking_resource(self, action, woken=None):
+        # woken: quantities of resources required by actions woken up but not started yet
+        for (resource, quantity) in self.resources_required[action].items():
             used = self.resources_used.setdefault(resource, 0)
+            if woken is not None:
+                used += woken.get(resource, 0)
             if used == 0:
                 # Allow actions requiring more than available to run when they are alone requiring this resource
                 continue
-            availability = resource._availability(self.cpu_cores)
+            availability = resource._availability(self)
             if availability is UNLIMITED:
                 # Don't check usage of unlimited resources
                 continue
             if used + quantity > availability:
-                return False
-        for (resource, quantity) in action.resources_required:
+                return resource
+        return None
+
+    def _allocate_resources(self, action):
+        for (resource, quantity) in self.resources_required[action].items():
             self.resources_used[resource] += quantity
-        return True
 
     def _start_action(self, action, now):
         self.report.get_action_status(action)._set_start_time(now)
         self.hooks.action_started(now, action)
 
-        dependency_statuses = {d: self.report.get_action_status(d) for d in action.dependencies}
-        p = multiprocessing.Process(
-            target=self._run_action,
-            kwargs=dict(action=action, action_id=id(action), dependency_statuses=dependency_statuses)
-        )
-        p.start()
+        dependency_statuses = _DependencyStatuses(self.dependencies[action], self.report.get_action_status)
+        if _is_coroutine_action(action):
+            self.coroutine_tasks[action] = self.loop.create_task(
+                self._run_coroutine_action(action, id(action), dependency_statuses),
+            )
+        elif action.execute_in_thread:
+            if action.timeout is None:
+                self.thread_pools[-1].submit(self._run_action_in_thread, action, id(action), dependency_statuses)
+            else:
+                # The thread is abandoned if the action times out: it would be lost for the pool's other actions
+                thread = threading.Thread(
+                    target=self._run_action_in_thread, args=(action, id(action), dependency_statuses),
+                )
+                thread.daemon = True
+                thread.start()
+        elif action.execute_inline:
+            self._change_status(action, self.ready, self.running)
+            self._run_action_inline(action, dependency_statuses)
+            return
+        else:
+            self._open_streams(action)
+            self.executor.start_action(action)
+            # Ends of the streams are now in the process executing the action
+            self._release_streams(action)
         self._change_status(action, self.ready, self.running)
+        self._start_timer(action)
+        self._triage_stream_consumers(action, now)
+
+    def _check_streams(self, actions):
+        for action in actions:
+            for producer in action.stream_dependencies:
+                if not (self._executes_in_own_process(producer) and self._executes_in_own_process(action)):
+                    raise ValueError("Actions {!r} and {!r} must execute in their own process to stream".format(
+                        producer.label, action.label,
+                    ))
+                if producer in self.running or producer in self.done:
+                    raise ValueError("Action {!r} can't stream from {!r}, which has already started".format(
+                        action.label, producer.label,
+                    ))
+                if self._depends_regularly(action, producer):
+                    raise ValueError("Action {!r} can't stream from {!r}, on which it also depends indirectly".format(
+                        action.label, producer.label,
+                    ))
+
+    def _depends_regularly(self, consumer, producer):
+        # True if the consumer depends on the producer through a path including a regular (not streamed) dependency:
+        # the producer would wait for the consumer to start, and the consumer for the producer to succeed
+        seen = set()
+        stack = [(consumer, False)]
+        while stack:
+            (action, regular) = stack.pop()
+            for dependency in action.dependencies:
+                item = (dependency, regular or dependency not in action.stream_dependencies)
+                if item == (producer, True):
+                    return True
+                if item not in seen:
+                    seen.add(item)
+                    stack.append(item)
+        return False
+
+    def _has_streams(self, action):
+        return bool(self.stream_producers[action] or self.stream_consumers[action])
+
+    def _streams_to_pending_consumers(self, action):
+        return any(consumer not in self.done for consumer in self.stream_consumers[action])
+
+    def _consumers_can_start(self, action):
+        # A producer blocks when its consumers don't read, so it only starts when its pending consumers
+        # can start with it: when they only wait for producers that are ready or running
+        for consumer in self.stream_consumers[action]:
+            if consumer in self.pending:
+                for dependency in self.dependencies[consumer]:
+                    if dependency not in self.done and not (
+                        dependency in self.stream_producers[consumer] and
+                        (dependency in self.ready or dependency in self.running)
+                    ):
+                        return False
+        return True
+
+    def _wake_waiting_producers(self):
+        for item in self.waiting_producers:
+            heapq.heappush(self.ready_queue, item)
+        self.waiting_producers = []
+
+    def _is_awaited_by_stream(self, action):
+        # Consumers, and producers of consumers already fed by another producer, don't wait for resources,
+        # because running producers wait for them
+        return bool(self.stream_producers[action]) or any(
+            (producer, consumer) in self.stream_fds
+            for consumer in self.stream_consumers[action]
+            for producer in self.stream_producers[consumer]
+        )
+
+    def _open_streams(self, action):
+        for consumer in self.stream_consumers[action]:
+            if consumer not in self.done:
+                self.stream_fds[(action, consumer)] = list(os.pipe())
+
+    def _triage_stream_consumers(self, action, now):
+        # Consumers don't wait for the end of their producers
+        for consumer in self.stream_consumers[action]:
+            if consumer in self.pending and (action, consumer) in self.stream_fds:
+                self.remaining_dependencies[consumer] -= 1
+                if self.remaining_dependencies[consumer] == 0:
+                    self._prepare_action(consumer, now)
+
+    def _make_streams(self, action):
+        # Ends of the streams of action: senders to its consumers,
+        # and readers from its producers aligned with its dependencies (None for other dependencies).
+        # Pickling them duplicates their file descriptors for the process executing the action.
+        stream_senders = []
+        for consumer in self.stream_consumers[action]:
+            fds = self.stream_fds.get((action, consumer))
+            if fds is not None and fds[1] is not None:
+                stream_senders.append(_EventSender(fds[1]))
+        stream_readers = []
+        for dependency in self.dependencies[action]:
+            if dependency in self.stream_producers[action]:
+                fds = self.stream_fds.get((dependency, action))
+                stream_readers.append(_StreamReader(None if fds is None else fds[0], dependency.label))
+            else:
+                stream_readers.append(None)
+        return (stream_senders, stream_readers)
+
+    def _release_streams(self, action):
+        for consumer in self.stream_consumers[action]:
+            self._close_stream_end(action, consumer, 1)
+        for producer in self.stream_producers[action]:
+            self._close_stream_end(producer, action, 0)
+
+    def _close_stream_end(self, producer, consumer, end):
+        fds = self.stream_fds.get((producer, consumer))
+        if fds is not None and fds[end] is not None:
+            os.close(fds[end])
+            fds[end] = None
+
+    def _close_other_streams(self, action):
+        # Processes forked from the process calling execute inherit the ends of all streams, but a producer
+        # must see when its consumers stop reading, and a consumer when its producers exit
+        for (producer, consumer) in self.stream_fds:
+            if consumer is not action:
+                self._close_stream_end(producer, consumer, 0)
+            if producer is not action:
+                self._close_stream_end(producer, consumer, 1)
+
+    def _get_transferred_values(self, action):
+        # Sent eagerly in tasks. Stored return values and spilled outputs are in files of this machine.
+        status = self.report.get_action_status(action)
+        output = status.output
+        if output is not None:
+            storage = _OutputStorage(None, None)
+            storage.append(output)
+            output = storage
+        return {
+            "return_value": status.return_value,
+            "exception": status.exception,
+            "output": output,
+            "skip_reason": status.skip_reason,
+        }
+
+    def _run_action_in_fork_server(
+        self, action_data, action_id, dependency_ids, dependency_times, events, answers, stream_senders, stream_readers,
+    ):
+        _lead_process_group(0)
+        (action, dependencies) = _ShallowUnpickler(io.BytesIO(action_data)).load()
+        dependency_statuses = self._make_fetched_dependency_statuses(
+            action_id, dependencies, dependency_ids, dependency_times, events, answers, stream_readers,
+        )
+        event = self._execute_action(action, action_id, dependency_statuses, events, stream_senders)
+        self._send_end_event(events, event)
+
+    def _make_fetched_dependency_statuses(
+        self, action_id, dependencies, dependency_ids, dependency_times, events, answers, stream_readers,
+    ):
+        # Heavy attributes of statuses are requested with FETCH events, and received through "answers"
+        ids_and_times = {d: (i, t) for (d, i, t) in zip(dependencies, dependency_ids, dependency_times)}
+
+        def get_status(dependency):
+            (dependency_id, times) = ids_and_times[dependency]
 
-    def _run_action(self, action, action_id, dependency_statuses):
+            def fetch(attribute):
+                events.send((FETCH, action_id, (dependency_id, attribute)))
+                return answers.recv()
+
+            return _FetchedActionStatus(times, fetch)
+
+        return _DependencyStatuses(dependencies, get_status, dependency_ids, stream_readers)
+
+    def _run_action(self, action, action_id, dependency_statuses, events, stream_senders):
+        if self.freeze_gc and hasattr(gc, "freeze"):
+            # Objects inherited from the process calling execute are not scanned by the garbage collector,
+            # which still collects the garbage of the action
+            gc.freeze()
+        event = self._execute_action(action, action_id, dependency_statuses, events, stream_senders)
+        self._send_end_event(events, event)
+
+    def _run_action_inline(self, action, dependency_statuses):
         return_value = exception = None
-        (pipe_r, pipe_w) = os.pipe()
-        sys.stdout.flush()
-        libc.fflush(stdout)
-        os.dup2(pipe_w, 1)
-        sys.stderr.flush()
-        libc.fflush(stderr)
-        os.dup2(pipe_w, 2)
-        os.close(pipe_w)
-        thread = threading.Thread(target=self._read_to_events, kwargs=dict(action_id=action_id, pipe_r=pipe_r))
-        thread.daemon = True
-        thread.start()
+        output = self._make_thread_output(
+            action, lambda print_time, data: self._handle_printed_event(action, print_time, data),
+        )
+        self.current_output.set(output)
+        try:
+            result = action.do_execute(dependency_statuses)
+            if inspect.isgenerator(result):
+                result = self._send_chunks(result, [])
+            return_value = result
+        except BaseException as e:
+            exception = e
+        finally:
+            self.current_output.set(None)
+        if output is not None:
+            output.close()
+        self._check_picklability((exception, return_value))
+        end_time = datetime.datetime.now()
+        if exception:
+            self._handle_failed_event(action, end_time, exception)
+        else:
+            self._handle_successful_event(action, end_time, return_value)
+
+    def _run_action_in_thread(self, action, action_id, dependency_statuses):
+        return_value = exception = None
+        output = self._make_thread_output(
+            action, lambda print_time, data: self.events.put_local((PRINTED, action_id, (print_time, data))),
+        )
+        self.current_output.set(output)
+        try:
+            result = action.do_execute(dependency_statuses)
+            if inspect.isgenerator(result):
+                result = self._send_chunks(result, [])
+            return_value = result
+        except BaseException as e:
+            exception = e
+        self.current_output.set(None)
+        if output is not None:
+            output.close()
+        self.events.put_local(self._make_end_event(action_id, return_value, exception))
+
+    async def _run_coroutine_action(self, action, action_id, dependency_statuses):
+        return_value = exception = None
+        output = self._make_thread_output(
+            action, lambda print_time, data: self.events.put_local((PRINTED, action_id, (print_time, data))),
+        )
+        # The task runs in its own copy of the context, so this doesn't affect other tasks
+        self.current_output.set(output)
+        try:
+            return_value = await action.do_execute(dependency_statuses)
+        except BaseException as e:
+            # Including asyncio.CancelledError, which doesn't derive from Exception since Python 3.8
+            exception = e
+        self.current_output.set(None)
+        if output is not None:
+            output.close()
+        # Tasks canceled by the execution (on timeout, or when it's interrupted) are forgotten
+        if self.coroutine_tasks.pop(action, None) is not None:
+            self.events.put_local(self._make_end_event(action_id, return_value, exception))
+
+    def _execute_action(self, action, action_id, dependency_statuses, events, stream_senders):
+        return_value = exception = None
+        output_capture = self._get_output_capture(action)
+        if output_capture == CAPTURE:
+            (pipe_r, pipe_w) = os.pipe()
+            _redirect_outputs(pipe_w)
+            os.close(pipe_w)
+            (flush_interval, flush_size) = self._get_output_flush_settings(action)
+            thread = threading.Thread(
+                target=self._read_to_events,
+                kwargs=dict(
+                    action_id=action_id, pipe_r=pipe_r, events=events,
+                    flush_interval=flush_interval, flush_size=flush_size,
+                ),
+            )
+            thread.daemon = True
+            thread.start()
+        elif output_capture == DISCARD:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            _redirect_outputs(devnull)
+            os.close(devnull)
         try:
-            return_value = action.do_execute(dependency_statuses)
+            result = action.do_execute(dependency_statuses)
+            if inspect.isgenerator(result):
+                result = self._send_chunks(result, stream_senders)
+            return_value = result
         except BaseException as e:
             exception = e
-        sys.stdout.flush()
-        libc.fflush(stdout)
-        os.close(1)
-        sys.stderr.flush()
-        libc.fflush(stderr)
-        os.close(2)
-        thread.join()
-        os.close(pipe_r)
+        # Consumers see the end of the stream, and producers that this consumer stopped reading
+        for sender in stream_senders:
+            sender.close()
+        dependency_statuses._close_streams()
+        _flush_outputs()
+        if output_capture == CAPTURE:
+            os.close(1)
+            os.close(2)
+            thread.join()
+            os.close(pipe_r)
+        private_memory = _get_private_memory() if self.measure_memory else None
+        if isinstance(return_value, Expansion):
+            try:
+                return_value = _PickledExpansion(
+                    return_value, self._get_action_ids(action, action_id, dependency_statuses),
+                )
+            except BaseException:
+                return (PICKLING_EXCEPTION, action_id, ())
+        return self._make_serialized_end_event(action_id, return_value, exception, private_memory)
+
+    def _send_end_event(self, events, event):
+        # If the end of the action can't be sent, execute must still know that it ended, or it would wait forever
+        try:
+            events.send(event)
+        except Exception as e:
+            events.send((FAILED, event[1], (datetime.datetime.now(), e)))
+
+    def _send_chunks(self, chunks, stream_senders):
+        # Send what the generator yields to the consumers still reading, and return what it returns
+        stream_senders = list(stream_senders)
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as e:
+                return_value = e.value
+                break
+            for sender in list(stream_senders):
+                try:
+                    sender.send((chunk,))
+                except BrokenPipeError:
+                    stream_senders.remove(sender)
+        for sender in stream_senders:
+            try:
+                sender.send(())
+            except BrokenPipeError:
+                pass
+        return return_value
+
+    def _get_action_ids(self, action, action_id, dependency_statuses):
+        # Processes forked from the process calling execute have its actions at the same addresses,
+        # and others have copies of the executed action and its dependencies
+        action_ids = {i: i for i in getattr(self, "actions_by_id", {})}
+        action_ids.update(dependency_statuses._get_action_ids())
+        action_ids[id(action)] = action_id
+        return action_ids
+
+    def _make_serialized_end_event(self, action_id, return_value, exception, private_memory):
+        # Pickle the result only once, in the child process. It's unpickled in the parent process.
+        buffers = []
+        try:
+            if exception is None and self._must_store(return_value):
+                return_value = _StoredValue.store(return_value, self.result_store_directory)
+            data = _dumps((exception, return_value), buffers)
+        except BaseException:
+            return (PICKLING_EXCEPTION, action_id, ())
+        return (
+            SERIALIZED_RESULT, action_id,
+            (datetime.datetime.now(), [_out_of_band(data)] + [_out_of_band(b) for b in buffers], private_memory),
+        )
+
+    def _must_store(self, return_value):
+        if self.result_store_threshold is None:
+            return False
+        try:
+            return memoryview(return_value).nbytes > self.result_store_threshold
+        except TypeError:
+            return False
+
+    def _make_end_event(self, action_id, return_value, exception):
         try:
-            self._check_picklability((exception, return_value))
+            # Added actions are checked when they are added
+            self._check_picklability((
+                exception, return_value.return_value if isinstance(return_value, Expansion) else return_value,
+            ))
         except BaseException:
-            self.events.put((PICKLING_EXCEPTION, action_id, ()))
+            return (PICKLING_EXCEPTION, action_id, ())
         else:
             end_time = datetime.datetime.now()
             if exception:
-                self.events.put((FAILED, action_id, (end_time, exception)))
+                return (FAILED, action_id, (end_time, exception))
             else:
-                self.events.put((SUCCESSFUL, action_id, (end_time, return_value)))
+                return (SUCCESSFUL, action_id, (end_time, return_value))
+
+    def _get_output_capture(self, action):
+        return self.output_capture if action.output_capture is None else action.output_capture
+
+    def _make_thread_output(self, action, handle_printed):
+        output_capture = self._get_output_capture(action)
+        if output_capture == CAPTURE:
+            return _ThreadOutput(handle_printed, *self._get_output_flush_settings(action))
+        elif output_capture == DISCARD:
+            return _DiscardedOutput()
+        else:
+            # _ThreadLocalOutput writes to the original streams
+            return None
+
+    def _get_output_flush_settings(self, action):
+        return (
+            self.output_flush_interval if action.output_flush_interval is None else action.output_flush_interval,
+            self.output_flush_size if action.output_flush_size is None else action.output_flush_size,
+        )
 
-    def _read_to_events(self, action_id, pipe_r):
+    def _read_to_events(self, action_id, pipe_r, events, flush_interval, flush_size):
+        # Coalesce reads until flush_interval expires or flush_size bytes are buffered, and send them as one event
+        buffer = bytearray()
         while True:
-            data = os.read(pipe_r, 1024)
+            if buffer:
+                timeout = flush_interval - (time.monotonic() - first_read)
+                if timeout <= 0 or not select.select([pipe_r], [], [], timeout)[0]:
+                    events.send((PRINTED, action_id, (print_time, bytes(buffer))))
+                    del buffer[:]
+                    continue
+            data = os.read(pipe_r, min(flush_size - len(buffer), _OUTPUT_READ_SIZE))
             if len(data) == 0:
                 break
-            self.events.put((PRINTED, action_id, (datetime.datetime.now(), data)))
+            if not buffer:
+                first_read = time.monotonic()
+                print_time = datetime.datetime.now()
+            buffer += data
+            if len(buffer) >= flush_size:
+                events.send((PRINTED, action_id, (print_time, bytes(buffer))))
+                del buffer[:]
+        if buffer:
+            events.send((PRINTED, action_id, (print_time, bytes(buffer))))
 
     def _check_picklability(self, stuff):
-        # Fail fast: don't put a non-picklable object in a multiprocessing.Queue
+        # Fail fast: don't send a non-picklable object through a pipe
         pickle.loads(pickle.dumps(stuff))
 
-    def _handle_next_event(self):
-        (event_kind, action_id, event_payload) = self.events.get()
+    def _check_actions_picklability(self, actions):
+        if self.check_picklability is False:
+            return
+        elif self.check_picklability is not True:
+            actions = random.sample(actions, min(self.check_picklability, len(actions)))
+        pickler = _ShallowPickler()
+        for action in actions:
+            try:
+                _ShallowUnpickler(io.BytesIO(pickler.dumps(action, [action]))).load()
+            except Exception as e:
+                raise pickle.PicklingError("Action {!r} is not picklable: {!r}".format(action.label, e)) from e
+
+    def _handle_event(self, event):
+        (event_kind, action_id, event_payload) = event
+        action = self.actions_by_id[action_id]
+        if action in self.timed_out:
+            # Sent before the action was killed, or by an abandoned thread
+            return
         handlers = {
             SUCCESSFUL: self._handle_successful_event,
+            SERIALIZED_RESULT: self._handle_serialized_result_event,
+            FETCH: self._handle_fetch_event,
             PRINTED: self._handle_printed_event,
             FAILED: self._handle_failed_event,
             PICKLING_EXCEPTION: self._handle_pickling_exception_event,
+            LOST: self._handle_lost_event,
         }
-        handlers[event_kind](self.actions_by_id[action_id], *event_payload)
+        handlers[event_kind](action, *event_payload)
 
     def _handle_successful_event(self, action, success_time, return_value):
-        self.report.get_action_status(action)._set_success(success_time, return_value)
-        self.hooks.action_successful(success_time, action, return_value)
+        expanded = isinstance(return_value, Expansion)
+        if expanded:
+            try:
+                self._expand(action, return_value.actions, success_time)
+            except (DependencyCycleException, pickle.PicklingError, ValueError) as e:
+                self._handle_failed_event(action, success_time, e)
+                return
+            return_value = return_value.return_value
+        status = self.report.get_action_status(action)
+        status._set_success(success_time, return_value)
+        # Stored return values are loaded in this process only if they are used
+        if self.hooks.overrides("action_successful"):
+            self.hooks.action_successful(success_time, action, status.return_value)
+        # Added actions are not recorded: the action must be executed again to add them again
+        if action in self.cache_keys and not expanded:
+            self.result_cache._put(self.cache_keys[action], status.return_value, status.output)
+        if self.file_states is not None:
+            self._update_file_states(action, True)
+        if not expanded:
+            self._record_in_journal(action)
 
         self._change_status(action, self.running, self.done)
+        self._finish_in_executor(action)
         self._triage_pending_dependents(action, False, success_time)
         self._deallocate_resources(action)
 
+    def _handle_serialized_result_event(self, action, end_time, buffers, private_memory):
+        self.report.get_action_status(action)._set_private_memory(private_memory)
+        try:
+            (exception, return_value) = _loads(buffers[0], buffers[1:])
+            if isinstance(return_value, _PickledExpansion):
+                return_value = return_value.load(self.actions_by_id)
+        except BaseException:
+            self._handle_pickling_exception_event(action)
+        else:
+            if exception:
+                self._handle_failed_event(action, end_time, exception)
+            else:
+                if isinstance(return_value, _StoredValue):
+                    return_value.own()
+                self._handle_successful_event(action, end_time, return_value)
+
+    def _handle_fetch_event(self, action, dependency_id, attribute):
+        value = self.report.get_action_status(self.actions_by_id[dependency_id])._get_raw(attribute)
+        self.executor._answer_fetch(action, value)
+
     def _handle_printed_event(self, action, print_time, data):
         self.report.get_action_status(action)._add_output(data)
         self.hooks.action_printed(print_time, action, data)
@@ -958,13 +4321,40 @@ class _Execute(object):
     def _handle_failed_event(self, action, failure_time, exception):
         self.report.get_action_status(action)._set_failure(failure_time, exception)
         self.hooks.action_failed(failure_time, action, exception)
+        if self.file_states is not None:
+            self._update_file_states(action, False)
 
         self._change_status(action, self.running, self.done)
+        self._finish_in_executor(action)
         self.exceptions.append(exception)
         self._triage_pending_dependents(action, True, failure_time)
         self._deallocate_resources(action)
 
+    def _handle_lost_event(self, action):
+        if action not in self.running:
+            # The action completed just before it was lost
+            return
+        if self._has_streams(action):
+            # Chunks already streamed can't be streamed again
+            self._handle_failed_event(
+                action, datetime.datetime.now(), StreamException("Execution of a streaming action was lost"),
+            )
+            return
+        self._finish_in_executor(action)
+        self.report.get_action_status(action)._set_restarted()
+        self._change_status(action, self.running, self.ready)
+        self._deallocate_resources(action)
+        heapq.heappush(self.ready_queue, (-self.priorities[action], next(self.ready_sequence), action))
+
+    def _finish_in_executor(self, action):
+        # Actions that timed out were canceled instead
+        if self._executes_in_own_process(action) and action not in self.timed_out:
+            self.executor.finish_action(action)
+
     def _handle_pickling_exception_event(self, action):
+        # The action ended: it must not be canceled with the ones still running when the execution stops
+        self._change_status(action, self.running, self.done)
+        self._finish_in_executor(action)
         raise pickle.PicklingError()
 
     def _change_status(self, action, orig, dest):
@@ -972,5 +4362,45 @@ class _Execute(object):
         dest.add(action)
 
     def _deallocate_resources(self, action):
-        for (resource, quantity) in action.resources_required:
+        for (resource, quantity) in self.resources_required[action].items():
             self.resources_used[resource] = max(0, self.resources_used[resource] - quantity)
+        for resource in self.resources_required[action]:
+            self._wake_waiting_actions(resource)
+
+    def _push_waiting_action(self, resource, item):
+        quantity = self.resources_required[item[2]][resource]
+        heapq.heappush(self.waiting_queues.setdefault(resource, {}).setdefault(quantity, []), item)
+
+    def _wake_waiting_actions(self, resource):
+        # Wake up the waiting actions that fit in what's now available, by priority.
+        # Like backfilling, lower priority actions are woken up when they fit beside higher priority ones that don't.
+        # Only the queues of quantities that fit are examined, so each action examined leaves this resource's queues.
+        waiting_queues = self.waiting_queues.get(resource)
+        if not waiting_queues:
+            return
+        availability = resource._availability(self)
+        woken = {}
+        while waiting_queues:
+            used = self.resources_used[resource] + woken.get(resource, 0)
+            # Allow actions requiring more than available to run when they are alone requiring this resource
+            heads = [
+                (waiting_queue[0], quantity) for (quantity, waiting_queue) in waiting_queues.items()
+                if used == 0 or used + quantity <= availability
+            ]
+            if not heads:
+                break
+            (item, quantity) = min(heads)
+            heapq.heappop(waiting_queues[quantity])
+            if not waiting_queues[quantity]:
+                del waiting_queues[quantity]
+            action = item[2]
+            # Canceled actions are not removed from the queues
+            if action in self.ready:
+                blocking_resource = self._get_blocking_resource(action, woken)
+                if blocking_resource is None:
+                    for (required, required_quantity) in self.resources_required[action].items():
+                        woken[required] = woken.get(required, 0) + required_quantity
+                    heapq.heappush(self.ready_queue, item)
+                else:
+                    # Another resource, since this one fits
+                    self._push_waiting_action(blocking_resource, item)
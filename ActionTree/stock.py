@@ -26,6 +26,8 @@ class NullAction(Action):
     A stock action that does nothing.
     Useful as a placeholder for several dependencies.
     """
+    execute_inline = True
+
     def __init__(self, label=None, *args, **kwds):
         """
         @todoc
@@ -39,6 +41,8 @@ class NullAction(Action):
 class CallSubprocess(Action):
     """
     A stock action that calls a subprocess.
+
+    Pass ``input_paths`` and ``output_paths`` (see :class:`.Action`) to skip it when its outputs are up to date.
     """
     def __init__(self, command, kwargs={}, label=DEFAULT, *args, **kwds):
         """
@@ -59,11 +63,15 @@ class CreateDirectory(Action):
     If the directory to create is nested, intermediate directories will be created as well.
 
     :param str name: the directory to create, passed to :func:`os.makedirs`.
+        It's the action's :attr:`~.Action.output_paths`.
     """
+    execute_inline = True
+
     def __init__(self, name, label=DEFAULT, *args, **kwds):
         """
         @todoc
         """
+        kwds.setdefault("output_paths", [name])
         Action.__init__(self, "mkdir {}".format(name) if label is DEFAULT else label, *args, **kwds)
         self.__name = name
 
@@ -82,6 +90,8 @@ class DeleteFile(Action):
 
     :param str name: the name of the file to delete, passed to :func:`os.unlink`.
     """
+    execute_inline = True
+
     def __init__(self, name, label=DEFAULT, *args, **kwds):
         """
         @todoc
@@ -123,13 +133,16 @@ class CopyFile(Action):
     """
     A stock action that copies a file. Arguments are passed to :func:`shutil.copy`.
 
-    :param str src: the file to copy
-    :param str dst: the destination
+    :param str src: the file to copy. It's the action's :attr:`~.Action.input_paths`.
+    :param str dst: the destination. It's the action's :attr:`~.Action.output_paths`,
+        so it should be a file (not a directory) for up-to-date checks.
     """
     def __init__(self, src, dst, label=DEFAULT, *args, **kwds):
         """
         @todoc
         """
+        kwds.setdefault("input_paths", [src])
+        kwds.setdefault("output_paths", [dst])
         Action.__init__(self, "cp {} {}".format(src, dst) if label is DEFAULT else label, *args, **kwds)
         self.__src = src
         self.__dst = dst
@@ -148,12 +161,16 @@ class TouchFile(Action):
     You might want to ensure that by adding a :class:`CreateDirectory` as a dependency.
 
     :param str name: the name of the file to touch. Passed to :func:`open` and/or :func:`os.utime`.
+        It's the action's :attr:`~.Action.output_paths`.
     """
 
+    execute_inline = True
+
     def __init__(self, name, label=DEFAULT, *args, **kwds):
         """
         @todoc
         """
+        kwds.setdefault("output_paths", [name])
         Action.__init__(self, "touch {}".format(name) if label is DEFAULT else label, *args, **kwds)
         self.__name = name
 
@@ -29,8 +29,12 @@ class TestAction(Action):
         events_file, end_event,
         print_on_stdout, print_on_stderr, puts_on_stdout, echo_on_stdout,
         accept_failed_dependencies,
+        *args, **kwds
     ):
-        super(TestAction, self).__init__(label=label, accept_failed_dependencies=accept_failed_dependencies)
+        super(TestAction, self).__init__(
+            label, *args,
+            accept_failed_dependencies=accept_failed_dependencies, **kwds
+        )
         self.__exception = exception
         self.__return_value = return_value
         self.__barrier_id = barrier_id
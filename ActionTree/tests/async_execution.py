@@ -0,0 +1,214 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import asyncio
+import datetime
+import os
+import pickle
+import sys
+
+from ActionTree import *
+from ActionTree.stock import NullAction, Sleep
+from . import *
+from .picklability import UnpicklableAction
+
+
+class CoroutineAction(Action):
+    def __init__(self, label, prints=[], exception=None):
+        super(CoroutineAction, self).__init__(label)
+        self.__prints = prints
+        self.__exception = exception
+
+    async def do_execute(self, dependency_statuses):
+        for (p, d) in self.__prints:
+            print(p)
+            await asyncio.sleep(d)
+        if self.__exception:
+            raise self.__exception
+        return os.getpid()
+
+
+class WaitForCancellation(Action):
+    def __init__(self, label, cancelled):
+        super(WaitForCancellation, self).__init__(label)
+        self.cancelled = cancelled
+
+    async def do_execute(self, dependency_statuses):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled.append(self.label)
+            raise
+
+
+class CoroutineHooks(Hooks):
+    def __init__(self):
+        self.events = []
+
+    async def action_started(self, time, action):
+        await asyncio.sleep(0.01)
+        self.events.append(("started", action.label))
+
+    def action_successful(self, time, action, return_value):
+        self.events.append(("successful", action.label))
+
+
+class AsyncExecutionTestCase(ActionTreeTestCase):
+    def __run(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_process_actions_dont_block_event_loop(self):
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            ticker = asyncio.ensure_future(tick())
+            report = await execute_async(Sleep(0.3))
+            ticker.cancel()
+            return report
+
+        report = self.__run(run())
+
+        self.assertTrue(report.is_success)
+        self.assertGreater(len(ticks), 10)
+
+    def test_inline_actions(self):
+        # Nothing is left running after the first actions are started
+        a = NullAction("a")
+        a.add_dependency(NullAction("b"))
+
+        report = self.__run(execute_async(a))
+
+        self.assertTrue(report.is_success)
+
+    def test_coroutine_action_executes_in_current_process(self):
+        a = CoroutineAction("a")
+
+        report = self.__run(execute_async(a))
+
+        self.assertEqual(report.get_action_status(a).return_value, os.getpid())
+
+    def test_coroutine_actions_execute_concurrently(self):
+        a = self._action("a")
+        deps = [CoroutineAction(str(i), prints=[("x", 0.3)]) for i in range(5)]
+        for dep in deps:
+            a.add_dependency(dep)
+
+        before = datetime.datetime.now()
+        report = self.__run(execute_async(a, cpu_cores=1))
+        after = datetime.datetime.now()
+
+        self.assertTrue(report.is_success)
+        self.assertLess(after - before, datetime.timedelta(seconds=1))
+
+    def test_outputs_of_concurrent_coroutine_actions(self):
+        MANY = 5
+        a = self._action("a")
+        x = CoroutineAction("x", prints=[("x", 0.01)] * MANY)
+        y = CoroutineAction("y", prints=[("y", 0.01)] * MANY)
+        a.add_dependency(x)
+        a.add_dependency(y)
+
+        report = self.__run(execute_async(a))
+
+        self.assertEqual(report.get_action_status(x).output, b"x\n" * MANY)
+        self.assertEqual(report.get_action_status(y).output, b"y\n" * MANY)
+
+    def test_concurrent_executions(self):
+        # The first execution ends while the second one still captures the output of its actions
+        x = CoroutineAction("x", prints=[("x", 0.01)] * 2)
+        y = CoroutineAction("y", prints=[("y", 0.05)] * 5)
+        streams = (sys.stdout, sys.stderr)
+
+        async def run():
+            return await asyncio.gather(execute_async(x), execute_async(y))
+
+        (report_x, report_y) = self.__run(run())
+
+        self.assertEqual(report_x.get_action_status(x).output, b"x\n" * 2)
+        self.assertEqual(report_y.get_action_status(y).output, b"y\n" * 5)
+        self.assertEqual((sys.stdout, sys.stderr), streams)
+
+    def test_failure(self):
+        a = self._action("a")
+        b = CoroutineAction("b", exception=Exception("foo"))
+        a.add_dependency(b)
+
+        with self.assertRaises(CompoundException) as catcher:
+            self.__run(execute_async(a))
+        report = catcher.exception.execution_report
+
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEqual(report.get_action_status(b).exception.args, ("foo",))
+
+    def test_failure_when_starting(self):
+        with self.assertRaises(pickle.PicklingError):
+            self.__run(execute_async(UnpicklableAction("a")))
+
+    def test_cancelled_error(self):
+        a = CoroutineAction("a", exception=asyncio.CancelledError())
+
+        report = self.__run(execute_async(a, do_raise=False))
+
+        self.assertEqual(report.get_action_status(a).status, FAILED)
+        self.assertIsInstance(report.get_action_status(a).exception, asyncio.CancelledError)
+
+    def test_cancelled_execution(self):
+        cancelled = []
+
+        async def run():
+            execution = asyncio.ensure_future(execute_async(WaitForCancellation("a", cancelled)))
+            await asyncio.sleep(0.2)
+            execution.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await execution
+            await asyncio.sleep(0)
+
+        self.__run(run())
+
+        self.assertEqual(cancelled, ["a"])
+
+    def test_blocking_execute(self):
+        a = self._action("a")
+        b = CoroutineAction("b")
+        a.add_dependency(b)
+
+        report = execute(a)
+
+        self.assertTrue(report.is_success)
+        self.assertEqual(report.get_action_status(b).return_value, os.getpid())
+
+    def test_coroutine_hooks(self):
+        a = self._action("a")
+        b = CoroutineAction("b")
+        a.add_dependency(b)
+
+        for run in (execute, lambda a, hooks: self.__run(execute_async(a, hooks=hooks))):
+            hooks = CoroutineHooks()
+            run(a, hooks=hooks)
+            self.assertEqual(
+                hooks.events,
+                [("started", "b"), ("successful", "b"), ("started", "a"), ("successful", "a")],
+            )
+
+    def test_coroutine_hooks_without_coroutine_actions(self):
+        a = self._action("a")
+        a.add_dependency(self._action("b"))
+        hooks = CoroutineHooks()
+
+        execute(a, hooks=hooks)
+
+        self.assertEqual(
+            hooks.events,
+            [("started", "b"), ("successful", "b"), ("started", "a"), ("successful", "a")],
+        )
@@ -3,8 +3,38 @@
 # Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
 
 
+import errno
+import os
+import pickle
+import sys
+import tempfile
+import unittest.mock
+
+import ActionTree
 from ActionTree import *
 from . import *
+from .async_execution import CoroutineAction
+from .hooks import TestHooks
+
+
+class OutputOfDependency(Action):
+    def do_execute(self, dependency_statuses):
+        (status,) = dependency_statuses.values()
+        return status.output
+
+
+class ManyBuffers(Action):
+    def do_execute(self, dependency_statuses):
+        return [pickle.PickleBuffer(bytearray(b"xy")) for i in range(2000)]
+
+
+send = ActionTree._EventSender.send
+
+
+def send_without_results(self, event):
+    if event[0] == ActionTree.SERIALIZED_RESULT:
+        raise OSError(errno.EINVAL, "Invalid argument")
+    send(self, event)
 
 
 class ExecutionTestCase(ActionTreeTestCase):
@@ -62,3 +92,189 @@ class ExecutionTestCase(ActionTreeTestCase):
 
         self.assertEqual(report.get_action_status(x).output, b"x\n" * MANY)
         self.assertEqual(report.get_action_status(y).output, b"y\n" * MANY)
+
+    def test_many_chatty_actions(self):
+        MANY = 10
+        a = self._action("a")
+        deps = [self._action(str(i), print_on_stdout=[(str(i) * 100, 0)] * 200) for i in range(MANY)]
+        for dep in deps:
+            a.add_dependency(dep)
+        report = execute(a, cpu_cores=MANY)
+
+        for (i, dep) in enumerate(deps):
+            self.assertEqual(report.get_action_status(dep).output, (str(i) * 100 + "\n").encode() * 200)
+
+    def test_large_return_value(self):
+        # Larger than a pipe's buffer, and than the parent's reads
+        a = self._action("a", return_value=b"x" * 1000000)
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, b"x" * 1000000)
+
+    def test_large_bytearray_return_value(self):
+        # Plain bytearrays are pickled in-band, but the pickle of the return value is sent without being copied
+        a = self._action("a", return_value=[bytearray(b"x" * 1000000), bytearray(b"y" * 1000)])
+        report = execute(a, worker_pool=WorkerPool())
+
+        self.assertEqual(report.get_action_status(a).return_value, [b"x" * 1000000, b"y" * 1000])
+
+    def test_many_out_of_band_buffers(self):
+        # More buffers than a single writev accepts
+        a = ManyBuffers("a")
+        for kwds in ({}, dict(worker_pool=WorkerPool())):
+            report = execute(a, **kwds)
+
+            self.assertEqual([bytes(b) for b in report.get_action_status(a).return_value], [b"xy"] * 2000)
+
+    def test_result_not_sent(self):
+        a = self._action("a")
+        with unittest.mock.patch.object(ActionTree._EventSender, "send", send_without_results):
+            report = execute(a, do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, FAILED)
+        self.assertEqual(report.get_action_status(a).exception.errno, errno.EINVAL)
+
+    def __printed_events(self, hooks):
+        return [event[2] for event in hooks.events if event[0] == "printed"]
+
+    def test_output_flush_interval(self):
+        hooks = TestHooks()
+        a = self._action("a", print_on_stdout=[("a", 0.01)] * 5)
+        b = self._action("b", print_on_stdout=[("b", 0.01)] * 5, output_flush_interval=10)
+        execute(a, hooks=hooks, output_flush_interval=10)
+        execute(b, hooks=hooks)
+
+        self.assertEqual(self.__printed_events(hooks), [b"a\n" * 5, b"b\n" * 5])
+
+    def test_output_flush_size(self):
+        hooks = TestHooks()
+        a = self._action("a", print_on_stdout=[("a", 0.01)] * 5, output_flush_size=4)
+        execute(a, hooks=hooks, output_flush_interval=10)
+
+        self.assertEqual(self.__printed_events(hooks), [b"a\na\n", b"a\na\n", b"a\n"])
+
+    def test_output_flush_interval_in_thread(self):
+        hooks = TestHooks()
+        a = self._action("a", print_on_stdout=[("a", 0.01)] * 5, execute_in_thread=True)
+        execute(a, hooks=hooks, output_flush_interval=10)
+
+        self.assertEqual(self.__printed_events(hooks), [b"a\n" * 5])
+
+    def test_output_flush_size_in_thread(self):
+        hooks = TestHooks()
+        a = self._action("a", print_on_stdout=[("a", 0.01)] * 5, output_flush_size=4, execute_in_thread=True)
+        execute(a, hooks=hooks, output_flush_interval=10)
+
+        self.assertEqual(self.__printed_events(hooks), [b"a\na\n", b"a\na\n", b"a\n"])
+
+    def test_output_spill_threshold(self):
+        a = self._action("a", print_on_stdout=[("a" * 99, 0)] * 100)
+        report = execute(a, output_spill_threshold=1000)
+
+        self.assertEqual(report.get_action_status(a).output, (b"a" * 99 + b"\n") * 100)
+        with report.get_action_status(a).open_output() as f:
+            self.assertEqual(f.read(100), b"a" * 99 + b"\n")
+            self.assertIsInstance(f.name, str)
+
+    def test_spilled_output_in_dependency_statuses(self):
+        a = OutputOfDependency("a")
+        b = self._action("b", print_on_stdout=[("b" * 99, 0)] * 100)
+        a.add_dependency(b)
+        for worker_pool in (None, WorkerPool()):
+            report = execute(a, output_spill_threshold=1000, worker_pool=worker_pool)
+
+            self.assertEqual(report.get_action_status(a).return_value, (b"b" * 99 + b"\n") * 100)
+
+    def test_output_tail_size(self):
+        a = self._action("a", print_on_stdout=[(str(i), 0) for i in range(100)])
+        report = execute(a, output_tail_size=6)
+
+        self.assertEqual(report.get_action_status(a).output, b"98\n99\n")
+        self.assertEqual(report.get_action_status(a).open_output().read(), b"98\n99\n")
+
+    def test_output_tail_size_zero(self):
+        a = self._action("a", print_on_stdout=[(str(i), 0) for i in range(100)])
+        report = execute(a, output_tail_size=0, output_spill_threshold=10)
+
+        self.assertEqual(report.get_action_status(a).output, b"")
+        self.assertEqual(report.get_action_status(a).open_output().read(), b"")
+
+    def test_open_output_of_canceled_action(self):
+        a = self._action("a")
+        a.add_dependency(self._action("b", exception=Exception()))
+        report = execute(a, do_raise=False)
+
+        self.assertIsNone(report.get_action_status(a).open_output())
+
+    def __execute_with_redirected_stdout(self, action, **kwds):
+        with tempfile.TemporaryFile() as f:
+            sys.stdout.flush()
+            saved_stdout = os.dup(1)
+            os.dup2(f.fileno(), 1)
+            try:
+                report = execute(action, **kwds)
+                sys.stdout.flush()
+            finally:
+                os.dup2(saved_stdout, 1)
+                os.close(saved_stdout)
+            f.seek(0)
+            return (report, f.read())
+
+    def test_output_capture_inherit(self):
+        a = self._action("a", echo_on_stdout="echoed")
+        (report, stdout) = self.__execute_with_redirected_stdout(a, output_capture=INHERIT)
+
+        self.assertEqual(report.get_action_status(a).output, b"")
+        self.assertEqual(stdout, b"echoed\n")
+
+    def test_output_capture_discard(self):
+        a = self._action("a", print_on_stdout="printed", echo_on_stdout="echoed")
+        (report, stdout) = self.__execute_with_redirected_stdout(a, output_capture=DISCARD)
+
+        self.assertEqual(report.get_action_status(a).output, b"")
+        self.assertEqual(stdout, b"")
+
+    def test_output_capture_per_action(self):
+        a = self._action("a", print_on_stdout="a", output_capture=CAPTURE)
+        b = self._action("b", print_on_stdout="b", output_capture=INHERIT)
+        c = self._action("c", print_on_stdout="c")
+        a.add_dependency(b)
+        b.add_dependency(c)
+        (report, stdout) = self.__execute_with_redirected_stdout(a, output_capture=DISCARD)
+
+        self.assertEqual(report.get_action_status(a).output, b"a\n")
+        self.assertEqual(report.get_action_status(b).output, b"")
+        self.assertEqual(report.get_action_status(c).output, b"")
+        self.assertEqual(stdout, b"b\n")
+
+    def test_output_capture_in_thread(self):
+        a = self._action("a", print_on_stdout="a", output_capture=INHERIT, execute_in_thread=True)
+        b = self._action("b", print_on_stdout=[("b", 0)], output_capture=DISCARD, execute_in_thread=True)
+        a.add_dependency(b)
+        (report, stdout) = self.__execute_with_redirected_stdout(a)
+
+        self.assertEqual(report.get_action_status(a).output, b"")
+        self.assertEqual(report.get_action_status(b).output, b"")
+        self.assertEqual(stdout, b"a\n")
+
+    def test_output_capture_inherit_in_current_process(self):
+        a = self._action("a", print_on_stdout="a")
+        a.execute_inline = True
+        b = CoroutineAction("b", prints=[("b", 0)])
+        a.add_dependency(b)
+        (report, stdout) = self.__execute_with_redirected_stdout(a, output_capture=INHERIT)
+
+        self.assertEqual(report.get_action_status(a).output, b"")
+        self.assertEqual(report.get_action_status(b).output, b"")
+        self.assertEqual(stdout, b"b\na\n")
+
+    def test_output_capture_in_worker_pool(self):
+        a = self._action("a", print_on_stdout="a")
+        b = self._action("b", print_on_stdout="b", output_capture=DISCARD)
+        c = self._action("c", print_on_stdout="c", output_capture=INHERIT)
+        a.add_dependency(b)
+        b.add_dependency(c)
+        (report, stdout) = self.__execute_with_redirected_stdout(a, cpu_cores=1, worker_pool=WorkerPool())
+
+        self.assertEqual(report.get_action_status(a).output, b"a\n")
+        self.assertEqual(stdout, b"c\n")
@@ -0,0 +1,248 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import multiprocessing
+import pickle
+
+from ActionTree import *
+from . import *
+from .streaming import Consume, Produce
+
+
+class SumOfDependencies(Action):
+    def do_execute(self, dependency_statuses):
+        print(self.label)
+        return sum(status.return_value for status in dependency_statuses.values())
+
+
+class ReturnUnpicklable(Action):
+    def do_execute(self, dependency_statuses):
+        return lambda: None
+
+
+class DependencyOutputs(Action):
+    def do_execute(self, dependency_statuses):
+        return sorted((d.label, status.output) for (d, status) in dependency_statuses.items())
+
+
+class MinimalExecutor(Executor):
+    # Relies on the default implementations of Executor, and runs tasks in local processes
+    def open(self, context):
+        super(MinimalExecutor, self).open(context)
+        self.context = context
+
+    def start_action(self, action):
+        task = self.context.make_task(action, remote=False)
+        events = self.context.make_events_sender()
+        process = multiprocessing.Process(target=task.run, kwargs=dict(events=events))
+        process.start()
+        events.close()
+
+
+class TaskExecutor(Executor):
+    # Runs pickled tasks in new processes, like a backend sending them to other machines would
+    def __init__(self, capacity=UNLIMITED):
+        self.capacity = capacity
+        self.calls = []
+        self.max_running = 0
+
+    def open(self, context):
+        self.calls.append("open")
+        self.context = context
+        self.running = set()
+
+    def close(self):
+        self.calls.append("close")
+
+    def get_capacity(self):
+        return self.capacity
+
+    def start_action(self, action):
+        task = pickle.loads(pickle.dumps(self.context.make_task(action, remote=True)))
+        events = self.context.make_events_sender()
+        process = multiprocessing.Process(target=task.run, kwargs=dict(events=events))
+        process.start()
+        events.close()
+        self.running.add(action)
+        self.max_running = max(self.max_running, len(self.running))
+
+    def finish_action(self, action):
+        self.running.discard(action)
+
+
+class OneAtATimeExecutor(TaskExecutor):
+    def can_start_action(self, action):
+        return not self.running
+
+    def finish_action(self, action):
+        super(OneAtATimeExecutor, self).finish_action(action)
+        self.context.wake_up()
+
+
+class FailingExecutor(TaskExecutor):
+    def start_action(self, action):
+        self.context.fail_action(action, Exception("Not executed"))
+
+
+class LosingExecutor(TaskExecutor):
+    # Loses the first execution of each action
+    def start_action(self, action):
+        if ("lost", action.label) in self.calls:
+            super(LosingExecutor, self).start_action(action)
+        else:
+            self.calls.append(("lost", action.label))
+            self.context.restart_action(action)
+
+
+class LateLosingExecutor(TaskExecutor):
+    # Reports that actions are lost after they finished
+    def finish_action(self, action):
+        super(LateLosingExecutor, self).finish_action(action)
+        self.context.restart_action(action)
+
+
+class CancelRecordingExecutor(ForkExecutor):
+    def __init__(self):
+        self.canceled = []
+
+    def cancel_action(self, action):
+        self.canceled.append(action.label)
+        super(CancelRecordingExecutor, self).cancel_action(action)
+
+
+class ExecutorsTestCase(ActionTreeTestCase):
+    def test_custom_executor(self):
+        a = SumOfDependencies("a")
+        a.add_dependency(self._action("b", return_value=1))
+        a.add_dependency(self._action("c", return_value=2))
+        executor = TaskExecutor()
+        report = execute(a, executor=executor)
+
+        self.assertEqual(report.get_action_status(a).return_value, 3)
+        self.assertEqual(report.get_action_status(a).output, b"a\n")
+        self.assertEqual(executor.calls, ["open", "close"])
+        self.assertEqual(executor.max_running, 2)
+        self.assertEventsEqual("bc")
+
+    def test_default_implementations(self):
+        a = SumOfDependencies("a")
+        a.add_dependency(self._action("b", return_value=1))
+        report = execute(a, executor=MinimalExecutor())
+
+        self.assertEqual(report.get_action_status(a).return_value, 1)
+        self.assertEventsEqual("b")
+
+        a = self._action("a")
+        a.add_dependency(ReturnUnpicklable("b"))
+        a.add_dependency(self._action("c", print_on_stdout=[("c", 1)]))
+        with self.assertRaises(pickle.PicklingError):
+            execute(a, executor=MinimalExecutor(), cpu_cores=2, check_picklability=False)
+
+    def test_start_action_is_abstract(self):
+        with self.assertRaises(NotImplementedError):
+            Executor().start_action(self._action("a"))
+
+    def test_dependency_without_output(self):
+        a = DependencyOutputs("a", accept_failed_dependencies=True)
+        b = self._action("b", print_on_stdout="b", exception=Exception("b failed"))
+        c = self._action("c")
+        a.add_dependency(b)
+        a.add_dependency(c)
+        c.add_dependency(b)
+        report = execute(a, executor=TaskExecutor(), do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).return_value, [("b", b"b\n"), ("c", None)])
+
+    def test_executor_is_reusable(self):
+        executor = TaskExecutor()
+        execute(self._action("a"), executor=executor)
+        execute(self._action("b"), executor=executor)
+
+        self.assertEqual(executor.calls, ["open", "close", "open", "close"])
+        self.assertEventsEqual("a b")
+
+    def test_capacity(self):
+        a = self._action("a")
+        for label in "bcd":
+            a.add_dependency(self._action(label))
+        executor = TaskExecutor(capacity=1)
+        execute(a, executor=executor)
+
+        self.assertEqual(executor.max_running, 1)
+
+    def test_explicit_cpu_cores(self):
+        a = self._action("a")
+        for label in "bcd":
+            a.add_dependency(self._action(label))
+        executor = TaskExecutor(capacity=1)
+        execute(a, executor=executor, cpu_cores=3)
+
+        self.assertEqual(executor.max_running, 3)
+
+    def test_postponed_actions(self):
+        a = self._action("a")
+        for label in "bcd":
+            a.add_dependency(self._action(label))
+        executor = OneAtATimeExecutor()
+        report = execute(a, executor=executor)
+
+        self.assertTrue(report.is_success)
+        self.assertEqual(executor.max_running, 1)
+        self.assertEventsIn([list(events) + ["a"] for events in ("bcd", "bdc", "cbd", "cdb", "dbc", "dcb")])
+
+    def test_failed_action(self):
+        a = self._action("a")
+        report = execute(a, executor=FailingExecutor(), do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, FAILED)
+        self.assertEqual(str(report.get_action_status(a).exception), "Not executed")
+        self.assertEventsEqual("")
+
+    def test_restarted_action(self):
+        a = self._action("a", return_value=42)
+        a.add_dependency(self._action("b"))
+        report = execute(a, executor=LosingExecutor())
+
+        self.assertEqual(report.get_action_status(a).return_value, 42)
+        self.assertEventsEqual("b a")
+
+    def test_action_lost_after_it_finished(self):
+        a = self._action("a", return_value=42)
+        a.add_dependency(self._action("b"))
+        report = execute(a, executor=LateLosingExecutor())
+
+        self.assertEqual(report.get_action_status(a).return_value, 42)
+        self.assertEventsEqual("b a")
+
+    def test_restarted_streaming_action(self):
+        a = Consume("a")
+        b = Produce("b", 1)
+        a.add_dependency(b, stream=True)
+        report = execute(a, executor=LosingExecutor(), do_raise=False)
+
+        self.assertIsInstance(report.get_action_status(b).exception, StreamException)
+
+    def test_executor_overrides_worker_pool(self):
+        executor = TaskExecutor()
+        execute(self._action("a"), executor=executor, worker_pool=WorkerPool())
+
+        self.assertEqual(executor.calls, ["open", "close"])
+
+    def test_running_actions_are_canceled_on_interruption(self):
+        a = self._action("a")
+        a.add_dependency(ReturnUnpicklable("b"))
+        a.add_dependency(self._action("c", print_on_stdout=[("c", 10)]))
+        executor = CancelRecordingExecutor()
+        with self.assertRaises(pickle.PicklingError):
+            execute(a, executor=executor, cpu_cores=2, check_picklability=False)
+
+        self.assertIn("c", executor.canceled)
+
+    def test_thread_actions_are_not_sent_to_executor(self):
+        executor = TaskExecutor()
+        execute(self._action("a", execute_in_thread=True), executor=executor)
+
+        self.assertEqual(executor.max_running, 0)
+        self.assertEventsEqual("a")
@@ -0,0 +1,250 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import datetime
+import pickle
+
+from ActionTree import *
+from . import *
+from .async_execution import CoroutineAction
+from .fork_server import fork_server
+from .hooks import TestHooks
+from .picklability import UnpicklableAction
+
+
+class Discover(Action):
+    # Adds "count" actions, discovered when it executes
+    def __init__(self, label, count, depend_on_self=False, depend_on_dependencies=False, **kwds):
+        super(Discover, self).__init__(label, **kwds)
+        self.count = count
+        self.depend_on_self = depend_on_self
+        self.depend_on_dependencies = depend_on_dependencies
+        self.depend_on = None
+
+    def do_execute(self, dependency_statuses):
+        shards = [Square("{}-{}".format(self.label, i), i) for i in range(self.count)]
+        for shard in shards:
+            if self.depend_on_self:
+                shard.add_dependency(self)
+            if self.depend_on_dependencies:
+                for dependency in dependency_statuses:
+                    shard.add_dependency(dependency)
+            if self.depend_on is not None:
+                shard.add_dependency(self.depend_on)
+        return Expansion(shards, return_value=self.count)
+
+
+class Square(Action):
+    # Returns its value squared, plus the return values of its dependencies
+    def __init__(self, label, value):
+        super(Square, self).__init__(label)
+        self.value = value
+
+    def do_execute(self, dependency_statuses):
+        return self.value ** 2 + sum(status.return_value for status in dependency_statuses.values())
+
+
+class DiscoverUnpicklable(Action):
+    def do_execute(self, dependency_statuses):
+        return Expansion([UnpicklableAction("x")])
+
+
+class Collect(Action):
+    def do_execute(self, dependency_statuses):
+        return sorted((d.label, status.return_value) for (d, status) in dependency_statuses.items())
+
+
+class ExpansionsTestCase(ActionTreeTestCase):
+    def __statuses_by_label(self, report):
+        return {action.label: status for (action, status) in report.get_actions_and_statuses()}
+
+    def test_added_actions(self):
+        for kwds in ({}, dict(worker_pool=WorkerPool()), dict(fork_server=fork_server)):
+            a = Collect("a")
+            b = Discover("b", 3)
+            a.add_dependency(b)
+            report = execute(a, **kwds)
+
+            self.assertEqual(report.get_action_status(b).return_value, 3)
+            self.assertEqual(
+                report.get_action_status(a).return_value,
+                [("b", 3), ("b-0", 0), ("b-1", 1), ("b-2", 4)],
+            )
+            self.assertEqual(
+                sorted(label for (label, status) in self.__statuses_by_label(report).items()),
+                ["a", "b", "b-0", "b-1", "b-2"],
+            )
+            self.assertEqual(a.dependencies, [b])
+
+    def test_added_actions_in_thread(self):
+        for inline in (False, True):
+            a = Collect("a")
+            b = Discover("b", 2, execute_in_thread=not inline)
+            b.execute_inline = inline
+            a.add_dependency(b)
+            report = execute(a)
+
+            self.assertEqual(report.get_action_status(a).return_value, [("b", 2), ("b-0", 0), ("b-1", 1)])
+
+    def test_added_actions_depending_on_expanded_action(self):
+        for kwds in ({}, dict(worker_pool=WorkerPool()), dict(fork_server=fork_server)):
+            a = Collect("a")
+            b = Discover("b", 2, depend_on_self=True)
+            a.add_dependency(b)
+            report = execute(a, **kwds)
+
+            self.assertEqual(report.get_action_status(a).return_value, [("b", 2), ("b-0", 2), ("b-1", 3)])
+            self.assertEqual(len(report.get_actions_and_statuses()), 4)
+
+    def test_added_actions_depending_on_dependencies(self):
+        for kwds in ({}, dict(worker_pool=WorkerPool()), dict(fork_server=fork_server)):
+            a = Collect("a")
+            b = Discover("b", 2, depend_on_dependencies=True)
+            a.add_dependency(b)
+            b.add_dependency(Square("c", 10))
+            report = execute(a, **kwds)
+
+            self.assertEqual(report.get_action_status(a).return_value, [("b", 2), ("b-0", 100), ("b-1", 101)])
+            self.assertEqual(len(report.get_actions_and_statuses()), 5)
+
+    def test_added_actions_depending_on_dependent(self):
+        a = Collect("a")
+        b = Discover("b", 2)
+        a.add_dependency(b)
+        b.depend_on = a
+        report = execute(a, do_raise=False)
+
+        self.assertEqual(report.get_action_status(b).status, FAILED)
+        self.assertIsInstance(report.get_action_status(b).exception, DependencyCycleException)
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEqual(len(report.get_actions_and_statuses()), 2)
+
+    def test_hooks(self):
+        hooks = TestHooks()
+        a = Collect("a")
+        a.add_dependency(Discover("b", 1))
+        execute(a, hooks=hooks)
+
+        self.assertEqual(
+            hooks.events,
+            [
+                ("pending", "b"),
+                ("pending", "a"),
+                ("ready", "b"),
+                ("started", "b"),
+                ("pending", "b-0"),
+                ("ready", "b-0"),
+                ("successful", "b", 1),
+                ("started", "b-0"),
+                ("successful", "b-0", 0),
+                ("ready", "a"),
+                ("started", "a"),
+                ("successful", "a", [("b", 1), ("b-0", 0)]),
+            ],
+        )
+
+    def test_resources(self):
+        resource = Resource(1)
+        a = self._action("a")
+        b = self._action("b", end_event=True)
+        c = self._action("c", end_event=True)
+        for action in (b, c):
+            action.require_resource(resource)
+        d = self._action("d", execute_in_thread=True)
+        d.do_execute = lambda dependency_statuses: Expansion([b, c])
+        a.add_dependency(d)
+        execute(a, cpu_cores=UNLIMITED, check_picklability=False)
+
+        self.assertEventsIn([["b", "B", "c", "C", "a"], ["c", "C", "b", "B", "a"]])
+
+    def test_failed_added_action(self):
+        a = self._action("a")
+        b = self._action("b", exception=Exception("b failed"))
+        c = self._action("c", execute_in_thread=True)
+        c.do_execute = lambda dependency_statuses: Expansion([b])
+        a.add_dependency(c)
+        report = execute(a, do_raise=False, check_picklability=False)
+
+        self.assertEqual(report.get_action_status(b).status, FAILED)
+        self.assertEqual(report.get_action_status(c).status, SUCCESSFUL)
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEventsEqual("b")
+
+    def test_added_actions_in_threads_run_concurrently(self):
+        # The thread pool is grown for the added actions
+        a = self._action("a", execute_in_thread=True)
+        bs = [self._action("b", execute_in_thread=True, print_on_stdout=[("b", 0.5)]) for i in range(8)]
+        a.do_execute = lambda dependency_statuses: Expansion(bs)
+        report = execute(a, cpu_cores=UNLIMITED, thread_slots=UNLIMITED, check_picklability=False)
+
+        # Executed one after the other, they would take 4 seconds
+        self.assertLess(
+            max(report.get_action_status(b).success_time for b in bs) - report.get_action_status(a).start_time,
+            datetime.timedelta(seconds=2),
+        )
+        self.assertEventsEqual("b b b b b b b b")
+
+    def test_added_actions_already_in_execution(self):
+        #     a
+        #    /|\
+        #   | f |
+        #    \| |
+        #     d |
+        #    / \|
+        #   b   e
+        a = self._action("a")
+        b = self._action("b")
+        d = self._action("d", execute_in_thread=True)
+        e = self._action("e")
+        f = self._action("f")
+        a.add_dependency(d)
+        a.add_dependency(f)
+        a.add_dependency(e)
+        f.add_dependency(d)
+        d.add_dependency(b)
+        d.add_dependency(e)
+        d.do_execute = lambda dependency_statuses: Expansion([b, e])
+        report = execute(a, check_picklability=False)
+
+        self.assertEqual(len(report.get_actions_and_statuses()), 5)
+        self.assertEqual(
+            [report.get_action_status(x).status for x in (a, b, d, e, f)],
+            [SUCCESSFUL, SUCCESSFUL, SUCCESSFUL, SUCCESSFUL, SUCCESSFUL],
+        )
+        self.assertEventsIn([["b", "e", "f", "a"], ["e", "b", "f", "a"]])
+
+    def test_added_actions_depending_on_failed_action(self):
+        a = self._action("a")
+        b = self._action("b", exception=Exception("b failed"))
+        c = self._action("c", execute_in_thread=True, accept_failed_dependencies=True)
+        d = self._action("d")
+        e = self._action("e")
+        a.add_dependency(c)
+        c.add_dependency(b)
+        d.add_dependency(b)
+        e.add_dependency(d)
+        c.do_execute = lambda dependency_statuses: Expansion([e])
+        report = execute(a, do_raise=False, check_picklability=False)
+
+        self.assertEqual(report.get_action_status(c).status, SUCCESSFUL)
+        self.assertEqual(report.get_action_status(d).status, CANCELED)
+        self.assertEqual(report.get_action_status(e).status, CANCELED)
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEventsEqual("b")
+
+    def test_added_coroutine_action_without_execute_async(self):
+        a = self._action("a")
+        b = self._action("b", execute_in_thread=True)
+        b.do_execute = lambda dependency_statuses: Expansion([CoroutineAction("c")])
+        a.add_dependency(b)
+        report = execute(a, do_raise=False, check_picklability=False)
+
+        self.assertEqual(report.get_action_status(b).status, FAILED)
+        self.assertIsInstance(report.get_action_status(b).exception, ValueError)
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+
+    def test_unpicklable_added_action(self):
+        with self.assertRaises(pickle.PicklingError):
+            execute(DiscoverUnpicklable("a"))
@@ -0,0 +1,67 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import os
+import sys
+
+from ActionTree import *
+from . import *
+
+
+class GetPidAndModules(Action):
+    def do_execute(self, dependency_statuses):
+        return (os.getpid(), os.getppid(), "xml.dom.minidom" in sys.modules)
+
+
+class DescribeDependencies(Action):
+    def do_execute(self, dependency_statuses):
+        return sorted(
+            (d.label, d.dependencies, status.status, status.return_value, status.output)
+            for (d, status) in dependency_statuses.items()
+        )
+
+
+# The fork server is shared: the preload list of the first ForkServer to start it wins
+fork_server = ForkServer(preload=["xml.dom.minidom"])
+
+
+class ForkServerTestCase(ActionTreeTestCase):
+    def test_forked_from_fork_server(self):
+        self.assertEqual(fork_server.preload, ["xml.dom.minidom"])
+        fork_server.start()
+        a = GetPidAndModules("a")
+
+        report = execute(a, fork_server=fork_server)
+
+        (pid, parent_pid, preloaded) = report.get_action_status(a).return_value
+        self.assertNotEqual(pid, os.getpid())
+        self.assertNotEqual(parent_pid, os.getpid())
+        self.assertTrue(preloaded)
+
+    def test_output_and_failure(self):
+        a = self._action("a")
+        b = self._action("b", print_on_stdout="printed", exception=Exception("foo"))
+        a.add_dependency(b)
+
+        report = execute(a, fork_server=fork_server, do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEqual(report.get_action_status(b).exception.args, ("foo",))
+        self.assertEqual(report.get_action_status(b).output, b"printed\n")
+
+    def test_dependency_statuses(self):
+        a = DescribeDependencies("a")
+        b = self._action("b", return_value=42, print_on_stdout="printed")
+        c = self._action("c")
+        a.add_dependency(b)
+        b.add_dependency(c)
+
+        report = execute(a, fork_server=fork_server)
+
+        # Dependencies of dependencies are not sent to the process executing the action
+        self.assertEqual(
+            report.get_action_status(a).return_value,
+            [("b", [None], SUCCESSFUL, 42, b"printed\n")],
+        )
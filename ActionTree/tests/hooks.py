@@ -4,6 +4,8 @@
 
 
 import datetime
+import os
+import sys
 
 from ActionTree import *
 from . import *
@@ -41,6 +43,15 @@ class TestHooks(Hooks):
         assert isinstance(time, datetime.datetime)
         self.events.append(("failed", action.label, str(exception)))
 
+    def action_skipped(self, time, action, reason, return_value):
+        assert isinstance(time, datetime.datetime)
+        self.events.append(("skipped", action.label, reason, return_value))
+
+
+class FailingHooks(Hooks):
+    def action_ready(self, time, action):
+        raise Exception("Hook failed")
+
 
 class ExecutionTestCase(ActionTreeTestCase):
     def test_successful_action(self):
@@ -166,3 +177,17 @@ class ExecutionTestCase(ActionTreeTestCase):
                 ("ready", "d"),
             ]
         )
+
+    def test_failing_hook_when_starting(self):
+        # What the execution acquired before the hook failed is released
+        a = self._action("a", execute_in_thread=True)
+        a.add_dependency(self._action("b"))
+        streams = (sys.stdout, sys.stderr)
+        fds = len(os.listdir("/proc/self/fd"))
+
+        with self.assertRaises(Exception):
+            execute(a, hooks=FailingHooks(), worker_pool=WorkerPool())
+
+        self.assertEqual((sys.stdout, sys.stderr), streams)
+        self.assertEqual(len(os.listdir("/proc/self/fd")), fds)
+        self.assertEventsEqual("")
@@ -0,0 +1,104 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import os
+
+from ActionTree import *
+from ActionTree.stock import NullAction
+from . import *
+from .hooks import TestHooks
+
+
+class InlineAction(Action):
+    execute_inline = True
+
+    def __init__(self, label, print_on_stdout=None, exception=None):
+        super(InlineAction, self).__init__(label)
+        self.__print_on_stdout = print_on_stdout
+        self.__exception = exception
+
+    def do_execute(self, dependency_statuses):
+        if self.__print_on_stdout:
+            print(self.__print_on_stdout)
+        if self.__exception:
+            raise self.__exception
+        return os.getpid()
+
+
+class InlineExecutionTestCase(ActionTreeTestCase):
+    def test_executes_in_current_process(self):
+        a = InlineAction("a")
+
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, os.getpid())
+
+    def test_resources_required(self):
+        self.assertEqual(NullAction().resources_required, [])
+
+    def test_hooks(self):
+        hooks = TestHooks()
+        a = InlineAction("a", print_on_stdout="something")
+        b = NullAction("b")
+        a.add_dependency(b)
+
+        execute(a, hooks=hooks)
+
+        self.assertEqual(sorted(hooks.events[:2]), [("pending", "a"), ("pending", "b")])
+        self.assertEqual(
+            hooks.events[2:],
+            [
+                ("ready", "b"),
+                ("started", "b"),
+                ("successful", "b", None),
+                ("ready", "a"),
+                ("started", "a"),
+                ("printed", "a", b"something\n"),
+                ("successful", "a", os.getpid()),
+            ]
+        )
+
+    def test_timing(self):
+        a = NullAction("a")
+
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(a).start_time, report.get_action_status(a).ready_time)
+        self.assertGreaterEqual(report.get_action_status(a).success_time, report.get_action_status(a).start_time)
+
+    def test_failure(self):
+        a = NullAction("a")
+        b = InlineAction("b", print_on_stdout="something", exception=Exception("foo"))
+        a.add_dependency(b)
+
+        report = execute(a, do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEqual(report.get_action_status(b).status, FAILED)
+        self.assertEqual(report.get_action_status(b).exception.args, ("foo",))
+        self.assertEqual(report.get_action_status(b).output, b"something\n")
+
+    def test_system_exit(self):
+        # Like in processes and threads, even exceptions not deriving from Exception are reported
+        a = InlineAction("a", exception=SystemExit())
+
+        report = execute(a, do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, FAILED)
+        self.assertIsInstance(report.get_action_status(a).exception, SystemExit)
+
+    def test_mixed_with_processes(self):
+        a = NullAction("a")
+        b = self._action("b")
+        c = NullAction("c")
+        d = self._action("d")
+        a.add_dependency(b)
+        b.add_dependency(c)
+        c.add_dependency(d)
+
+        report = execute(a, cpu_cores=1)
+
+        self.assertTrue(report.is_success)
+        self.assertEventsEqual("d b")
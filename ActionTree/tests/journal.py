@@ -0,0 +1,229 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest.mock
+
+import ActionTree
+from ActionTree import *
+from . import *
+from .hooks import TestHooks
+
+
+class Removed(object):
+    # Records whose return value is an instance of this class can't be read when it's removed
+    pass
+
+
+class JournalTestCase(ActionTreeTestCase):
+    def setUp(self):
+        super(JournalTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.journal = os.path.join(self.directory, "journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(JournalTestCase, self).tearDown()
+
+    def __graph(self, b_exception=None):
+        a = self._action("a", return_value="A")
+        b = self._action("b", return_value="B", exception=b_exception)
+        c = self._action("c", return_value="C", print_on_stdout="c")
+        a.add_dependency(b)
+        a.add_dependency(c)
+        return (a, b, c)
+
+    def __execute(self, action, **kwds):
+        return execute(action, journal=self.journal, resume_from=self.journal, **kwds)
+
+    def test_missing_journal(self):
+        (a, b, c) = self.__graph()
+        report = self.__execute(a)
+
+        self.assertEqual(report.get_action_status(a).skip_reason, None)
+        self.assertEventsEqual("bc a")
+
+    def test_resume_everything(self):
+        (a, b, c) = self.__graph()
+        self.__execute(a)
+
+        (a, b, c) = self.__graph()
+        hooks = TestHooks()
+        report = self.__execute(a, hooks=hooks)
+
+        self.assertEventsEqual("bc a")
+        for (action, return_value) in ((a, "A"), (b, "B"), (c, "C")):
+            self.assertEqual(report.get_action_status(action).status, SUCCESSFUL)
+            self.assertEqual(report.get_action_status(action).skip_reason, RESUMED)
+            self.assertEqual(report.get_action_status(action).return_value, return_value)
+        self.assertEqual(report.get_action_status(c).output, b"c\n")
+        self.assertIn(("skipped", "a", RESUMED, "A"), hooks.events)
+        self.assertNotIn(("started", "a"), hooks.events)
+
+    def test_resume_after_failure(self):
+        (a, b, c) = self.__graph(b_exception=Exception("b"))
+        self.__execute(a, do_raise=False, keep_going=True)
+        self.assertEventsEqual("bc")
+
+        (a, b, c) = self.__graph()
+        report = self.__execute(a)
+
+        self.assertEventsEqual("bc b a")
+        self.assertEqual(report.get_action_status(c).skip_reason, RESUMED)
+        self.assertIsNone(report.get_action_status(b).skip_reason)
+        self.assertIsNone(report.get_action_status(a).skip_reason)
+
+    def test_separate_journals(self):
+        (a, b, c) = self.__graph(b_exception=Exception("b"))
+        execute(a, journal=self.journal, do_raise=False, keep_going=True)
+
+        second_journal = os.path.join(self.directory, "second")
+        (a, b, c) = self.__graph()
+        execute(a, journal=second_journal, resume_from=self.journal)
+
+        (a, b, c) = self.__graph()
+        report = execute(a, resume_from=second_journal)
+        self.assertEventsEqual("bc b a")
+        self.assertEqual(
+            [report.get_action_status(action).skip_reason for action in (a, b, c)],
+            [RESUMED, RESUMED, RESUMED],
+        )
+
+    def test_truncated_journal(self):
+        (a, b, c) = self.__graph()
+        self.__execute(a)
+        with open(self.journal, "rb") as f:
+            data = f.read()
+        with open(self.journal, "wb") as f:
+            f.write(data[:-10])
+
+        (a, b, c) = self.__graph()
+        report = self.__execute(a)
+
+        self.assertEqual(
+            sorted(report.get_action_status(action).skip_reason is None for action in (a, b, c)),
+            [False, False, True],
+        )
+
+    def test_corrupted_journal(self):
+        (a, b, c) = self.__graph()
+        self.__execute(a)
+        with open(self.journal, "r+b") as f:
+            f.seek(-10, os.SEEK_END)
+            byte = f.read(1)
+            f.seek(-10, os.SEEK_END)
+            f.write(bytes([byte[0] ^ 0xff]))
+
+        (a, b, c) = self.__graph()
+        report = self.__execute(a)
+
+        self.assertEqual(
+            sorted(report.get_action_status(action).skip_reason is None for action in (a, b, c)),
+            [False, False, True],
+        )
+
+    def test_unreadable_record(self):
+        a = self._action("a", return_value=Removed())
+        self.__execute(a)
+
+        a = self._action("a", return_value=None)
+        with unittest.mock.patch.dict(globals()):
+            del globals()["Removed"]
+            report = self.__execute(a)
+
+        self.assertEventsEqual("a a")
+        self.assertIsNone(report.get_action_status(a).skip_reason)
+
+    def test_full_disk(self):
+        (a, b, c) = self.__graph()
+        with unittest.mock.patch.object(
+            ActionTree._JournalWriter, "_JournalWriter__write",
+            side_effect=OSError(errno.ENOSPC, "No space left on device"),
+        ):
+            with unittest.mock.patch("os.fsync", side_effect=OSError(errno.EIO, "Input/output error")):
+                self.__execute(a)
+        self.assertEqual(os.path.getsize(self.journal), 0)
+
+        (a, b, c) = self.__graph()
+        report = self.__execute(a)
+
+        self.assertEventsEqual("bc a bc a")
+        self.assertIsNone(report.get_action_status(a).skip_reason)
+
+    def test_identical_actions(self):
+        a = self._action("a")
+        for return_value in range(3):
+            a.add_dependency(self._action("x", return_value=return_value))
+        self.__execute(a)
+
+        a = self._action("a")
+        xs = [self._action("x", return_value=None) for i in range(3)]
+        for x in xs:
+            a.add_dependency(x)
+        report = self.__execute(a)
+
+        self.assertEqual([report.get_action_status(x).return_value for x in xs], [0, 1, 2])
+
+    def test_different_dependencies(self):
+        (a, b, c) = self.__graph()
+        self.__execute(a)
+
+        (a, b, c) = self.__graph()
+        b.add_dependency(self._action("d"))
+        report = self.__execute(a)
+
+        self.assertEqual(
+            [report.get_action_status(action).skip_reason for action in (a, b, c)],
+            [None, None, RESUMED],
+        )
+
+    def test_resume_twice_after_truncation(self):
+        # The truncated record is overwritten, so the records appended by the second execution are read
+        (a, b, c) = self.__graph()
+        self.__execute(a)
+        with open(self.journal, "rb") as f:
+            data = f.read()
+        with open(self.journal, "wb") as f:
+            f.write(data[:-10])
+        (a, b, c) = self.__graph()
+        self.__execute(a)
+
+        (a, b, c) = self.__graph()
+        report = self.__execute(a)
+
+        self.assertEventsEqual("bc a a")
+        self.assertEqual(
+            [report.get_action_status(action).skip_reason for action in (a, b, c)],
+            [RESUMED, RESUMED, RESUMED],
+        )
+
+    def test_resumed_actions_not_recorded_again(self):
+        (a, b, c) = self.__graph()
+        self.__execute(a)
+        size = os.path.getsize(self.journal)
+
+        (a, b, c) = self.__graph()
+        self.__execute(a)
+
+        self.assertEqual(os.path.getsize(self.journal), size)
+
+    def test_stored_return_value_and_spilled_output(self):
+        a = self._action("a", return_value=b"A" * 1000, print_on_stdout="a" * 1000)
+        execute(a, journal=self.journal, result_store_threshold=100, output_spill_threshold=100)
+
+        second_journal = os.path.join(self.directory, "second")
+        a = self._action("a", return_value=None)
+        execute(a, journal=second_journal, resume_from=self.journal, result_store_threshold=100)
+
+        a = self._action("a", return_value=None)
+        report = execute(a, resume_from=second_journal)
+
+        self.assertEventsEqual("a")
+        self.assertEqual(report.get_action_status(a).skip_reason, RESUMED)
+        self.assertEqual(report.get_action_status(a).return_value, b"A" * 1000)
+        self.assertEqual(report.get_action_status(a).output, b"a" * 1000 + b"\n")
@@ -4,9 +4,11 @@
 
 
 import pickle
+import sys
 import unittest
 
 from ActionTree import *
+from ActionTree.stock import NullAction
 
 
 class Unpicklable(object):
@@ -33,6 +35,17 @@ class UnpicklableException(Action):
         raise Exception(unpicklable)
 
 
+class ExceptionWithArguments(Exception):
+    def __init__(self, a, b):
+        # Picklable, but not unpicklable because pickle calls ExceptionWithArguments(a)
+        super(ExceptionWithArguments, self).__init__(a)
+
+
+class UnunpicklableException(Action):
+    def do_execute(self, dependency_statuses):
+        raise ExceptionWithArguments(1, 2)
+
+
 class PicklabilityTestCase(unittest.TestCase):
     def test_action(self):
         with self.assertRaises(pickle.PicklingError):
@@ -51,3 +64,39 @@ class PicklabilityTestCase(unittest.TestCase):
             # because the *Action* would be unpicklable and we're testing what happens
             # when the *exception* is unpicklable
             execute(UnpicklableException("x"))
+
+    def test_ununpicklable_exception(self):
+        with self.assertRaises(pickle.PicklingError):
+            execute(UnunpicklableException("x"))
+
+    def test_dependency(self):
+        a = NullAction("a")
+        a.add_dependency(UnpicklableAction("x"))
+        with self.assertRaises(pickle.PicklingError) as catcher:
+            execute(a)
+
+        self.assertIn("'x'", str(catcher.exception))
+
+    def test_skip_check(self):
+        # The action is executed inline, so it's never pickled
+        a = NullAction("a")
+        a.attribute = unpicklable
+
+        self.assertTrue(execute(a, check_picklability=False).is_success)
+
+    def test_sample_check(self):
+        a = NullAction("a")
+        for i in range(10):
+            a.add_dependency(NullAction(str(i)))
+        a.attribute = unpicklable
+
+        self.assertTrue(execute(a, check_picklability=0).is_success)
+        with self.assertRaises(pickle.PicklingError):
+            execute(a, check_picklability=11)
+
+    def test_long_chain(self):
+        actions = [NullAction(str(i)) for i in range(2 * sys.getrecursionlimit())]
+        for (dependent, dependency) in zip(actions, actions[1:]):
+            dependent.add_dependency(dependency)
+
+        self.assertTrue(execute(actions[0]).is_success)
@@ -3,6 +3,7 @@
 # Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
 
 
+import sys
 import unittest
 
 from ActionTree import *
@@ -47,3 +48,10 @@ class PreviewTestCase(unittest.TestCase):
         c.add_dependency(d)
 
         self.assertEqual(a.get_possible_execution_order(), [d, b, c, a])
+
+    def test_long_chain(self):
+        actions = [Action(str(i)) for i in range(10 * sys.getrecursionlimit())]
+        for (dependent, dependency) in zip(actions, actions[1:]):
+            dependent.add_dependency(dependency)
+
+        self.assertEqual(actions[0].get_possible_execution_order(), list(reversed(actions)))
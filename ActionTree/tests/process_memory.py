@@ -0,0 +1,64 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import gc
+import unittest
+
+from ActionTree import *
+from ActionTree.stock import NullAction
+from . import *
+
+
+class GetGcState(Action):
+    def do_execute(self, dependency_statuses):
+        return (gc.isenabled(), gc.get_freeze_count() > 0)
+
+
+class ProcessMemoryTestCase(ActionTreeTestCase):
+    @unittest.skipUnless(hasattr(gc, "freeze"), "gc.freeze requires Python 3.7")
+    def test_gc_frozen_in_children(self):
+        a = GetGcState("a")
+
+        self.assertEqual(execute(a).get_action_status(a).return_value, (True, True))
+        self.assertEqual(execute(a, freeze_gc=False).get_action_status(a).return_value, (True, False))
+
+    def test_gc_unfrozen_after_execution(self):
+        execute(self._action("a"))
+
+        self.assertTrue(gc.isenabled())
+        if hasattr(gc, "get_freeze_count"):  # pragma no branch
+            self.assertEqual(gc.get_freeze_count(), 0)
+
+    @unittest.skipUnless(hasattr(gc, "freeze"), "gc.freeze requires Python 3.7")
+    def test_gc_frozen_by_caller(self):
+        gc.freeze()
+        try:
+            frozen = gc.get_freeze_count()
+            execute(self._action("a"))
+
+            # Frozen objects may be freed meanwhile, but execute must not thaw them
+            self.assertGreater(gc.get_freeze_count(), frozen // 2)
+        finally:
+            gc.unfreeze()
+
+    def test_private_memory(self):
+        a = NullAction("a")
+        b = self._action("b")
+        c = self._action("c")
+        a.add_dependency(b)
+        b.add_dependency(c)
+
+        report = execute(a, measure_memory=True)
+
+        self.assertIsNone(report.get_action_status(a).private_memory)
+        self.assertGreater(report.get_action_status(b).private_memory, 0)
+        self.assertGreater(report.get_action_status(c).private_memory, 0)
+
+    def test_private_memory_not_measured(self):
+        a = self._action("a")
+
+        report = execute(a)
+
+        self.assertIsNone(report.get_action_status(a).private_memory)
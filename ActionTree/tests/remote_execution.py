@@ -0,0 +1,322 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import datetime
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ActionTree import *
+from . import *
+from .streaming import Consume, Produce
+
+
+AUTHKEY = b"secret"
+
+GPU = Resource(UNLIMITED)
+
+
+class WhereAndWhen(Action):
+    def __init__(self, label, duration=0, *args, **kwds):
+        super(WhereAndWhen, self).__init__(label, *args, **kwds)
+        self.duration = duration
+
+    def do_execute(self, dependency_statuses):
+        start = datetime.datetime.now()
+        time.sleep(self.duration)
+        print(self.label)
+        return (os.getppid(), start, datetime.datetime.now())
+
+
+class SumOfDependencies(Action):
+    def do_execute(self, dependency_statuses):
+        return sum(status.return_value for status in dependency_statuses.values())
+
+
+class PrintMuch(Action):
+    def __init__(self, label, megabytes):
+        super(PrintMuch, self).__init__(label)
+        self.megabytes = megabytes
+
+    def do_execute(self, dependency_statuses):
+        for i in range(self.megabytes):
+            sys.stdout.write("x" * 2 ** 20)
+
+
+class ReturnMuch(Action):
+    def __init__(self, label, megabytes, duration):
+        super(ReturnMuch, self).__init__(label)
+        self.megabytes = megabytes
+        self.duration = duration
+
+    def do_execute(self, dependency_statuses):
+        time.sleep(self.duration)
+        return b"x" * (self.megabytes * 2 ** 20)
+
+
+class LengthOfDependencies(Action):
+    # The total size of the bytes returned by dependencies
+    def do_execute(self, dependency_statuses):
+        return sum(
+            len(status.return_value) for status in dependency_statuses.values()
+            if isinstance(status.return_value, bytes)
+        )
+
+
+class KillAgentOnce(Action):
+    def __init__(self, label, marker):
+        super(KillAgentOnce, self).__init__(label)
+        self.marker = marker
+
+    def do_execute(self, dependency_statuses):
+        if not os.path.exists(self.marker):  # pragma no cover: this process is orphaned before it saves its coverage
+            open(self.marker, "w").close()
+            os.kill(os.getppid(), signal.SIGKILL)
+            time.sleep(10)
+        return os.getppid()
+
+
+class Started(Hooks):
+    def __init__(self, event):
+        self.event = event
+
+    def action_started(self, time, action):
+        self.event.set()
+
+
+class RemoteExecutionTestCase(ActionTreeTestCase):
+    def setUp(self):
+        super(RemoteExecutionTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.processes = []
+
+    def tearDown(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            process.stdout.close()
+        shutil.rmtree(self.directory)
+        super(RemoteExecutionTestCase, self).tearDown()
+
+    __root_directory = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    def __start_agent(self, cpu_cores=1, resources={}, authkey=AUTHKEY):
+        process = subprocess.Popen(
+            [sys.executable, "-m", "ActionTree.worker", "--listen", "127.0.0.1:0"] +
+            ([] if cpu_cores is None else ["--cpu-cores", str(cpu_cores)]),
+            env=dict(os.environ, ACTIONTREE_AUTHKEY=authkey.decode()),
+            stdout=subprocess.PIPE,
+            cwd=self.__root_directory,
+        )
+        self.processes.append(process)
+        (host, port) = process.stdout.readline().decode().split()[-1].rsplit(":", 1)
+        return (process.pid, RemoteAgent((host, int(port)), AUTHKEY, resources))
+
+    def test_execution(self):
+        (pid, agent) = self.__start_agent()
+        a = SumOfDependencies("a")
+        b = self._action("b", return_value=1, print_on_stdout="b")
+        c = self._action("c", return_value=2)
+        a.add_dependency(b)
+        a.add_dependency(c)
+        report = execute(a, agents=[agent])
+
+        self.assertEqual(report.get_action_status(a).return_value, 3)
+        self.assertEqual(report.get_action_status(b).output, b"b\n")
+        self.assertEventsEqual("bc")
+
+    def test_exception(self):
+        (pid, agent) = self.__start_agent()
+        a = self._action("a", exception=Exception("foo"))
+        report = execute(a, agents=[agent], do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, FAILED)
+        self.assertEqual(report.get_action_status(a).exception.args, ("foo",))
+
+    def test_default_cpu_cores(self):
+        (pid, agent) = self.__start_agent(cpu_cores=None)
+        a = WhereAndWhen("a")
+        report = execute(a, agents=[agent])
+
+        self.assertEqual(report.get_action_status(a).return_value[0], pid)
+
+    def test_missing_authkey(self):
+        env = dict(os.environ)
+        env.pop("ACTIONTREE_AUTHKEY", None)
+        process = subprocess.run(
+            [sys.executable, "-m", "ActionTree.worker", "--listen", "127.0.0.1:0"],
+            env=env, stderr=subprocess.PIPE, cwd=self.__root_directory,
+        )
+
+        self.assertEqual(process.returncode, 2)
+        self.assertIn(b"a secret key is required", process.stderr)
+
+    def test_agent_serves_several_executions(self):
+        (pid, agent) = self.__start_agent()
+        for i in range(2):
+            a = WhereAndWhen("a")
+            report = execute(a, agents=[agent])
+            self.assertEqual(report.get_action_status(a).return_value[0], pid)
+
+    def test_cpu_cores_per_agent(self):
+        agents = [self.__start_agent(cpu_cores=2), self.__start_agent(cpu_cores=1)]
+        a = self._action("a")
+        deps = [WhereAndWhen(str(i), duration=0.3) for i in range(6)]
+        for d in deps:
+            a.add_dependency(d)
+        report = execute(a, agents=[agent for (pid, agent) in agents])
+
+        for ((pid, agent), cpu_cores) in zip(agents, [2, 1]):
+            events = []
+            for d in deps:
+                (agent_pid, start, end) = report.get_action_status(d).return_value
+                if agent_pid == pid:
+                    events += [(start, 1), (end, -1)]
+            self.assertGreater(len(events), 0)
+            concurrency = 0
+            for (t, delta) in sorted(events, key=lambda event: (event[0], event[1])):
+                concurrency += delta
+                self.assertLessEqual(concurrency, cpu_cores)
+
+    def test_node_resources(self):
+        (pid_1, agent_1) = self.__start_agent()
+        (pid_2, agent_2) = self.__start_agent(resources={GPU: 1})
+        a = self._action("a")
+        deps = [WhereAndWhen(str(i), resources_required={GPU: 1}) for i in range(3)]
+        for d in deps:
+            a.add_dependency(d)
+        report = execute(a, agents=[agent_1, agent_2])
+
+        self.assertEqual([report.get_action_status(d).return_value[0] for d in deps], [pid_2] * 3)
+
+    def test_lost_agent(self):
+        (pid_1, agent_1) = self.__start_agent()
+        (pid_2, agent_2) = self.__start_agent()
+        a = KillAgentOnce("a", os.path.join(self.directory, "marker"))
+        report = execute(a, agents=[agent_1, agent_2])
+
+        self.assertIn(report.get_action_status(a).return_value, [pid_1, pid_2])
+        self.assertEqual(len([p for p in self.processes if p.poll() is None]), 1)
+
+    def test_all_agents_lost(self):
+        (pid, agent) = self.__start_agent()
+        a = KillAgentOnce("a", os.path.join(self.directory, "marker"))
+        report = execute(a, agents=[agent], do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, FAILED)
+        self.assertIsInstance(report.get_action_status(a).exception, ConnectionError)
+
+    def test_missing_node_resource(self):
+        (pid, agent) = self.__start_agent()
+        a = WhereAndWhen("a", resources_required={GPU: 1})
+        report = execute(a, agents=[agent, RemoteAgent(("127.0.0.1", 1), AUTHKEY, {GPU: 1})], do_raise=False)
+
+        self.assertIsInstance(report.get_action_status(a).exception, ConnectionError)
+
+    def test_global_resource(self):
+        (pid, agent) = self.__start_agent()
+        resource = Resource(1)
+        a = self._action("a")
+        deps = [WhereAndWhen(str(i), duration=0.2, resources_required={resource: 1}) for i in range(2)]
+        for d in deps:
+            a.add_dependency(d)
+        report = execute(a, agents=[agent])
+
+        (first, second) = sorted(report.get_action_status(d).return_value[1:] for d in deps)
+        self.assertLessEqual(first[1], second[0])
+
+    def test_streams(self):
+        (pid, agent) = self.__start_agent()
+        a = Consume("a")
+        a.add_dependency(Produce("b", 1), stream=True)
+        report = execute(a, agents=[agent], do_raise=False)
+
+        self.assertIsInstance(report.get_action_status(a).exception, ValueError)
+
+    def test_agent_closes_connection(self):
+        listener = multiprocessing.connection.Listener(("127.0.0.1", 0), authkey=AUTHKEY)
+        thread = threading.Thread(target=lambda: listener.accept().close())
+        thread.start()
+        try:
+            with self.assertRaises(ConnectionError):
+                execute(self._action("a"), agents=[RemoteAgent(listener.address, AUTHKEY)])
+        finally:
+            thread.join()
+            listener.close()
+
+    def test_unreachable_agents(self):
+        (pid, agent) = self.__start_agent(authkey=b"other secret")
+        # The agent keeps listening after a failed authentication
+        for i in range(2):
+            with self.assertRaises(ConnectionError):
+                execute(self._action("a"), agents=[agent])
+
+    def test_execution_killed(self):
+        (pid, agent) = self.__start_agent()
+        started = multiprocessing.Event()
+        process = multiprocessing.Process(
+            target=execute, args=(WhereAndWhen("a", duration=10),), kwargs=dict(agents=[agent], hooks=Started(started)),
+        )
+        process.start()
+        self.assertTrue(started.wait(5))
+        process.terminate()
+        process.join()
+
+        # The agent kills the orphaned action, and serves the next execution
+        before = datetime.datetime.now()
+        a = WhereAndWhen("b")
+        report = execute(a, agents=[agent])
+        self.assertEqual(report.get_action_status(a).return_value[0], pid)
+        self.assertLess(datetime.datetime.now() - before, datetime.timedelta(seconds=5))
+
+    def test_timeout(self):
+        (pid, agent) = self.__start_agent()
+        a = WhereAndWhen("a", duration=10, timeout=0.2)
+        report = execute(a, agents=[agent], do_raise=False)
+        b = WhereAndWhen("b")
+        execute(b, agents=[agent])
+
+        status = report.get_action_status(a)
+        self.assertIsInstance(status.exception, TimeoutError)
+        self.assertLess(status.failure_time - status.start_time, datetime.timedelta(seconds=5))
+
+    def test_local_actions(self):
+        (pid, agent) = self.__start_agent()
+        a = self._action("a", execute_in_thread=True)
+        a.add_dependency(WhereAndWhen("b"))
+        report = execute(a, agents=[agent])
+
+        self.assertEqual(report.get_action_status(a.dependencies[0]).return_value[0], pid)
+        self.assertEventsEqual("a")
+
+    def test_large_tasks_while_relaying_output(self):
+        # The tasks sent for b and c are larger than the socket's buffers, and are sent while the agent relays
+        # the output of p: both ends must keep reading while they write
+        (pid, agent) = self.__start_agent(cpu_cores=2)
+        a = self._action("a", execute_in_thread=True)
+        b = LengthOfDependencies("b")
+        c = LengthOfDependencies("c")
+        d = ReturnMuch("d", 64, 0.5)
+        e = ReturnMuch("e", 64, 0.5)
+        p = PrintMuch("p", 256)
+        a.add_dependency(b)
+        a.add_dependency(p)
+        b.add_dependency(c)
+        b.add_dependency(e)
+        c.add_dependency(d)
+        report = execute(a, agents=[agent])
+
+        self.assertEqual(report.get_action_status(b).return_value, 2 ** 26)
+        self.assertEqual(report.get_action_status(c).return_value, 2 ** 26)
+        self.assertEqual(len(report.get_action_status(p).output), 2 ** 28)
+        self.assertEventsEqual("a")
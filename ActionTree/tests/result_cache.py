@@ -0,0 +1,265 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import errno
+import os
+import pickle
+import shutil
+import tempfile
+import unittest.mock
+
+from ActionTree import *
+from . import *
+from .hooks import TestHooks
+
+
+class Fingerprinted(Action):
+    def __init__(self, label, value, executions_file, *args, **kwds):
+        super(Fingerprinted, self).__init__(label, *args, **kwds)
+        self.value = value
+        self.executions_file = executions_file
+
+    def get_fingerprint(self, dependency_fingerprints):
+        return "{} {} {}".format(self.label, self.value, sorted(map(str, dependency_fingerprints.values())))
+
+    def do_execute(self, dependency_statuses):
+        with open(self.executions_file, "a") as f:
+            f.write("{}\n".format(self.label))
+        print(self.label)
+        return self.value + sum(status.return_value for status in dependency_statuses.values())
+
+
+class BytesFingerprinted(Fingerprinted):
+    def get_fingerprint(self, dependency_fingerprints):
+        return super(BytesFingerprinted, self).get_fingerprint(dependency_fingerprints).encode("utf8")
+
+
+class ReturnPickleBuffer(Fingerprinted):
+    def do_execute(self, dependency_statuses):
+        super(ReturnPickleBuffer, self).do_execute(dependency_statuses)
+        return pickle.PickleBuffer(bytearray(b"x" * self.value))
+
+
+class NotFingerprinted(Fingerprinted):
+    def get_fingerprint(self, dependency_fingerprints):
+        return None
+
+
+class DescribeDependency(Action):
+    def do_execute(self, dependency_statuses):
+        (status,) = dependency_statuses.values()
+        return (status.status, status.skip_reason, status.return_value, status.output)
+
+
+class ResultCacheTestCase(ActionTreeTestCase):
+    def setUp(self):
+        super(ResultCacheTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.directory, "cache"))
+        self.executions_file = os.path.join(self.directory, "executions")
+        with open(self.executions_file, "w"):
+            pass
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ResultCacheTestCase, self).tearDown()
+
+    def __action(self, label, value, cls=Fingerprinted, **kwds):
+        return cls(label, value, self.executions_file, **kwds)
+
+    def __executions(self):
+        with open(self.executions_file) as f:
+            executions = f.read().split()
+        with open(self.executions_file, "w"):
+            pass
+        return sorted(executions)
+
+    def test_second_execution_is_cached(self):
+        a = self.__action("a", 1)
+        execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a"])
+
+        hooks = TestHooks()
+        report = execute(a, result_cache=self.cache, hooks=hooks)
+        self.assertEqual(self.__executions(), [])
+        status = report.get_action_status(a)
+        self.assertEqual(status.status, SUCCESSFUL)
+        self.assertEqual(status.skip_reason, CACHED)
+        self.assertIsNone(status.start_time)
+        self.assertIsNotNone(status.success_time)
+        self.assertEqual(status.return_value, 1)
+        self.assertEqual(status.output, b"a\n")
+        self.assertTrue(report.is_success)
+        self.assertEqual(
+            hooks.events,
+            [("pending", "a"), ("ready", "a"), ("skipped", "a", CACHED, 1)],
+        )
+
+    def test_bytes_fingerprint(self):
+        a = self.__action("a", 1, cls=BytesFingerprinted)
+        for i in range(2):
+            execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a"])
+
+    def test_executed_action_is_not_skipped(self):
+        a = self.__action("a", 1)
+        report = execute(a, result_cache=self.cache)
+
+        self.assertIsNone(report.get_action_status(a).skip_reason)
+
+    def test_change_propagates_to_dependents(self):
+        a = self.__action("a", 1)
+        b = self.__action("b", 2)
+        c = self.__action("c", 3)
+        a.add_dependency(b)
+        b.add_dependency(c)
+        execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a", "b", "c"])
+
+        c.value = 4
+        report = execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a", "b", "c"])
+        self.assertEqual(report.get_action_status(a).return_value, 7)
+
+        report = execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), [])
+        self.assertEqual(report.get_action_status(a).return_value, 7)
+
+    def test_only_changed_actions_are_executed(self):
+        a = self.__action("a", 1)
+        b = self.__action("b", 2)
+        c = self.__action("c", 3)
+        a.add_dependency(b)
+        a.add_dependency(c)
+        execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a", "b", "c"])
+
+        b.value = 4
+        report = execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a", "b"])
+        self.assertEqual(report.get_action_status(c).skip_reason, CACHED)
+        self.assertEqual(report.get_action_status(a).return_value, 8)
+
+    def test_not_fingerprinted_action_is_always_executed(self):
+        a = self.__action("a", 1, cls=NotFingerprinted)
+        for i in range(2):
+            execute(a, result_cache=self.cache)
+            self.assertEqual(self.__executions(), ["a"])
+
+    def test_failed_action_is_not_cached(self):
+        a = self.__action("a", None)
+        for i in range(2):
+            execute(a, result_cache=self.cache, do_raise=False)
+            self.assertEqual(self.__executions(), ["a"])
+
+    def test_inline_and_thread_actions(self):
+        a = self.__action("a", 1, execute_in_thread=True)
+        b = self.__action("b", 2)
+        b.execute_inline = True
+        a.add_dependency(b)
+        execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a", "b"])
+
+        report = execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), [])
+        self.assertEqual(report.get_action_status(a).output, b"a\n")
+
+    def test_dependency_statuses(self):
+        b = self.__action("b", 2)
+        execute(b, result_cache=self.cache)
+
+        for worker_pool in (None, WorkerPool()):
+            a = DescribeDependency("a")
+            a.add_dependency(b)
+            report = execute(a, result_cache=self.cache, worker_pool=worker_pool)
+
+            self.assertEqual(report.get_action_status(a).return_value, (SUCCESSFUL, CACHED, 2, b"b\n"))
+
+    def test_max_size(self):
+        def files():
+            return sorted(os.listdir(self.cache.directory))
+
+        actions = [self.__action(str(i), i) for i in range(3)]
+        execute(actions[0], result_cache=self.cache)
+        (size,) = [os.path.getsize(os.path.join(self.cache.directory, f)) for f in files()]
+
+        cache = ResultCache(self.cache.directory, max_size=2 * size)
+        self.assertEqual(cache.max_size, 2 * size)
+        execute(actions[1], result_cache=cache)
+        self.assertEqual(len(files()), 2)
+        # Accessing the first result makes it more recently used than the second
+        execute(actions[0], result_cache=cache)
+        execute(actions[2], result_cache=cache)
+        self.assertEqual(len(files()), 2)
+        self.__executions()
+
+        execute(actions[0], result_cache=cache)
+        self.assertEqual(self.__executions(), [])
+        execute(actions[1], result_cache=cache)
+        self.assertEqual(self.__executions(), ["1"])
+
+    def test_corrupted_cache_file(self):
+        a = self.__action("a", 1)
+        execute(a, result_cache=self.cache)
+        (name,) = os.listdir(self.cache.directory)
+        with open(os.path.join(self.cache.directory, name), "wb") as f:
+            f.write(b"garbage")
+
+        report = execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a", "a"])
+        self.assertIsNone(report.get_action_status(a).skip_reason)
+        report = execute(a, result_cache=self.cache)
+        self.assertEqual(report.get_action_status(a).skip_reason, CACHED)
+
+    def test_other_files_are_ignored(self):
+        # e.g. the temporary file of a result being written by another process
+        os.makedirs(self.cache.directory)
+        with open(os.path.join(self.cache.directory, "ActionTree-cache-x"), "wb") as f:
+            f.write(b"partial")
+        a = self.__action("a", 1)
+        for i in range(2):
+            execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a"])
+        self.assertEqual(len(os.listdir(self.cache.directory)), 2)
+
+    def test_unpicklable_return_value(self):
+        # Stored return values are loaded as memory views, that can't be pickled
+        a = self.__action("a", 1000, cls=ReturnPickleBuffer)
+        for i in range(2):
+            report = execute(a, result_cache=self.cache, result_store_threshold=100)
+            self.assertEqual(report.get_action_status(a).return_value.tobytes(), b"x" * 1000)
+            del report
+        self.assertEqual(self.__executions(), ["a", "a"])
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_full_disk(self):
+        a = self.__action("a", 1)
+        with unittest.mock.patch("os.replace", side_effect=OSError(errno.ENOSPC, "No space left on device")):
+            report = execute(a, result_cache=self.cache)
+        self.assertEqual(report.get_action_status(a).return_value, 1)
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+        execute(a, result_cache=self.cache)
+        self.assertEqual(self.__executions(), ["a", "a"])
+
+    def test_temporary_file_not_created(self):
+        a = self.__action("a", 1)
+        with unittest.mock.patch("tempfile.mkstemp", side_effect=OSError(errno.ENOSPC, "No space left on device")):
+            report = execute(a, result_cache=self.cache)
+        self.assertEqual(report.get_action_status(a).return_value, 1)
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_cache_checked_once_per_action(self):
+        # Actions waiting for a CPU core are popped again when it's released
+        MANY = 10
+        a = self.__action("a", 0)
+        for i in range(MANY):
+            a.add_dependency(self.__action(str(i), i))
+
+        with unittest.mock.patch.object(ResultCache, "_get", autospec=True, side_effect=ResultCache._get) as patched:
+            execute(a, result_cache=self.cache, cpu_cores=1)
+
+        self.assertEqual(patched.call_count, MANY + 1)
+        self.assertEqual(len(self.__executions()), MANY + 1)
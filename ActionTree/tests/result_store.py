@@ -0,0 +1,138 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import gc
+import os
+import pickle
+import tempfile
+import unittest
+import unittest.mock
+
+try:
+    import numpy
+except ImportError:  # pragma no cover: numpy is optional
+    numpy = None
+
+import ActionTree
+from ActionTree import *
+from . import *
+
+
+class ReturnValueOfDependency(Action):
+    def do_execute(self, dependency_statuses):
+        (status,) = dependency_statuses.values()
+        return bytes(status.return_value)
+
+
+class ReturnPickleBuffer(Action):
+    def do_execute(self, dependency_statuses):
+        return pickle.PickleBuffer(bytearray(b"x" * 1000))
+
+
+class ReturnArray(Action):
+    def do_execute(self, dependency_statuses):  # pragma no cover: numpy is optional
+        return numpy.arange(1000)
+
+
+class ResultStoreTestCase(ActionTreeTestCase):
+    def setUp(self):
+        super(ResultStoreTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.rmdir(self.directory)
+        super(ResultStoreTestCase, self).tearDown()
+
+    def __execute(self, action, **kwds):
+        return execute(action, result_store_threshold=100, result_store_directory=self.directory, **kwds)
+
+    def test_small_return_value(self):
+        a = self._action("a", return_value=b"x" * 100)
+        report = self.__execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, b"x" * 100)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_return_value_without_buffer(self):
+        a = self._action("a", return_value="x" * 1000)
+        report = self.__execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, "x" * 1000)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_large_bytes(self):
+        a = self._action("a", return_value=b"x" * 1000)
+        report = self.__execute(a)
+
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertEqual(report.get_action_status(a).return_value, b"x" * 1000)
+        del report
+        gc.collect()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_large_bytearray(self):
+        a = self._action("a", return_value=bytearray(b"x" * 1000))
+        report = self.__execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, bytearray(b"x" * 1000))
+        del report
+        gc.collect()
+
+    def test_pickle_buffer_is_mapped(self):
+        a = ReturnPickleBuffer("a")
+        report = self.__execute(a)
+
+        return_value = report.get_action_status(a).return_value
+        self.assertIsInstance(return_value, memoryview)
+        self.assertTrue(return_value.readonly)
+        self.assertEqual(return_value.tobytes(), b"x" * 1000)
+        del report, return_value
+        gc.collect()
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_array_is_mapped(self):  # pragma no cover: numpy is optional
+        a = ReturnArray("a")
+        report = self.__execute(a)
+
+        return_value = report.get_action_status(a).return_value
+        self.assertFalse(return_value.flags.writeable)
+        self.assertEqual(list(return_value), list(range(1000)))
+        del report, return_value
+        gc.collect()
+
+    def test_hooks_receive_value(self):
+        class TestHooks(Hooks):
+            def action_successful(self, time, action, return_value):
+                self.return_value = return_value
+
+        hooks = TestHooks()
+        self.__execute(self._action("a", return_value=b"x" * 1000), hooks=hooks)
+        gc.collect()
+
+        self.assertEqual(hooks.return_value, b"x" * 1000)
+
+    def test_not_loaded_without_hooks(self):
+        a = self._action("a", return_value=b"x" * 1000)
+        with unittest.mock.patch.object(
+            ActionTree._StoredValue, "load", autospec=True, side_effect=ActionTree._StoredValue.load,
+        ) as patched:
+            for hooks in (None, Hooks()):
+                report = self.__execute(a, hooks=hooks)
+
+        self.assertEqual(patched.call_count, 0)
+        self.assertEqual(report.get_action_status(a).return_value, b"x" * 1000)
+        del report
+        gc.collect()
+
+    def test_dependency_statuses(self):
+        for worker_pool in (None, WorkerPool()):
+            a = ReturnValueOfDependency("a")
+            b = self._action("b", return_value=bytearray(b"x" * 1000))
+            a.add_dependency(b)
+            report = self.__execute(a, worker_pool=worker_pool)
+
+            self.assertEqual(report.get_action_status(a).return_value, b"x" * 1000)
+            del report
+            gc.collect()
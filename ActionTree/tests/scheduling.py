@@ -0,0 +1,177 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import datetime
+import unittest.mock
+
+import ActionTree
+from ActionTree import *
+from . import *
+
+
+class SchedulingTestCase(ActionTreeTestCase):
+    def __make_graph(self, c_exception=None):
+        #     a
+        #    / \
+        #   b   d
+        #   |
+        #   c
+
+        a = self._action("a")
+        b = self._action("b")
+        c = self._action("c", exception=c_exception)
+        d = self._action("d")
+        a.add_dependency(b)
+        a.add_dependency(d)
+        b.add_dependency(c)
+        return (a, b, c, d)
+
+    def test_longest_chain_first(self):
+        (a, b, c, d) = self.__make_graph()
+
+        execute(a, cpu_cores=1)
+
+        self.assertEventsEqual("c bd a")
+
+    def test_duration_estimates(self):
+        (a, b, c, d) = self.__make_graph()
+
+        execute(a, cpu_cores=1, duration_estimates={a: 1, b: 1, c: 1, d: 5})
+
+        self.assertEventsEqual("d c b a")
+
+    def test_missing_duration_estimates(self):
+        (a, b, c, d) = self.__make_graph()
+
+        # b and c are expected to last the average, 3 seconds each
+        execute(a, cpu_cores=1, duration_estimates={a: 1, d: 5})
+
+        self.assertEventsEqual("c d b a")
+
+    def test_duration_estimates_from_report(self):
+        (a, b, c, d) = self.__make_graph()
+        report = execute(a, cpu_cores=1)
+        status = report.get_action_status(d)
+        status._set_start_time(status.success_time - datetime.timedelta(seconds=60))
+
+        execute(a, cpu_cores=1, duration_estimates=report)
+
+        self.assertEventsEqual("c bd a d c b a")
+
+    def test_duration_estimates_from_report_by_label(self):
+        (a, b, c, d) = self.__make_graph()
+        report = execute(a, cpu_cores=1)
+        status = report.get_action_status(d)
+        status._set_start_time(status.success_time - datetime.timedelta(seconds=60))
+        (a, b, c, d) = self.__make_graph()
+
+        execute(a, cpu_cores=1, duration_estimates=report)
+
+        self.assertEventsEqual("c bd a d c b a")
+
+    def test_duration_estimates_from_report_with_canceled_actions(self):
+        # a and b were canceled: they are expected to last the average of c and d
+        (a, b, c, d) = self.__make_graph(c_exception=Exception("c failed"))
+        report = execute(a, cpu_cores=1, keep_going=True, do_raise=False)
+        status = report.get_action_status(d)
+        status._set_start_time(status.success_time - datetime.timedelta(seconds=60))
+        (a, b, c, d) = self.__make_graph()
+
+        execute(a, cpu_cores=1, duration_estimates=report)
+
+        self.assertEventsEqual("c d d c b a")
+
+    def test_blocked_actions_are_not_examined_again_and_again(self):
+        MANY = 20
+        a = self._action("a")
+        for i in range(MANY):
+            a.add_dependency(self._action(str(i)))
+
+        get_blocking_resource = ActionTree._Execute._get_blocking_resource
+        with unittest.mock.patch.object(
+            ActionTree._Execute, "_get_blocking_resource", autospec=True, side_effect=get_blocking_resource,
+        ) as patched:
+            report = execute(a, cpu_cores=1)
+
+        self.assertTrue(report.is_success)
+        # Each action is examined when it becomes ready, and the MANY - 1 actions that wait
+        # are examined twice when a CPU core is released: to wake them up, and to start them
+        self.assertEqual(patched.call_count, (MANY + 1) + 2 * (MANY - 1))
+
+    def test_actions_requiring_several_units_are_not_examined_again_and_again(self):
+        # Releasing 2 units of the resource leaves 1 unit, where no waiting action fits
+        MANY = 20
+        resource = Resource(3)
+        a = self._action("a")
+        for i in range(MANY):
+            b = self._action(str(i))
+            b.require_resource(resource, 2)
+            a.add_dependency(b)
+
+        get_blocking_resource = ActionTree._Execute._get_blocking_resource
+        with unittest.mock.patch.object(
+            ActionTree._Execute, "_get_blocking_resource", autospec=True, side_effect=get_blocking_resource,
+        ) as patched:
+            report = execute(a, cpu_cores=UNLIMITED)
+
+        self.assertTrue(report.is_success)
+        self.assertEqual(patched.call_count, (MANY + 1) + 2 * (MANY - 1))
+
+    def test_waiting_action_requiring_several_resources(self):
+        r = Resource(1)
+        a = self._action("a")
+        b = self._action("b")
+        b.require_resource(r)
+        c = self._action("c")
+        c.require_resource(r)
+        c.require_resource(CPU_CORE, 2)
+        d = self._action("d")
+        a.add_dependency(b)
+        a.add_dependency(c)
+        a.add_dependency(d)
+
+        report = execute(a, cpu_cores=2, duration_estimates={a: 1, b: 3, c: 2, d: 1})
+
+        self.assertTrue(report.is_success)
+        # c waits for r, then for the CPU core used by d
+        self.assertEqual(report.get_action_status(d).start_time, report.get_action_status(b).start_time)
+        self.assertGreater(report.get_action_status(c).start_time, report.get_action_status(b).success_time)
+        self.assertGreater(report.get_action_status(c).start_time, report.get_action_status(d).success_time)
+
+    def test_woken_action_waiting_for_another_resource(self):
+        # c waits for the CPU core used by d, then for r, used by b in a thread
+        r = Resource(1)
+        a = self._action("a")
+        b = self._action("b", print_on_stdout=[("b", 0.5)], execute_in_thread=True)
+        b.require_resource(r)
+        c = self._action("c")
+        c.require_resource(r)
+        d = self._action("d", print_on_stdout=[("d", 0.2)])
+        a.add_dependency(b)
+        a.add_dependency(c)
+        a.add_dependency(d)
+
+        report = execute(a, cpu_cores=1, duration_estimates={a: 1, b: 2, c: 1, d: 3})
+
+        self.assertTrue(report.is_success)
+        self.assertGreater(report.get_action_status(c).start_time, report.get_action_status(d).success_time)
+        self.assertGreater(report.get_action_status(c).start_time, report.get_action_status(b).success_time)
+
+    def test_backfilling(self):
+        a = self._action("a")
+        b = self._action("b", print_on_stdout=[("b", 0.5)])
+        c = self._action("c")
+        c.require_resource(CPU_CORE, 2)
+        d = self._action("d")
+        e = self._action("e")
+        for dependency in (b, c, d, e):
+            a.add_dependency(dependency)
+
+        report = execute(a, cpu_cores=2, duration_estimates={a: 1, b: 3, c: 2, d: 1, e: 4})
+
+        self.assertTrue(report.is_success)
+        # When e ends, d starts beside b although c, with a higher priority, doesn't fit yet
+        self.assertLess(report.get_action_status(d).start_time, report.get_action_status(b).success_time)
+        self.assertGreater(report.get_action_status(c).start_time, report.get_action_status(b).success_time)
@@ -4,6 +4,7 @@
 
 
 from ActionTree import *
+from ActionTree.stock import NullAction
 from . import *
 
 
@@ -142,3 +143,24 @@ class ExecutionTestCase(ActionTreeTestCase):
         report = execute(a, cpu_cores=1)
 
         self.assertTrue(report.is_success)
+
+    def test_duplicate_dependency(self):
+        a = self._action("a")
+        b = self._action("b")
+        a.add_dependency(b)
+        a.add_dependency(b)
+
+        report = execute(a, cpu_cores=1)
+
+        self.assertTrue(report.is_success)
+        self.assertEventsEqual("b a")
+
+    def test_wide_fan_in(self):
+        MANY = 2000
+        a = NullAction("a")
+        for i in range(MANY):
+            a.add_dependency(NullAction(str(i)))
+
+        report = execute(a, cpu_cores=1)
+
+        self.assertTrue(report.is_success)
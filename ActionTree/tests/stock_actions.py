@@ -34,6 +34,10 @@ class CreateDirectoryTestCase(PatchingTestCase):
     def test_pickle(self):
         self.assertIsInstance(pickle.dumps(CreateDirectory("xxx")), bytes)
 
+    def test_paths(self):
+        self.assertEqual(CreateDirectory("xxx").input_paths, [])
+        self.assertEqual(CreateDirectory("xxx").output_paths, ["xxx"])
+
     def test_success(self):
         self.makedirs.expect("xxx")
 
@@ -87,6 +91,11 @@ class CallSubprocessTestCase(PatchingTestCase):
     def test_pickle(self):
         self.assertIsInstance(pickle.dumps(CallSubprocess(["xxx", "yyy"])), bytes)
 
+    def test_paths(self):
+        action = CallSubprocess(["xxx", "yyy"], input_paths=["yyy"], output_paths=["zzz"])
+        self.assertEqual(action.input_paths, ["yyy"])
+        self.assertEqual(action.output_paths, ["zzz"])
+
     def test_simple_call(self):
         CallSubprocess(["xxx"]).do_execute({})
 
@@ -197,6 +206,10 @@ class CopyFileTestCase(PatchingTestCase):
     def test_pickle(self):
         self.assertIsInstance(pickle.dumps(CopyFile("from", "to")), bytes)
 
+    def test_paths(self):
+        self.assertEqual(CopyFile("from", "to").input_paths, ["from"])
+        self.assertEqual(CopyFile("from", "to").output_paths, ["to"])
+
     def test_success(self):
         CopyFile("from", "to").do_execute({})
 
@@ -225,6 +238,10 @@ class TouchFileTestCase(PatchingTestCase):
     def test_pickle(self):
         self.assertIsInstance(pickle.dumps(TouchFile("xxx")), bytes)
 
+    def test_paths(self):
+        self.assertEqual(TouchFile("xxx").input_paths, [])
+        self.assertEqual(TouchFile("xxx").output_paths, ["xxx"])
+
     def test_success(self):
         TouchFile("xxx").do_execute({})
 
@@ -0,0 +1,267 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import time
+
+from ActionTree import *
+from . import *
+from .fork_server import fork_server
+
+
+class Produce(Action):
+    # Yields "count" chunks of "size" bytes, failing before chunk "fail_at", then sleeps "duration" seconds
+    def __init__(self, label, count, size=1, fail_at=None, duration=0, **kwds):
+        super(Produce, self).__init__(label, **kwds)
+        self.count = count
+        self.size = size
+        self.fail_at = fail_at
+        self.duration = duration
+
+    def do_execute(self, dependency_statuses):
+        for i in range(self.count):
+            if i == self.fail_at:
+                raise Exception("Producer failed")
+            yield bytes([i % 256]) * self.size
+        time.sleep(self.duration)
+        return self.count
+
+
+class Consume(Action):
+    # Returns the regular dependencies it sees, and the number of chunks and bytes read from each stream
+    def __init__(self, label, stop_after=None, fail_after=None, **kwds):
+        super(Consume, self).__init__(label, **kwds)
+        self.stop_after = stop_after
+        self.fail_after = fail_after
+
+    def do_execute(self, dependency_statuses):
+        streams = []
+        for producer in self.stream_dependencies:
+            (chunks, size) = (0, 0)
+            for chunk in dependency_statuses.stream(producer):
+                chunks += 1
+                size += len(chunk)
+                if chunks == self.fail_after:
+                    raise Exception("Consumer failed")
+                if chunks == self.stop_after:
+                    break
+            streams.append((producer.label, chunks, size))
+        return (sorted(d.label for d in dependency_statuses), sorted(streams))
+
+
+class StreamingTestCase(ActionTreeTestCase):
+    def test_stream(self):
+        for kwds in ({}, dict(worker_pool=WorkerPool()), dict(fork_server=fork_server)):
+            a = Consume("a")
+            b = Produce("b", 5, size=3)
+            a.add_dependency(b, stream=True)
+            a.add_dependency(self._action("c"))
+            report = execute(a, **kwds)
+
+            self.assertEqual(report.get_action_status(b).return_value, 5)
+            self.assertEqual(report.get_action_status(a).return_value, (["c"], [("b", 5, 15)]))
+            self.assertEqual(a.stream_dependencies, [b])
+            self.assertEqual(len(a.dependencies), 2)
+
+    def test_several_producers(self):
+        a = Consume("a")
+        a.add_dependency(Produce("b", 3), stream=True)
+        a.add_dependency(Produce("c", 200, size=2 ** 16), stream=True)
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, ([], [("b", 3, 3), ("c", 200, 200 * 2 ** 16)]))
+
+    def test_producer_ends_before_consumer_starts(self):
+        # c waits for its other consumer, d, which waits for e: meanwhile b streams to a and ends
+        a = Consume("a")
+        b = Produce("b", 3)
+        c = Produce("c", 3)
+        d = Consume("d")
+        e = self._action("e", print_on_stdout=[("e", 0.5)])
+        x = self._action("x")
+        a.add_dependency(b, stream=True)
+        a.add_dependency(c, stream=True)
+        d.add_dependency(c, stream=True)
+        d.add_dependency(e)
+        x.add_dependency(a)
+        x.add_dependency(d)
+        report = execute(x, cpu_cores=3)
+
+        self.assertEqual(report.get_action_status(a).return_value, ([], [("b", 3, 3), ("c", 3, 3)]))
+        self.assertEqual(report.get_action_status(d).return_value, (["e"], [("c", 3, 3)]))
+        self.assertLess(report.get_action_status(b).success_time, report.get_action_status(a).start_time)
+
+    def test_consumer_starts_with_producer(self):
+        # The stream is much larger than the pipe: it can only complete if the consumer reads concurrently,
+        # although the producer uses the only CPU core
+        a = Consume("a")
+        b = Produce("b", 200, size=2 ** 16)
+        a.add_dependency(b, stream=True)
+        report = execute(a, cpu_cores=1)
+
+        self.assertEqual(report.get_action_status(a).return_value, ([], [("b", 200, 200 * 2 ** 16)]))
+        self.assertLess(report.get_action_status(a).start_time, report.get_action_status(b).success_time)
+
+    def test_producer_waits_for_other_dependencies_of_consumer(self):
+        # c and d depend on the same action: the check for indirect dependencies on b sees it twice
+        a = Consume("a")
+        b = Produce("b", 200, size=2 ** 16)
+        c = self._action("c")
+        d = self._action("d")
+        a.add_dependency(b, stream=True)
+        a.add_dependency(c)
+        a.add_dependency(d)
+        e = self._action("e")
+        c.add_dependency(e)
+        d.add_dependency(e)
+        report = execute(a, cpu_cores=1)
+
+        self.assertTrue(report.is_success)
+        self.assertLessEqual(report.get_action_status(c).success_time, report.get_action_status(b).start_time)
+
+    def test_failed_producer(self):
+        for kwds in ({}, dict(worker_pool=WorkerPool()), dict(fork_server=fork_server)):
+            a = Consume("a")
+            b = Produce("b", 5, fail_at=3)
+            a.add_dependency(b, stream=True)
+            report = execute(a, do_raise=False, **kwds)
+
+            self.assertEqual(report.get_action_status(b).status, FAILED)
+            self.assertEqual(report.get_action_status(a).status, FAILED)
+            self.assertIsInstance(report.get_action_status(a).exception, StreamException)
+
+    def test_consumer_stops_reading(self):
+        for kwds in ({}, dict(worker_pool=WorkerPool()), dict(fork_server=fork_server)):
+            a = Consume("a", stop_after=1)
+            b = Produce("b", 200, size=2 ** 16)
+            a.add_dependency(b, stream=True)
+            report = execute(a, **kwds)
+
+            self.assertEqual(report.get_action_status(a).return_value, ([], [("b", 1, 2 ** 16)]))
+            self.assertEqual(report.get_action_status(b).return_value, 200)
+
+    def test_failed_consumer(self):
+        a = self._action("a")
+        b = Consume("b", fail_after=1)
+        c = Produce("c", 200, size=2 ** 16)
+        a.add_dependency(b)
+        b.add_dependency(c, stream=True)
+        report = execute(a, do_raise=False)
+
+        self.assertEqual(report.get_action_status(b).status, FAILED)
+        self.assertEqual(report.get_action_status(c).status, SUCCESSFUL)
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEventsEqual("")
+
+    def test_canceled_consumer(self):
+        a = Consume("a")
+        b = Produce("b", 200, size=2 ** 16)
+        a.add_dependency(b, stream=True)
+        a.add_dependency(self._action("c", exception=Exception("c failed")))
+        report = execute(a, do_raise=False, keep_going=True, cpu_cores=1)
+
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEqual(report.get_action_status(b).return_value, 200)
+        self.assertLessEqual(report.get_action_status(a).cancel_time, report.get_action_status(b).start_time)
+
+    def test_consumer_stops_reading_after_last_chunk(self):
+        # The end of the stream is sent when the consumer already stopped reading
+        a = Consume("a", stop_after=2)
+        b = Produce("b", 2, duration=0.5)
+        a.add_dependency(b, stream=True)
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, ([], [("b", 2, 2)]))
+        self.assertEqual(report.get_action_status(b).return_value, 2)
+
+    def test_one_of_two_consumers_canceled(self):
+        a = Consume("a")
+        b = Produce("b", 3)
+        c = Consume("c")
+        for consumer in (a, c):
+            consumer.add_dependency(b, stream=True)
+        a.add_dependency(self._action("d", exception=Exception("d failed")))
+        e = self._action("e")
+        e.add_dependency(a)
+        e.add_dependency(c)
+        report = execute(e, do_raise=False, keep_going=True, cpu_cores=1)
+
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEqual(report.get_action_status(c).return_value, ([], [("b", 3, 3)]))
+
+    def test_waiting_producer_canceled(self):
+        # b waits for its consumer to be able to start. When c fails, b is canceled with a,
+        # just after it was queued again to check whether a can start now
+        a = Consume("a")
+        b = Produce("b", 3)
+        c = self._action("c", print_on_stdout=[("c", 0.2)], exception=Exception("c failed"))
+        a.add_dependency(b, stream=True)
+        a.add_dependency(c)
+        report = execute(a, do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEqual(report.get_action_status(b).status, CANCELED)
+        self.assertEventsEqual("c")
+
+    def test_canceled_producer(self):
+        a = Consume("a")
+        b = Produce("b", 3)
+        a.add_dependency(b, stream=True)
+        b.add_dependency(self._action("c", exception=Exception("c failed")))
+        report = execute(a, do_raise=False)
+
+        self.assertEqual(report.get_action_status(b).status, CANCELED)
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+
+    def test_stream_of_canceled_producer(self):
+        for kwds in ({}, dict(worker_pool=WorkerPool())):
+            a = Consume("a", accept_failed_dependencies=True)
+            b = Produce("b", 3)
+            a.add_dependency(b, stream=True)
+            b.add_dependency(self._action("c", exception=Exception("c failed")))
+            report = execute(a, do_raise=False, **kwds)
+
+            self.assertEqual(report.get_action_status(b).status, CANCELED)
+            self.assertIsInstance(report.get_action_status(a).exception, StreamException)
+
+    def test_producer_added_by_expansion(self):
+        a = self._action("a")
+        b = Produce("b", 3)
+        c = Consume("c")
+        d = self._action("d", execute_in_thread=True)
+        c.add_dependency(b, stream=True)
+        d.add_dependency(b)
+        a.add_dependency(d)
+        d.do_execute = lambda dependency_statuses: Expansion([c])
+        report = execute(a, do_raise=False, check_picklability=False)
+
+        self.assertIsInstance(report.get_action_status(d).exception, ValueError)
+
+    def test_generator_without_consumer(self):
+        for (execute_in_thread, inline) in ((False, False), (True, False), (False, True)):
+            a = self._action("a")
+            b = Produce("b", 3, execute_in_thread=execute_in_thread)
+            b.execute_inline = inline
+            a.add_dependency(b)
+            report = execute(a)
+
+            self.assertEqual(report.get_action_status(b).return_value, 3)
+
+    def test_inline_consumer(self):
+        a = Consume("a")
+        a.add_dependency(Produce("b", 3), stream=True)
+        a.execute_inline = True
+        with self.assertRaises(ValueError):
+            execute(a)
+
+    def test_consumer_depending_indirectly_on_producer(self):
+        a = Consume("a")
+        b = Produce("b", 3)
+        c = self._action("c")
+        a.add_dependency(b, stream=True)
+        a.add_dependency(c)
+        c.add_dependency(b)
+        with self.assertRaises(ValueError):
+            execute(a)
+        self.assertEventsEqual("")
@@ -0,0 +1,113 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import os
+import pickle
+import sys
+
+from ActionTree import *
+from . import *
+
+
+class GetPidAction(Action):
+    def do_execute(self, dependency_statuses):
+        return os.getpid()
+
+
+class GetStdoutEncoding(Action):
+    def do_execute(self, dependency_statuses):
+        return sys.stdout.encoding
+
+
+class ReturnUnpicklable(Action):
+    def do_execute(self, dependency_statuses):
+        return lambda: None
+
+
+class ThreadExecutionTestCase(ActionTreeTestCase):
+    def test_executes_in_current_process(self):
+        a = GetPidAction("a", execute_in_thread=True)
+        b = GetPidAction("b")
+        a.add_dependency(b)
+
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, os.getpid())
+        self.assertNotEqual(report.get_action_status(b).return_value, os.getpid())
+
+    def test_resources_required(self):
+        self.assertEqual(self._action("a").resources_required, [(CPU_CORE, 1)])
+        self.assertEqual(self._action("a", execute_in_thread=True).resources_required, [(THREAD_SLOT, 1)])
+
+    def test_failure(self):
+        a = self._action("a", exception=Exception("foo"), execute_in_thread=True)
+
+        report = execute(a, do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, FAILED)
+        self.assertEqual(report.get_action_status(a).exception.args, ("foo",))
+
+    def test_output(self):
+        a = self._action("a", print_on_stdout="on stdout", print_on_stderr="on stderr", execute_in_thread=True)
+
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(a).output, b"on stdout\non stderr\n")
+
+    def test_attributes_of_captured_streams(self):
+        a = GetStdoutEncoding("a", execute_in_thread=True)
+
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(a).return_value, sys.stdout.encoding)
+
+    def test_unpicklable_return_value(self):
+        # The execution fails, after the other threads finish executing their actions
+        a = self._action("a")
+        a.add_dependency(ReturnUnpicklable("b", execute_in_thread=True))
+        a.add_dependency(self._action("c", print_on_stdout=[("c", 0.5)], execute_in_thread=True))
+
+        with self.assertRaises(pickle.PicklingError):
+            execute(a)
+
+        self.assertEventsEqual("c")
+
+    def test_outputs_of_parallel_threads(self):
+        MANY = 5
+        a = self._action("a")
+        x = self._action("x", print_on_stdout=[("x", 0.1)] * MANY, execute_in_thread=True)
+        y = self._action("y", print_on_stdout=[("y", 0.1)] * MANY, execute_in_thread=True)
+        a.add_dependency(x)
+        a.add_dependency(y)
+
+        report = execute(a)
+
+        self.assertEqual(report.get_action_status(x).output, b"x\n" * MANY)
+        self.assertEqual(report.get_action_status(y).output, b"y\n" * MANY)
+
+    def test_thread_slots_are_independent_from_cpu_cores(self):
+        a = self._action("a")
+        barrier = self._barrier(3)
+        b = self._action("b", barrier=barrier, end_event=True, execute_in_thread=True)
+        c = self._action("c", barrier=barrier, end_event=True, execute_in_thread=True)
+        d = self._action("d", barrier=barrier, end_event=True, execute_in_thread=True)
+        a.add_dependency(b)
+        a.add_dependency(c)
+        a.add_dependency(d)
+
+        execute(a, cpu_cores=1, thread_slots=3)
+
+        self.assertEventsEqual("bcd BCD a")
+
+    def test_limited_thread_slots(self):
+        a = self._action("a")
+        b = self._action("b", end_event=True, execute_in_thread=True)
+        c = self._action("c", end_event=True, execute_in_thread=True)
+        a.add_dependency(b)
+        a.add_dependency(c)
+
+        execute(a, cpu_cores=UNLIMITED, thread_slots=1)
+
+        self.assertEventsIn([["b", "B", "c", "C", "a"], ["c", "C", "b", "B", "a"]])
@@ -0,0 +1,255 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import asyncio
+import datetime
+import os
+import subprocess
+import tempfile
+import time
+
+from ActionTree import *
+from . import *
+from .fork_server import fork_server
+
+
+class Sleep(Action):
+    # Sleeps in a subprocess, whose pid is written to "pid_file"
+    def __init__(self, label, duration, pid_file=None, **kwds):
+        super(Sleep, self).__init__(label, **kwds)
+        self.duration = duration
+        self.pid_file = pid_file
+
+    def do_execute(self, dependency_statuses):
+        process = subprocess.Popen(["sleep", str(self.duration)])
+        if self.pid_file is not None:  # pragma no cover: the process is killed before it saves its coverage
+            with open(self.pid_file, "w") as f:
+                f.write(str(process.pid))
+        process.wait()
+
+
+class AsyncSleep(Action):
+    def __init__(self, label, duration, **kwds):
+        super(AsyncSleep, self).__init__(label, **kwds)
+        self.duration = duration
+
+    async def do_execute(self, dependency_statuses):
+        await asyncio.sleep(self.duration)
+
+
+def is_alive(pid):
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+class TimeoutsTestCase(ActionTreeTestCase):
+    def setUp(self):
+        super(TimeoutsTestCase, self).setUp()
+        self.before = datetime.datetime.now()
+
+    def assertFast(self):
+        self.assertLess((datetime.datetime.now() - self.before).total_seconds(), 5)
+
+    def assertTimedOut(self, report, action):
+        status = report.get_action_status(action)
+        self.assertEqual(status.status, FAILED)
+        self.assertIsInstance(status.exception, TimeoutError)
+
+    def test_timeout(self):
+        for kwds in ({}, dict(worker_pool=WorkerPool()), dict(fork_server=fork_server)):
+            a = self._action("a")
+            b = Sleep("b", 10, timeout=0.2)
+            c = self._action("c", print_on_stdout=[("c", 0.5)], timeout=5)
+            a.add_dependency(b)
+            a.add_dependency(c)
+            report = execute(a, do_raise=False, cpu_cores=2, **kwds)
+
+            self.assertTimedOut(report, b)
+            self.assertEqual(report.get_action_status(c).status, SUCCESSFUL)
+            self.assertEqual(report.get_action_status(a).status, CANCELED)
+            self.assertEqual(b.timeout, 0.2)
+        self.assertFast()
+        self.assertEventsEqual("c c c")
+
+    def test_compound_exception(self):
+        a = Sleep("a", 10, timeout=0.2)
+        with self.assertRaises(CompoundException) as catcher:
+            execute(a)
+
+        self.assertIsInstance(catcher.exception.exceptions[0], TimeoutError)
+        self.assertFast()
+
+    def test_subprocesses_are_killed(self):
+        self.assertTrue(is_alive(os.getpid()))
+        for kwds in ({}, dict(worker_pool=WorkerPool()), dict(fork_server=fork_server)):
+            (fd, pid_file) = tempfile.mkstemp()
+            os.close(fd)
+            try:
+                a = Sleep("a", 10, pid_file=pid_file, timeout=0.5)
+                report = execute(a, do_raise=False, **kwds)
+
+                self.assertTimedOut(report, a)
+                with open(pid_file) as f:
+                    pid = int(f.read())
+            finally:
+                os.unlink(pid_file)
+            deadline = time.monotonic() + 5
+            while is_alive(pid) and time.monotonic() < deadline:  # pragma no cover: it's usually reaped already
+                time.sleep(0.1)
+            self.assertFalse(is_alive(pid))
+        self.assertFast()
+
+    def test_restarted_worker(self):
+        worker_pool = WorkerPool()
+        a = self._action("a")
+        b = Sleep("b", 10, timeout=0.2)
+        a.add_dependency(b)
+        report = execute(a, worker_pool=worker_pool, keep_going=True, do_raise=False)
+        execute(self._action("c"), worker_pool=worker_pool)
+
+        self.assertTimedOut(report, b)
+        self.assertEventsEqual("c")
+
+    def test_timeout_in_thread(self):
+        # The thread is abandoned, and its dependent is executed without waiting for it
+        a = self._action("a", accept_failed_dependencies=True)
+        b = Sleep("b", 1, execute_in_thread=True, timeout=0.2)
+        a.add_dependency(b)
+        report = execute(a, do_raise=False)
+
+        self.assertTimedOut(report, b)
+        self.assertLess(
+            report.get_action_status(a).success_time, self.before + datetime.timedelta(seconds=0.9),
+        )
+        self.assertEventsEqual("a")
+
+    def test_thread_ends_after_timeout(self):
+        # b's end is reported while the execution waits for c: it's ignored
+        a = self._action("a", accept_failed_dependencies=True)
+        b = self._action("b", execute_in_thread=True, print_on_stdout=[("b", 0.5)], timeout=0.2)
+        c = self._action("c", execute_in_thread=True, print_on_stdout=[("c", 1)])
+        a.add_dependency(b)
+        a.add_dependency(c)
+        report = execute(a, do_raise=False)
+
+        self.assertTimedOut(report, b)
+        self.assertEqual(report.get_action_status(a).status, SUCCESSFUL)
+        self.assertEventsEqual("bc a")
+
+    def test_action_ends_before_timeout(self):
+        # The timer of b expires while the execution waits for c
+        a = self._action("a")
+        b = self._action("b", timeout=0.2)
+        c = self._action("c", print_on_stdout=[("c", 0.5)])
+        a.add_dependency(b)
+        a.add_dependency(c)
+        report = execute(a, cpu_cores=2)
+
+        self.assertEqual(report.get_action_status(b).status, SUCCESSFUL)
+        self.assertEventsEqual("bc a")
+
+    def test_abandoned_thread_with_one_thread_slot(self):
+        # The abandoned thread doesn't prevent c from executing in time
+        a = self._action("a", accept_failed_dependencies=True)
+        b = Sleep("b", 3, execute_in_thread=True, timeout=0.5)
+        c = self._action(
+            "c", execute_in_thread=True, print_on_stdout=[("c", 0.1)], timeout=2, accept_failed_dependencies=True,
+        )
+        a.add_dependency(c)
+        c.add_dependency(b)
+        report = execute(a, do_raise=False, thread_slots=1)
+
+        self.assertTimedOut(report, b)
+        self.assertEqual(report.get_action_status(c).status, SUCCESSFUL)
+        self.assertFast()
+        self.assertEventsEqual("c a")
+
+    def test_abandoned_thread_after_execution(self):
+        # The abandoned thread reports its end after execute returns: this must not write to file descriptors
+        # reused in the meantime
+        a = self._action("a", execute_in_thread=True, print_on_stdout=[("a", 0.5)], timeout=0.1)
+        report = execute(a, do_raise=False)
+        self.assertTimedOut(report, a)
+
+        files = [tempfile.TemporaryFile() for i in range(10)]
+        try:
+            time.sleep(1)
+            for f in files:
+                f.seek(0)
+                self.assertEqual(f.read(), b"")
+        finally:
+            for f in files:
+                f.close()
+        self.assertEventsEqual("a")
+
+    def test_timeout_of_coroutine(self):
+        a = AsyncSleep("a", 10, timeout=0.2)
+        report = execute(a, do_raise=False)
+
+        self.assertTimedOut(report, a)
+        self.assertFast()
+
+    def test_deadline(self):
+        for deadline in (0.5, datetime.datetime.now() + datetime.timedelta(seconds=0.5)):
+            a = self._action("a")
+            b = Sleep("b", 10)
+            c = self._action("c")
+            d = Sleep("d", 10)
+            a.add_dependency(b)
+            a.add_dependency(c)
+            c.add_dependency(d)
+            report = execute(a, deadline=deadline, do_raise=False, cpu_cores=2)
+
+            self.assertTimedOut(report, b)
+            self.assertTimedOut(report, d)
+            self.assertEqual(report.get_action_status(a).status, CANCELED)
+            self.assertEqual(report.get_action_status(c).status, CANCELED)
+        self.assertFast()
+        self.assertEventsEqual("")
+
+    def test_deadline_cancels_ready_actions(self):
+        # d is on the critical path, so c and e wait for the only CPU core. a accepts that d failed, so only
+        # the deadline cancels a, b, c and e, some of them along with the others, in any order
+        a = self._action("a", accept_failed_dependencies=True)
+        b = self._action("b")
+        c = self._action("c")
+        d = Sleep("d", 10)
+        e = self._action("e")
+        x = self._action("x")
+        y = self._action("y")
+        a.add_dependency(b)
+        a.add_dependency(y)
+        b.add_dependency(c)
+        b.add_dependency(e)
+        y.add_dependency(x)
+        x.add_dependency(d)
+        report = execute(a, deadline=0.2, do_raise=False, cpu_cores=1)
+
+        self.assertTimedOut(report, d)
+        for action in (a, b, c, e, x, y):
+            self.assertEqual(report.get_action_status(action).status, CANCELED)
+        self.assertEventsEqual("")
+
+    def test_deadline_cancels_accepting_dependents(self):
+        a = self._action("a", accept_failed_dependencies=True)
+        a.add_dependency(Sleep("b", 10))
+        report = execute(a, deadline=0.2, do_raise=False)
+
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEventsEqual("")
+
+    def test_deadline_in_execute_async(self):
+        a = AsyncSleep("a", 10)
+        loop = asyncio.new_event_loop()
+        try:
+            report = loop.run_until_complete(execute_async(a, deadline=0.2, do_raise=False))
+        finally:
+            loop.close()
+
+        self.assertTimedOut(report, a)
+        self.assertFast()
@@ -0,0 +1,167 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest.mock
+
+from ActionTree import *
+from ActionTree.stock import *
+from . import *
+from .hooks import TestHooks
+
+
+class UpToDateTestCase(ActionTreeTestCase):
+    def setUp(self):
+        super(UpToDateTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.a = self.__path("a")
+        self.b = self.__path("b")
+        self.c = self.__path("c")
+        with open(self.a, "w") as f:
+            f.write("a")
+        self.__set_age(self.a, 100)
+        self.b_from_a = CopyFile(self.a, self.b)
+        self.c_from_b = CopyFile(self.b, self.c)
+        self.c_from_b.add_dependency(self.b_from_a)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(UpToDateTestCase, self).tearDown()
+
+    def __path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __set_age(self, path, age):
+        t = time.time() - age
+        os.utime(path, (t, t))
+
+    def __skip_reasons(self, report):
+        return [report.get_action_status(action).skip_reason for action in (self.b_from_a, self.c_from_b)]
+
+    def test_not_skipped_by_default(self):
+        execute(self.c_from_b)
+        report = execute(self.c_from_b)
+
+        self.assertEqual(self.__skip_reasons(report), [None, None])
+
+    def test_up_to_date(self):
+        report = execute(self.c_from_b, skip_up_to_date=True)
+        self.assertEqual(self.__skip_reasons(report), [None, None])
+
+        hooks = TestHooks()
+        report = execute(self.c_from_b, skip_up_to_date=True, hooks=hooks)
+        self.assertEqual(self.__skip_reasons(report), [UP_TO_DATE, UP_TO_DATE])
+        self.assertTrue(report.is_success)
+        self.assertIn(("skipped", self.c_from_b.label, UP_TO_DATE, None), hooks.events)
+        self.assertNotIn(("started", self.c_from_b.label), hooks.events)
+
+    def test_missing_output(self):
+        execute(self.c_from_b, skip_up_to_date=True)
+        os.unlink(self.c)
+
+        report = execute(self.c_from_b, skip_up_to_date=True)
+        self.assertEqual(self.__skip_reasons(report), [UP_TO_DATE, None])
+        self.assertTrue(os.path.exists(self.c))
+
+    def test_missing_input(self):
+        os.unlink(self.a)
+
+        report = execute(self.c_from_b, skip_up_to_date=True, do_raise=False)
+        self.assertEqual(report.get_action_status(self.b_from_a).status, FAILED)
+
+    def test_newer_input_propagates(self):
+        execute(self.c_from_b, skip_up_to_date=True)
+        with open(self.a, "w") as f:
+            f.write("A")
+        self.__set_age(self.a, 50)
+        self.__set_age(self.b, 100)
+        self.__set_age(self.c, 100)
+
+        report = execute(self.c_from_b, skip_up_to_date=True)
+        self.assertEqual(self.__skip_reasons(report), [None, None])
+        with open(self.c) as f:
+            self.assertEqual(f.read(), "A")
+
+    def test_each_path_is_stated_once(self):
+        execute(self.c_from_b, skip_up_to_date=True)
+
+        with unittest.mock.patch("os.stat", wraps=os.stat) as stat:
+            execute(self.c_from_b, skip_up_to_date=True)
+        self.assertEqual(sorted(call[0][0] for call in stat.call_args_list), [self.a, self.b, self.c])
+
+    def test_hashes(self):
+        hashes = self.__path("hashes")
+        execute(self.c_from_b, skip_up_to_date=True, up_to_date_hashes=hashes)
+
+        # Same contents, newer input
+        self.__set_age(self.a, 0)
+        self.__set_age(self.b, 100)
+        report = execute(self.c_from_b, skip_up_to_date=True, up_to_date_hashes=hashes)
+        self.assertEqual(self.__skip_reasons(report), [UP_TO_DATE, UP_TO_DATE])
+
+        # Different contents, older input
+        with open(self.a, "w") as f:
+            f.write("A")
+        self.__set_age(self.a, 200)
+        report = execute(self.c_from_b, skip_up_to_date=True, up_to_date_hashes=hashes)
+        self.assertEqual(self.__skip_reasons(report), [None, None])
+        with open(self.c) as f:
+            self.assertEqual(f.read(), "A")
+
+        report = execute(self.c_from_b, skip_up_to_date=True, up_to_date_hashes=hashes)
+        self.assertEqual(self.__skip_reasons(report), [UP_TO_DATE, UP_TO_DATE])
+
+    def test_hashes_without_record(self):
+        execute(self.c_from_b, skip_up_to_date=True)
+
+        report = execute(self.c_from_b, skip_up_to_date=True, up_to_date_hashes=self.__path("hashes"))
+        self.assertEqual(self.__skip_reasons(report), [None, None])
+
+    def test_without_inputs(self):
+        d = self.__path("d")
+        e = os.path.join(d, "e")
+        touch = TouchFile(e)
+        touch.add_dependency(CreateDirectory(d))
+        execute(touch, skip_up_to_date=True)
+        self.__set_age(e, 100)
+
+        report = execute(touch, skip_up_to_date=True)
+        self.assertEqual(report.get_action_status(touch).skip_reason, UP_TO_DATE)
+        self.assertGreater(time.time() - os.path.getmtime(e), 50)
+
+    def test_action_without_outputs(self):
+        a = self._action("a", input_paths=[self.a])
+        for i in range(2):
+            report = execute(a, skip_up_to_date=True)
+            self.assertIsNone(report.get_action_status(a).skip_reason)
+
+    def test_input_removed_after_execution(self):
+        for kwds in ({}, dict(up_to_date_hashes=self.__path("hashes"))):
+            with open(self.a, "w") as f:
+                f.write("a")
+            execute(self.c_from_b, skip_up_to_date=True, **kwds)
+            os.unlink(self.a)
+
+            report = execute(self.c_from_b, skip_up_to_date=True, do_raise=False, **kwds)
+            self.assertEqual(report.get_action_status(self.b_from_a).status, FAILED)
+
+    def test_hashes_of_missing_input(self):
+        hashes = self.__path("hashes")
+        a = self._action("a", input_paths=[self.__path("missing")], output_paths=[self.a])
+        for i in range(2):
+            report = execute(a, skip_up_to_date=True, up_to_date_hashes=hashes)
+            self.assertIsNone(report.get_action_status(a).skip_reason)
+
+    def test_hashes_of_directory(self):
+        hashes = self.__path("hashes")
+        a = self._action("a", input_paths=[self.directory], output_paths=[self.a])
+        report = execute(a, skip_up_to_date=True, up_to_date_hashes=hashes)
+        self.assertIsNone(report.get_action_status(a).skip_reason)
+
+        report = execute(a, skip_up_to_date=True, up_to_date_hashes=hashes)
+        self.assertEqual(report.get_action_status(a).skip_reason, UP_TO_DATE)
@@ -0,0 +1,124 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+
+import os
+
+from ActionTree import *
+from . import *
+
+
+class GetPidAction(Action):
+    def do_execute(self, dependency_statuses):
+        return os.getpid()
+
+
+class ChdirAction(Action):
+    def do_execute(self, dependency_statuses):
+        print(os.getcwd())
+        os.chdir("/")
+
+
+class DescribeDependencies(Action):
+    def do_execute(self, dependency_statuses):
+        assert self not in dependency_statuses
+        assert len(dependency_statuses) == len(self.dependencies)
+        return sorted(
+            (
+                d.label, status.status, status.start_time is not None, status.return_value,
+                str(status.exception), status.output, self.__read_output(status),
+            )
+            for (d, status) in dependency_statuses.items()
+        )
+
+    def __read_output(self, status):
+        with status.open_output() as f:
+            return f.read()
+
+
+class WorkerPoolTestCase(ActionTreeTestCase):
+    def test_simple_execution(self):
+        a = self._action("a", return_value=42, print_on_stdout="printed")
+
+        report = execute(a, worker_pool=WorkerPool())
+
+        self.assertTrue(report.is_success)
+        self.assertEqual(report.get_action_status(a).return_value, 42)
+        self.assertEqual(report.get_action_status(a).output, b"printed\n")
+
+    def test_deep_dependencies(self):
+        a = self._action("a")
+        b = self._action("b")
+        c = self._action("c")
+        a.add_dependency(b)
+        b.add_dependency(c)
+
+        execute(a, cpu_cores=1, worker_pool=WorkerPool())
+
+        self.assertEventsEqual("c b a")
+
+    def test_failure(self):
+        a = self._action("a")
+        b = self._action("b", exception=Exception("foo"), print_on_stdout="printed")
+        a.add_dependency(b)
+
+        report = execute(a, do_raise=False, worker_pool=WorkerPool())
+
+        self.assertEqual(report.get_action_status(a).status, CANCELED)
+        self.assertEqual(report.get_action_status(b).status, FAILED)
+        self.assertEqual(report.get_action_status(b).exception.args, ("foo",))
+        self.assertEqual(report.get_action_status(b).output, b"printed\n")
+
+    def __get_pids(self, worker_pool):
+        a = GetPidAction("a")
+        b = GetPidAction("b")
+        c = GetPidAction("c")
+        a.add_dependency(b)
+        b.add_dependency(c)
+
+        report = execute(a, cpu_cores=1, worker_pool=worker_pool)
+
+        return set(report.get_action_status(x).return_value for x in (a, b, c))
+
+    def test_workers_are_reused(self):
+        pids = self.__get_pids(WorkerPool())
+
+        self.assertEqual(len(pids), 1)
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_max_actions_per_worker(self):
+        worker_pool = WorkerPool(max_actions_per_worker=1)
+
+        self.assertEqual(worker_pool.max_actions_per_worker, 1)
+        self.assertEqual(len(self.__get_pids(worker_pool)), 3)
+
+    def test_max_worker_rss(self):
+        worker_pool = WorkerPool(max_worker_rss=1)
+
+        self.assertEqual(worker_pool.max_worker_rss, 1)
+        self.assertEqual(len(self.__get_pids(worker_pool)), 3)
+
+    def test_working_directory_is_restored(self):
+        a = ChdirAction("a")
+        b = ChdirAction("b")
+        a.add_dependency(b)
+
+        report = execute(a, worker_pool=WorkerPool())
+
+        self.assertEqual(report.get_action_status(a).output, report.get_action_status(b).output)
+
+    def test_dependency_statuses(self):
+        a = DescribeDependencies("a", accept_failed_dependencies=True)
+        a.add_dependency(self._action("b", return_value=42, print_on_stdout="printed"))
+        a.add_dependency(self._action("c", exception=Exception("foo")))
+
+        report = execute(a, worker_pool=WorkerPool(), do_raise=False)
+
+        self.assertEqual(
+            report.get_action_status(a).return_value,
+            [
+                ("b", SUCCESSFUL, True, 42, "None", b"printed\n", b"printed\n"),
+                ("c", FAILED, True, None, "foo", b"", b""),
+            ],
+        )
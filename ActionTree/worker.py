@@ -0,0 +1,167 @@
+# coding: utf8
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Worker agent, to which :func:`.execute` sends actions over the network (see :ref:`remote_execution`).
+
+Start it with ``python -m ActionTree.worker --listen host:port``,
+with the secret key shared with :class:`.RemoteAgent` in the ``ACTIONTREE_AUTHKEY`` environment variable
+or in the ``--authkey`` option.
+The modules defining the actions must be importable by the agent.
+
+An agent serves one execution at a time.
+Each action is executed in a new process, forked from the agent, leading its own process group.
+"""
+
+
+import argparse
+import multiprocessing
+import multiprocessing.connection
+import os
+import selectors
+import sys
+
+from . import (
+    AGENT_CANCEL, AGENT_HELLO, AGENT_START, PRINTED, SERIALIZED_RESULT,
+    _BufferedEventSender, _EventReader, _EventSender, _kill_process_group, _lead_process_group, _out_of_band,
+)
+
+
+def serve(address, authkey, cpu_cores=None):
+    """
+    Accept connections from :func:`.execute` and execute the actions it sends, forever.
+
+    :param tuple(str, int) address: the host and port to listen on. Port 0 chooses a free port.
+    :param bytes authkey: the secret key shared with :class:`.RemoteAgent`.
+    :param cpu_cores: the number of CPU cores reported to :func:`.execute`.
+        Pass ``None`` (the default value) to report the number of CPU cores of this machine.
+    :type cpu_cores: int or None
+    """
+    if cpu_cores is None:
+        cpu_cores = multiprocessing.cpu_count()
+    listener = multiprocessing.connection.Listener(address, authkey=authkey)
+    print("Listening on {}:{}".format(*listener.address))
+    sys.stdout.flush()
+    while True:
+        try:
+            connection = listener.accept()
+        except (OSError, EOFError, multiprocessing.AuthenticationError):
+            continue
+        fd = os.dup(connection.fileno())
+        connection.close()
+        try:
+            _serve_execution(fd, cpu_cores)
+        finally:
+            os.close(fd)
+
+
+def _serve_execution(fd, cpu_cores):
+    _EventSender(fd).send((AGENT_HELLO, None, (cpu_cores,)))
+    # Events are relayed to the process calling execute while it sends tasks: see _BufferedEventSender
+    os.set_blocking(fd, False)
+    sender = _BufferedEventSender(fd)
+    writing = False
+    reader = _EventReader(fd)
+    # Action id: process executing it
+    processes = {}
+    # Action ids of the processes that sent their end event: they are only exiting
+    ended = set()
+    selector = selectors.DefaultSelector()
+    selector.register(fd, selectors.EVENT_READ, (None, reader))
+    context = multiprocessing.get_context("fork")
+    try:
+        while True:
+            for (key, mask) in selector.select():
+                (action_id, key_reader) = key.data
+                if mask & selectors.EVENT_WRITE:
+                    try:
+                        sender.write()
+                    except OSError:  # pragma no cover: the connection is broken while writing
+                        # The process calling execute is gone
+                        return
+                if not mask & selectors.EVENT_READ:
+                    continue
+                events = []
+                try:
+                    alive = key_reader.read(events)
+                except BlockingIOError:  # pragma no cover: spurious wake up
+                    alive = True
+                except OSError:  # pragma no cover: the connection is reset
+                    alive = False
+                if action_id is None:
+                    for (event_kind, event_action_id, event_payload) in events:
+                        if event_kind == AGENT_CANCEL:
+                            # The process is joined, and its events discarded by execute, when its pipe is closed
+                            if event_action_id in processes:  # pragma no branch
+                                _kill_process_group(processes[event_action_id])
+                            continue
+                        assert event_kind == AGENT_START
+                        (pipe_r, pipe_w) = os.pipe()
+                        process = context.Process(
+                            target=_run_task,
+                            kwargs=dict(task=event_payload, events=_EventSender(pipe_w), connection_fd=fd),
+                        )
+                        process.start()
+                        _lead_process_group(process.pid)
+                        os.close(pipe_w)
+                        processes[event_action_id] = process
+                        selector.register(pipe_r, selectors.EVENT_READ, (event_action_id, _EventReader(pipe_r)))
+                    if not alive:
+                        # The process calling execute is gone: its actions are useless
+                        return
+                else:
+                    for (event_kind, event_action_id, event_payload) in events:
+                        if event_kind != PRINTED:
+                            ended.add(event_action_id)
+                        if event_kind == SERIALIZED_RESULT:
+                            # Buffers are sent again as-is
+                            (end_time, buffers, private_memory) = event_payload
+                            event_payload = (end_time, [_out_of_band(b) for b in buffers], private_memory)
+                        try:
+                            sender.send((event_kind, event_action_id, event_payload))
+                        except OSError:  # pragma no cover: the connection is broken while writing
+                            return
+                    if not alive:
+                        selector.unregister(key.fd)
+                        os.close(key.fd)
+                        processes.pop(action_id).join()
+                        ended.discard(action_id)
+            if bool(sender.parts) != writing:
+                writing = bool(sender.parts)
+                selector.modify(fd, selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0), (None, reader))
+    finally:
+        for (action_id, process) in processes.items():
+            if action_id in ended:
+                process.join()
+            else:
+                _kill_process_group(process)
+        for key in list(selector.get_map().values()):
+            if key.fd != fd:
+                os.close(key.fd)
+        selector.close()
+
+
+def _run_task(task, events, connection_fd):
+    _lead_process_group(0)
+    # Only the agent talks to the process calling execute
+    os.close(connection_fd)
+    task.run(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m ActionTree.worker", description=__doc__)
+    parser.add_argument("--listen", required=True, metavar="HOST:PORT")
+    parser.add_argument("--authkey", help="defaults to the ACTIONTREE_AUTHKEY environment variable")
+    parser.add_argument("--cpu-cores", type=int, help="defaults to the number of CPU cores of this machine")
+    args = parser.parse_args()
+
+    authkey = args.authkey or os.environ.get("ACTIONTREE_AUTHKEY")
+    if not authkey:
+        parser.error("a secret key is required, in --authkey or in the ACTIONTREE_AUTHKEY environment variable")
+    (host, port) = args.listen.rsplit(":", 1)
+    serve((host, int(port)), authkey.encode("utf8"), args.cpu_cores)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Measure the number of events per second the parent process receives from many chatty child processes,
+through a single multiprocessing.Queue (the transport used before)
+and through one pipe per child multiplexed with a selector (the transport used now).
+
+Also measure the throughput of a complete execution of actions printing many small lines
+(for this one, "events" are lines, several of which may be read by ActionTree as a single PRINTED event).
+"""
+
+import argparse
+import datetime
+import multiprocessing
+
+import ActionTree
+from ActionTree import Action, execute
+from ActionTree.stock import NullAction
+
+
+def produce_to_queue(queue, count):
+    for i in range(count):
+        queue.put((ActionTree.PRINTED, 0, (datetime.datetime.now(), b"x" * 40)))
+
+
+def through_queue(processes, count):
+    queue = multiprocessing.Queue()
+    children = [multiprocessing.Process(target=produce_to_queue, args=(queue, count)) for i in range(processes)]
+    for child in children:
+        child.start()
+    for i in range(processes * count):
+        queue.get()
+    for child in children:
+        child.join()
+
+
+def produce_to_pipe(connection, count):
+    for i in range(count):
+        connection.send((ActionTree.PRINTED, 0, (datetime.datetime.now(), b"x" * 40)))
+
+
+def through_pipes(processes, count):
+    events = ActionTree._Events()
+    children = []
+    for i in range(processes):
+        connection = events.make_pipe()
+        child = multiprocessing.Process(target=produce_to_pipe, args=(connection, count))
+        child.start()
+        connection.close()
+        children.append(child)
+    received = 0
+    while received < processes * count:
+        received += len(events.get())
+    for child in children:
+        child.join()
+    events.close()
+
+
+class Chatty(Action):
+    def __init__(self, label, count):
+        super(Chatty, self).__init__(label)
+        self.__count = count
+
+    def do_execute(self, dependency_statuses):
+        for i in range(self.__count):
+            print("x" * 40, flush=True)
+
+
+def through_execute(processes, count):
+    root = NullAction("root")
+    for i in range(processes):
+        root.add_dependency(Chatty(str(i), count))
+    execute(root, cpu_cores=processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--events", type=int, default=20000, help="events sent by each process")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for transport in (through_queue, through_pipes, through_execute):
+        durations = []
+        for i in range(args.repeat):
+            before = datetime.datetime.now()
+            transport(args.processes, args.events)
+            durations.append((datetime.datetime.now() - before).total_seconds())
+        print("{:16} {:10.0f} events/s (best of {})".format(
+            transport.__name__, args.processes * args.events / min(durations), args.repeat,
+        ))
+
+
+if __name__ == "__main__":
+    main()
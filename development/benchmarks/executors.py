@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Measure the duration of the same dependency graph (layers of short actions, each depending on all actions
+of the previous layer) executed by each executor.
+
+Other executors are given as "module:name", where name is an Executor subclass or a function returning an executor.
+"""
+
+import argparse
+import datetime
+import importlib
+
+from ActionTree import execute, Action, ForkExecutor, ForkServer, WorkerPool
+from ActionTree.stock import NullAction
+
+
+class Sum(Action):
+    def do_execute(self, dependency_statuses):
+        return sum(status.return_value for status in dependency_statuses.values()) + 1
+
+
+def make_graph(layers, width):
+    root = NullAction("root")
+    previous = []
+    for i in range(layers):
+        layer = [Sum("{}-{}".format(i, j)) for j in range(width)]
+        for action in layer:
+            for dependency in previous:
+                action.add_dependency(dependency)
+        previous = layer
+    for action in previous:
+        root.add_dependency(action)
+    return root
+
+
+def load(name):
+    (module_name, attribute) = name.split(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--layers", type=int, default=20)
+    parser.add_argument("--width", type=int, default=20)
+    parser.add_argument("--cpu-cores", type=int)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--executor", action="append", default=[], metavar="MODULE:NAME")
+    args = parser.parse_args()
+
+    root = make_graph(args.layers, args.width)
+    actions = args.layers * args.width
+
+    fork_server = ForkServer()
+    fork_server.start()
+    executors = [("fork", ForkExecutor), ("worker pool", WorkerPool), ("fork server", lambda: fork_server)]
+    executors += [(name, load(name)) for name in args.executor]
+
+    for (name, make_executor) in executors:
+        durations = []
+        for i in range(args.repeat):
+            before = datetime.datetime.now()
+            report = execute(root, cpu_cores=args.cpu_cores, executor=make_executor())
+            durations.append((datetime.datetime.now() - before).total_seconds())
+            assert report.is_success
+        print("{:20} {:7.3f}s, {:6.3f}ms per action (best of {})".format(
+            name, min(durations), 1000 * min(durations) / actions, args.repeat,
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Measure the start latency of actions (from the time ActionTree starts them to the beginning of their do_execute)
+when they are forked from a parent process holding a large heap, or from a fork server.
+"""
+
+import argparse
+import datetime
+
+from ActionTree import execute, Action, ForkServer
+
+
+class Now(Action):
+    def do_execute(self, dependency_statuses):
+        return datetime.datetime.now()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--heap-sizes", type=int, nargs="+", default=[100, 4000], help="in MB")
+    parser.add_argument("--actions", type=int, default=50)
+    args = parser.parse_args()
+
+    fork_server = ForkServer()
+    fork_server.start()
+
+    for heap_size in args.heap_sizes:
+        # Many objects, like in a real application, not just a few large buffers
+        heap = [bytes(1024) for i in range(heap_size * 1024)]
+
+        root = Now("root")
+        previous = root
+        for i in range(args.actions):
+            action = Now(str(i))
+            previous.add_dependency(action)
+            previous = action
+
+        for (name, kwds) in (("fork", {}), ("fork server", dict(fork_server=fork_server))):
+            report = execute(root, cpu_cores=1, **kwds)
+            latencies = sorted(
+                (status.return_value - status.start_time).total_seconds()
+                for (action, status) in report.get_actions_and_statuses()
+            )
+            print("heap {:5}MB {:11} start latency: median {:.1f}ms, max {:.1f}ms".format(
+                heap_size, name, 1000 * latencies[len(latencies) // 2], 1000 * latencies[-1],
+            ))
+
+        del heap
+
+
+if __name__ == "__main__":
+    main()
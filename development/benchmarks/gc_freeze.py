@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Measure the private memory of processes executing actions forked from a parent process holding many objects,
+with and without freezing the garbage collector before forking.
+
+Each action triggers a full garbage collection, like an action allocating many objects would eventually do.
+Without freezing, this collection touches the GC headers of all objects inherited from the parent process,
+so their memory pages are copied.
+"""
+
+import argparse
+import gc
+
+from ActionTree import execute, Action
+from ActionTree.stock import NullAction
+
+
+class CollectGarbage(Action):
+    def do_execute(self, dependency_statuses):
+        gc.collect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objects", type=int, default=2000000, help="number of objects in the parent process")
+    parser.add_argument("--actions", type=int, default=8)
+    args = parser.parse_args()
+
+    heap = [[i] for i in range(args.objects)]
+
+    root = NullAction("root")
+    for i in range(args.actions):
+        root.add_dependency(CollectGarbage(str(i)))
+
+    for freeze_gc in (False, True):
+        report = execute(root, cpu_cores=args.actions, freeze_gc=freeze_gc, measure_memory=True)
+        memories = [
+            status.private_memory
+            for (action, status) in report.get_actions_and_statuses()
+            if status.private_memory is not None
+        ]
+        print("freeze_gc={!s:5}: {:.1f}MB of private memory per action, {:.1f}MB in total".format(
+            freeze_gc, sum(memories) / len(memories) / 2**20, sum(memories) / 2**20,
+        ))
+
+    del heap
+
+
+if __name__ == "__main__":
+    main()
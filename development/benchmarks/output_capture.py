@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Measure the per-action overhead of each output capture mode,
+with actions that print nothing, executed in a process each or in a worker pool.
+"""
+
+import argparse
+import datetime
+
+from ActionTree import execute, Action, WorkerPool, CAPTURE, INHERIT, DISCARD
+from ActionTree.stock import NullAction
+
+
+class Nothing(Action):
+    def do_execute(self, dependency_statuses):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--actions", type=int, default=1000)
+    parser.add_argument("--cpu-cores", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    root = NullAction("root")
+    for i in range(args.actions):
+        root.add_dependency(Nothing(str(i)))
+
+    for (launch, make_worker_pool) in (("process", lambda: None), ("worker pool", WorkerPool)):
+        for output_capture in (CAPTURE, INHERIT, DISCARD):
+            durations = []
+            for i in range(args.repeat):
+                before = datetime.datetime.now()
+                execute(
+                    root, cpu_cores=args.cpu_cores, worker_pool=make_worker_pool(), output_capture=output_capture,
+                )
+                durations.append((datetime.datetime.now() - before).total_seconds())
+            print("{:12} {:8} {:7.3f}ms per action (best of {})".format(
+                launch, output_capture, 1000 * min(durations) / args.actions, args.repeat,
+            ))
+
+
+if __name__ == "__main__":
+    main()
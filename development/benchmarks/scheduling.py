@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Copyright 2017-2018 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Compare the makespan of executions of synthetic graphs with different scheduling priorities.
+
+"random" emulates the scheduling used before critical path scheduling (ready actions in hash order)
+by replacing priorities by random numbers,
+"unit" is critical path scheduling with default estimates,
+and "exact" is critical path scheduling with the actual durations as estimates.
+"""
+
+import argparse
+import datetime
+import random
+import unittest.mock
+
+import ActionTree
+from ActionTree import execute
+from ActionTree.stock import NullAction, Sleep
+
+
+def wide_graph_with_long_chain(scale):
+    durations = {}
+    root = NullAction("root")
+    previous = root
+    for i in range(20):
+        action = Sleep(scale, label="chain {}".format(i))
+        durations[action] = scale
+        previous.add_dependency(action)
+        previous = action
+    for i in range(60):
+        action = Sleep(scale, label="wide {}".format(i))
+        durations[action] = scale
+        root.add_dependency(action)
+    return (root, durations)
+
+
+def random_graph(scale):
+    durations = {}
+    root = NullAction("root")
+    actions = []
+    for i in range(60):
+        duration = random.choice([1, 2, 5]) * scale / 2
+        action = Sleep(duration, label="action {}".format(i))
+        durations[action] = duration
+        for dependency in random.sample(actions, min(len(actions), random.randint(0, 3))):
+            action.add_dependency(dependency)
+        actions.append(action)
+    for action in actions:
+        root.add_dependency(action)
+    return (root, durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cpu-cores", type=int, default=4)
+    parser.add_argument("--scale", type=float, default=0.1, help="duration of a typical action, in seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for make_graph in (wide_graph_with_long_chain, random_graph):
+        (root, exact) = make_graph(args.scale)
+        for (name, priorities, estimates) in (
+            ("random", lambda self, actions: {action: random.random() for action in actions}, None),
+            ("unit", ActionTree._Execute._compute_priorities, None),
+            ("exact", ActionTree._Execute._compute_priorities, exact),
+        ):
+            makespans = []
+            for i in range(args.repeat):
+                with unittest.mock.patch.object(ActionTree._Execute, "_compute_priorities", priorities):
+                    before = datetime.datetime.now()
+                    execute(root, cpu_cores=args.cpu_cores, duration_estimates=estimates)
+                    makespans.append((datetime.datetime.now() - before).total_seconds())
+            print("{:28} {:7} makespan: {:.2f}s (best of {})".format(
+                make_graph.__name__, name, min(makespans), args.repeat,
+            ))
+
+
+if __name__ == "__main__":
+    main()